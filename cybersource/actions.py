@@ -1,13 +1,25 @@
 from __future__ import annotations
 
-from collections.abc import Mapping
+from collections.abc import Iterator, Mapping, Sequence
+from concurrent.futures import Future
+from contextlib import contextmanager
 from decimal import Decimal
-from typing import TYPE_CHECKING, Any, TypedDict
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    ClassVar,
+    NamedTuple,
+    NotRequired,
+    Self,
+    TypedDict,
+    TypeGuard,
+)
 import logging
-import random
 import re
 import time
+import uuid
 
+from asgiref.sync import sync_to_async
 from django.db.models import F
 from django.http import HttpRequest
 from django.utils import timezone
@@ -22,8 +34,21 @@ import dateutil.parser
 from . import models, signature
 from .conf import settings
 from .constants import PRECISION, Decision
-from .cybersoap import CyberSourceSoap, SoapResponse
+from .cybersoap import (
+    AsyncCyberSourceSoap,
+    CyberSourceSoap,
+    SoapRequest,
+    SoapResponse,
+    get_async_client,
+    get_client,
+)
 from .models import CyberSourceReply, PaymentToken
+from .snapshot import (
+    get_order_snapshot,
+    order_snapshot_cache,
+    prefetch_order_snapshots,
+)
+from .transport import get_executor
 from .utils import encrypt_session_id
 
 _Transaction = get_model("payment", "Transaction")
@@ -38,14 +63,33 @@ else:
 logger = logging.getLogger(__name__)
 
 
+class FieldLayout(NamedTuple):
+    """
+    The static form fields of a :class:`SecureAcceptanceAction` class, in a
+    fixed (sorted) order.
+    """
+
+    signed: tuple[str, ...]
+    unsigned: tuple[str, ...]
+    signed_lookup: frozenset[str]
+
+
 class SecureAcceptanceAction:
     currency: str = settings.DEFAULT_CURRENCY
     date_format: str = settings.DATE_FORMAT
     locale: str = settings.LOCALE
     transaction_type: str = ""
 
-    def __init__(self, server_hostname: str) -> None:
-        self.profile = models.SecureAcceptanceProfile.get_profile(server_hostname)
+    _field_layouts: ClassVar[dict[type[SecureAcceptanceAction], FieldLayout]] = {}
+
+    def __init__(
+        self,
+        server_hostname: str,
+        profile: models.SecureAcceptanceProfile | None = None,
+    ) -> None:
+        if profile is None:
+            profile = models.SecureAcceptanceProfile.get_profile(server_hostname)
+        self.profile = profile
 
     @property
     def signed_field_names(self) -> set[str]:
@@ -64,29 +108,52 @@ class SecureAcceptanceAction:
     def unsigned_field_names(self) -> set[str]:
         return set()
 
+    @property
+    def field_layout(self) -> FieldLayout:
+        """
+        The layout built from :attr:`signed_field_names` and
+        :attr:`unsigned_field_names`. Those are expected to be the same for
+        every instance of a class, so the layout is only built once per class.
+        Fields which vary per request (like line items) are appended after the
+        static fields by :meth:`fields`.
+        """
+        cls = type(self)
+        layout = SecureAcceptanceAction._field_layouts.get(cls)
+        if layout is None:
+            signed = frozenset(self.signed_field_names)
+            layout = FieldLayout(
+                signed=tuple(sorted(signed)),
+                unsigned=tuple(sorted(self.unsigned_field_names - signed)),
+                signed_lookup=signed,
+            )
+            SecureAcceptanceAction._field_layouts[cls] = layout
+        return layout
+
     def fields(self) -> dict[str, str]:
-        names = self.signed_field_names | self.unsigned_field_names
-        fields = dict.fromkeys(names, "")
+        layout = self.field_layout
+        fields = dict.fromkeys(layout.signed + layout.unsigned, "")
 
-        data, signed_fields = self.build_request_data()
+        with order_snapshot_cache():
+            data, signed_fields = self.build_request_data()
         fields.update(data)
 
-        signed_fields = signed_fields | {
-            "signed_date_time",
-            "signed_field_names",
-            "unsigned_field_names",
-        }
-        unsigned_fields = set(fields.keys()) - signed_fields
+        signed_lookup = layout.signed_lookup.union(signed_fields)
+        unsigned_fields = [name for name in fields if name not in signed_lookup]
         fields["signed_date_time"] = timezone.now().strftime(self.date_format)
         fields["signed_field_names"] = ",".join(signed_fields)
         fields["unsigned_field_names"] = ",".join(unsigned_fields)
 
-        signer = signature.SecureAcceptanceSigner(self.profile.secret_key)
+        signer = signature.get_signer(self.profile.secret_key)
         return fields | {
             "signature": signer.sign(fields, signed_fields).decode(),
         }
 
-    def build_request_data(self) -> tuple[dict[str, str], set[str]]:
+    def build_request_data(self) -> tuple[dict[str, str], tuple[str, ...]]:
+        """
+        Build the request data, and the ordered names of the signed fields:
+        the static signed fields from :attr:`field_layout`, followed by any
+        other fields returned by :meth:`build_signed_data`.
+        """
         data = {
             "access_key": self.profile.access_key,
             "currency": self.currency,
@@ -97,7 +164,10 @@ class SecureAcceptanceAction:
         }
 
         data.update(self.build_signed_data())
-        signed_fields = self.signed_field_names | set(data.keys())
+        layout = self.field_layout
+        signed_fields = layout.signed + tuple(
+            name for name in data if name not in layout.signed_lookup
+        )
         data.update(self.build_unsigned_data())
         return data, signed_fields
 
@@ -108,7 +178,7 @@ class SecureAcceptanceAction:
         return {}
 
     def generate_uuid(self) -> str:
-        return f"{int(time.time())}{random.randrange(0, 100)}"
+        return uuid.uuid4().hex
 
 
 class SecureAcceptanceShippingAddressMixin:
@@ -130,27 +200,26 @@ class SecureAcceptanceShippingAddressMixin:
         return set()
 
     def _get_shipping_data(self, order: Order) -> dict[str, str]:
-        order_shipping_code = str(order.shipping_code)
+        snapshot = get_order_snapshot(order)
         cs_shipping_code = settings.SHIPPING_METHOD_MAPPING.get(
-            order_shipping_code, settings.SHIPPING_METHOD_DEFAULT
+            snapshot.shipping_code, settings.SHIPPING_METHOD_DEFAULT
         )
         shipping_data = {"shipping_method": cs_shipping_code}
 
-        if order.shipping_address:
-            shipping_data["ship_to_forename"] = order.shipping_address.first_name
-            shipping_data["ship_to_surname"] = order.shipping_address.last_name
-            shipping_data["ship_to_address_line1"] = order.shipping_address.line1
-            shipping_data["ship_to_address_line2"] = order.shipping_address.line2
-            shipping_data["ship_to_address_city"] = order.shipping_address.line4
-            shipping_data["ship_to_address_state"] = order.shipping_address.state
-            shipping_data["ship_to_address_postal_code"] = (
-                order.shipping_address.postcode
-            )
-            shipping_data["ship_to_address_country"] = (
-                order.shipping_address.country.code
-            )
-            shipping_data["ship_to_phone"] = re.sub(
-                "[^0-9]", "", order.shipping_address.phone_number.as_rfc3966
+        address = snapshot.shipping_address
+        if address:
+            shipping_data["ship_to_forename"] = address.first_name
+            shipping_data["ship_to_surname"] = address.last_name
+            shipping_data["ship_to_address_line1"] = address.line1
+            shipping_data["ship_to_address_line2"] = address.line2
+            shipping_data["ship_to_address_city"] = address.line4
+            shipping_data["ship_to_address_state"] = address.state
+            shipping_data["ship_to_address_postal_code"] = address.postcode
+            shipping_data["ship_to_address_country"] = address.country_code
+            shipping_data["ship_to_phone"] = (
+                re.sub("[^0-9]", "", address.phone_number.as_rfc3966)
+                if address.phone_number is not None
+                else ""
             )
 
         return shipping_data
@@ -177,18 +246,20 @@ class SecureAcceptanceBillingAddressMixin:
         }
 
     def _get_billing_data(self, order: Order) -> dict[str, str]:
+        snapshot = get_order_snapshot(order)
         data = {
-            "bill_to_email": order.email,
+            "bill_to_email": snapshot.email,
         }
-        if order.billing_address:
-            data["bill_to_forename"] = order.billing_address.first_name
-            data["bill_to_surname"] = order.billing_address.last_name
-            data["bill_to_address_line1"] = order.billing_address.line1
-            data["bill_to_address_line2"] = order.billing_address.line2
-            data["bill_to_address_city"] = order.billing_address.line4
-            data["bill_to_address_state"] = order.billing_address.state
-            data["bill_to_address_postal_code"] = order.billing_address.postcode
-            data["bill_to_address_country"] = order.billing_address.country.code
+        address = snapshot.billing_address
+        if address:
+            data["bill_to_forename"] = address.first_name
+            data["bill_to_surname"] = address.last_name
+            data["bill_to_address_line1"] = address.line1
+            data["bill_to_address_line2"] = address.line2
+            data["bill_to_address_city"] = address.line4
+            data["bill_to_address_state"] = address.state
+            data["bill_to_address_postal_code"] = address.postcode
+            data["bill_to_address_country"] = address.country_code
         return data
 
 
@@ -214,6 +285,7 @@ class SecureAcceptanceOrderAction(
         customer_ip_address: str | None = None,
         fingerprint_session_id: str | None = None,
         extra_fields: Mapping[str, str] | None = None,
+        profile: models.SecureAcceptanceProfile | None = None,
         **kwargs: Any,
     ) -> None:
         self.session_id = session_id
@@ -223,7 +295,7 @@ class SecureAcceptanceOrderAction(
         self.customer_ip_address = customer_ip_address
         self.device_fingerprint_id = fingerprint_session_id
         self.extra_fields = extra_fields or {}
-        super().__init__(server_hostname)
+        super().__init__(server_hostname, profile=profile)
 
     @property
     def signed_field_names(self) -> set[str]:
@@ -255,8 +327,9 @@ class SecureAcceptanceOrderAction(
 
         # Basic order info
         data["payment_method"] = "card"
-        data["reference_number"] = str(self.order.number)
-        data["currency"] = self.order.currency
+        snapshot = get_order_snapshot(self.order)
+        data["reference_number"] = str(snapshot.number)
+        data["currency"] = snapshot.currency
         data[self.method_key_field_name] = self.method_key
         data[self.session_id_field_name] = encrypt_session_id(self.session_id)
         data["amount"] = str(self.amount.quantize(PRECISION))
@@ -267,8 +340,8 @@ class SecureAcceptanceOrderAction(
 
         # Add line item info
         i = 0
-        for line in self.order.lines.all():
-            ptitle = line.product.title if line.product is not None else ""
+        for line in snapshot.lines:
+            ptitle = line.product_title
             unit_price = str(
                 line.unit_price_incl_tax.quantize(PRECISION)
                 if line.unit_price_incl_tax is not None
@@ -296,10 +369,57 @@ class SecureAcceptanceOrderAction(
         return data
 
 
+class PaymentTokenFormRequest(TypedDict):
+    """
+    The per-order arguments to :class:`CreatePaymentToken`, for
+    :meth:`CreatePaymentToken.fields_many`.
+    """
+
+    session_id: str
+    order: Order
+    method_key: str
+    amount: Decimal
+    customer_ip_address: NotRequired[str | None]
+    fingerprint_session_id: NotRequired[str | None]
+    extra_fields: NotRequired[Mapping[str, str] | None]
+
+
 class CreatePaymentToken(SecureAcceptanceOrderAction):
     transaction_type = "create_payment_token"
     url = str(settings.ENDPOINT_PAY)
 
+    @classmethod
+    def build_many(
+        cls,
+        server_hostname: str,
+        requests: Sequence[PaymentTokenFormRequest],
+    ) -> list[Self]:
+        """
+        Build the actions for many orders at once (e.g. to pre-render checkout
+        forms). The profile is only looked up once and, within an
+        :func:`~cybersource.snapshot.order_snapshot_cache` block, every order's
+        addresses and lines are loaded together.
+        """
+        profile = models.SecureAcceptanceProfile.get_profile(server_hostname)
+        prefetch_order_snapshots(request["order"] for request in requests)
+        return [
+            cls(server_hostname=server_hostname, profile=profile, **request)
+            for request in requests
+        ]
+
+    @classmethod
+    def fields_many(
+        cls,
+        server_hostname: str,
+        requests: Sequence[PaymentTokenFormRequest],
+    ) -> list[dict[str, str]]:
+        """
+        Build the signed form fields for each of the given orders, in order.
+        """
+        with order_snapshot_cache():
+            actions = cls.build_many(server_hostname, requests)
+            return [action.fields() for action in actions]
+
     @property
     def unsigned_field_names(self) -> set[str]:
         fields = super().unsigned_field_names
@@ -348,17 +468,12 @@ class RecordPaymentToken(ReplyHandlerAction):
         card_type: str,
     ) -> PaymentToken:
         """Record the generated payment token and require authorization using the token."""
-        try:
-            token = PaymentToken.objects.filter(token=token_string).get()
-        except PaymentToken.DoesNotExist:
-            token = PaymentToken(
-                log=self.reply_log_entry,
-                token=token_string,
-                masked_card_number=card_num,
-                card_type=card_type,
-            )
-            token.save()
-        return token
+        return PaymentToken.record(
+            log=self.reply_log_entry,
+            token=token_string,
+            masked_card_number=card_num,
+            card_type=card_type,
+        )
 
 
 class RecordSuccessfulAuth(ReplyHandlerAction):
@@ -368,6 +483,7 @@ class RecordSuccessfulAuth(ReplyHandlerAction):
         token_string: str,
         response: SoapResponse,
         update_session: bool = False,
+        token: PaymentToken | None = None,
     ) -> Complete | Declined:
         decision = self.reply_log_entry.get_decision()
         transaction_id = response.requestID
@@ -378,11 +494,12 @@ class RecordSuccessfulAuth(ReplyHandlerAction):
         auth_amount = req_amount
         source = self.get_source(order, transaction_id)
 
-        # Lookup the payment token
-        try:
-            token = PaymentToken.objects.get(token=token_string)
-        except PaymentToken.DoesNotExist:
-            return Declined(req_amount, source_id=source.pk)
+        # Lookup the payment token, unless we were given it
+        if token is None:
+            try:
+                token = PaymentToken.objects.get(token=token_string)
+            except PaymentToken.DoesNotExist:
+                return Declined(req_amount, source_id=source.pk)
         # Increment the amount_allocated on the payment source
         source.amount_allocated = F("amount_allocated") + auth_amount
         source.save()
@@ -401,8 +518,8 @@ class RecordSuccessfulAuth(ReplyHandlerAction):
         transaction.save()
         # Create payment event
         event = self.make_authorize_event(order, auth_amount)
-        for line in order.lines.all():
-            self.make_event_quantity(event, line, line.quantity)
+        for line in get_order_snapshot(order).lines:
+            self.make_event_quantity(event, line.line, line.quantity)
         # Create order notes
         if response.decision == Decision.REVIEW:
             self.create_review_order_note(order, response.requestID)
@@ -430,6 +547,7 @@ class RecordDeclinedAuth(ReplyHandlerAction):
         response: SoapResponse,
         amount: Decimal,
         update_session: bool = False,
+        token: PaymentToken | None = None,
     ) -> Declined:
         decision = self.reply_log_entry.get_decision()
         transaction_id = response.requestID
@@ -441,7 +559,11 @@ class RecordDeclinedAuth(ReplyHandlerAction):
         transaction = Transaction()
         transaction.log = self.reply_log_entry
         transaction.source = source
-        transaction.token = PaymentToken.objects.filter(token=token_string).first()
+        transaction.token = (
+            token
+            if token is not None
+            else PaymentToken.objects.filter(token=token_string).first()
+        )
         transaction.txn_type = Transaction.AUTHORISE
         transaction.amount = req_amount
         transaction.reference = transaction_id
@@ -465,7 +587,7 @@ class RecordDeclinedAuth(ReplyHandlerAction):
         return Declined(req_amount, source_id=source.pk)
 
 
-class SOAPAction:
+class SOAPActionBase:
     def __init__(
         self,
         order: Order,
@@ -475,34 +597,57 @@ class SOAPAction:
         self.order = order
         self.request = request
         self.method_key = method_key
-        self.api = CyberSourceSoap(
+
+
+class SOAPAction(SOAPActionBase):
+    def __init__(
+        self,
+        order: Order,
+        request: HttpRequest | None = None,
+        method_key: str | None = None,
+    ) -> None:
+        super().__init__(order, request, method_key)
+        self.api = get_client(
             wsdl=str(settings.WSDL),
             merchant_id=settings.MERCHANT_ID,
             pkcs12_data=settings.PKCS12_DATA,
             pkcs12_password=settings.PKCS12_PASSWORD,
-            order=order,
-            request=request,
-            method_key=method_key,
+            wsdl_bundle=settings.WSDL_BUNDLE,
+            fast_serializer=settings.SOAP_FAST_SERIALIZER,
+            fast_parser=settings.SOAP_FAST_PARSER,
         )
 
 
-class GetPaymentToken(SOAPAction):
-    def __call__(
-        self,
-        payment_data: str,
-    ) -> tuple[None, None] | tuple[PaymentToken, CyberSourceReply]:
-        response = self.api.get_token(payment_data)
-        reply_log_entry = CyberSourceReply.log_soap_response(
+class AsyncSOAPAction(SOAPActionBase):
+    """
+    Base for actions which talk to the SOAP API using asyncio. Database work is
+    run in a thread using ``sync_to_async``.
+    """
+
+    async def get_api(self) -> AsyncCyberSourceSoap:
+        return await get_async_client(
+            wsdl=str(settings.WSDL),
+            merchant_id=settings.MERCHANT_ID,
+            pkcs12_data=settings.PKCS12_DATA,
+            pkcs12_password=settings.PKCS12_PASSWORD,
+            wsdl_bundle=settings.WSDL_BUNDLE,
+        )
+
+
+class GetPaymentTokenMixin(SOAPActionBase):
+    def log_reply(self, response: SoapResponse) -> CyberSourceReply:
+        return CyberSourceReply.log_soap_response(
             order=self.order,
             response=response,
             request=self.request,
         )
-        # If token creation was not successful, return
-        if response.decision != Decision.ACCEPT:
-            return None, None
-        # Lookup more details about the token
-        token_string = response.paySubscriptionCreateReply.subscriptionID
-        token_details = self.api.lookup_payment_token(token_string)
+
+    def record_token(
+        self,
+        reply_log_entry: CyberSourceReply,
+        token_string: str,
+        token_details: SoapResponse | None,
+    ) -> tuple[None, None] | tuple[PaymentToken, CyberSourceReply]:
         if token_details is None:
             return None, None
         # Record the new payment token
@@ -521,24 +666,101 @@ class GetPaymentToken(SOAPAction):
         return token, reply_log_entry
 
 
-class AuthorizePayment(SOAPAction):
+class GetPaymentToken(GetPaymentTokenMixin, SOAPAction):
     def __call__(
         self,
+        payment_data: str,
+    ) -> tuple[None, None] | tuple[PaymentToken, CyberSourceReply]:
+        with order_snapshot_cache():
+            response = self.api.get_token(
+                self.order,
+                payment_data,
+                request=self.request,
+                method_key=self.method_key,
+            )
+            if response is None:
+                return None, None
+            reply_log_entry = self.log_reply(response)
+            # If token creation was not successful, return
+            if response.decision != Decision.ACCEPT:
+                return None, None
+            # Lookup more details about the token
+            token_string = response.paySubscriptionCreateReply.subscriptionID
+            token_details = self.api.lookup_payment_token(
+                self.order,
+                token_string,
+                request=self.request,
+            )
+            return self.record_token(reply_log_entry, token_string, token_details)
+
+
+class AsyncGetPaymentToken(GetPaymentTokenMixin, AsyncSOAPAction):
+    async def __call__(
+        self,
+        payment_data: str,
+    ) -> tuple[None, None] | tuple[PaymentToken, CyberSourceReply]:
+        with order_snapshot_cache():
+            api = await self.get_api()
+            response = await api.get_token(
+                self.order,
+                payment_data,
+                request=self.request,
+                method_key=self.method_key,
+            )
+            if response is None:
+                return None, None
+            reply_log_entry = await sync_to_async(self.log_reply)(response)
+            # If token creation was not successful, return
+            if response.decision != Decision.ACCEPT:
+                return None, None
+            # Lookup more details about the token
+            token_string = response.paySubscriptionCreateReply.subscriptionID
+            token_details = await api.lookup_payment_token(
+                self.order,
+                token_string,
+                request=self.request,
+            )
+            return await sync_to_async(self.record_token)(
+                reply_log_entry, token_string, token_details
+            )
+
+
+class AuthorizePaymentMixin(SOAPActionBase):
+    def record_auth(
+        self,
+        response: SoapResponse | None,
         token_string: str,
         amount: Decimal,
         update_session: bool,
         card_expiry_date: str | None = None,
+        reply_log_entry: CyberSourceReply | None = None,
+        token: PaymentToken | None = None,
     ) -> Declined | Complete:
-        response = self.api.authorize(
-            token=token_string,
-            amount=amount,
-        )
-        reply_log_entry = CyberSourceReply.log_soap_response(
-            order=self.order,
-            response=response,
-            request=self.request,
-            card_expiry_date=card_expiry_date,
-        )
+        # The transaction couldn't be sent, so there's no reply to record
+        if response is None:
+            if (
+                update_session
+                and self.request is not None
+                and self.method_key is not None
+            ):
+                try:
+                    utils.mark_payment_method_declined(
+                        self.order, self.request, self.method_key, amount
+                    )
+                except InvalidOrderStatus:
+                    logger.exception(
+                        "Failed to set Order %s to payment declined. Order is current in status %s.",
+                        self.order.number,
+                        self.order.status,
+                    )
+            return Declined(amount)
+        if reply_log_entry is None:
+            reply_log_entry = CyberSourceReply.log_soap_response(
+                order=self.order,
+                response=response,
+                request=self.request,
+                card_expiry_date=card_expiry_date,
+            )
         record_kwargs: ReplyHandlerActionKwargs = {
             "reply_log_entry": reply_log_entry,
             "request": self.request,
@@ -550,6 +772,7 @@ class AuthorizePayment(SOAPAction):
                 token_string=token_string,
                 response=response,
                 update_session=update_session,
+                token=token,
             )
         else:
             state = RecordDeclinedAuth(**record_kwargs)(
@@ -558,5 +781,370 @@ class AuthorizePayment(SOAPAction):
                 response=response,
                 amount=amount,
                 update_session=update_session,
+                token=token,
             )
         return state
+
+
+class AuthorizePayment(AuthorizePaymentMixin, SOAPAction):
+    def __call__(
+        self,
+        token_string: str,
+        amount: Decimal,
+        update_session: bool,
+        card_expiry_date: str | None = None,
+        token: PaymentToken | None = None,
+    ) -> Declined | Complete:
+        with order_snapshot_cache():
+            response = self.api.authorize(
+                self.order,
+                token=token_string,
+                amount=amount,
+                request=self.request,
+                method_key=self.method_key,
+            )
+            return self.record_auth(
+                response,
+                token_string=token_string,
+                amount=amount,
+                update_session=update_session,
+                card_expiry_date=card_expiry_date,
+                token=token,
+            )
+
+
+class AsyncAuthorizePayment(AuthorizePaymentMixin, AsyncSOAPAction):
+    async def __call__(
+        self,
+        token_string: str,
+        amount: Decimal,
+        update_session: bool,
+        card_expiry_date: str | None = None,
+        token: PaymentToken | None = None,
+    ) -> Declined | Complete:
+        with order_snapshot_cache():
+            api = await self.get_api()
+            response = await api.authorize(
+                self.order,
+                token=token_string,
+                amount=amount,
+                request=self.request,
+                method_key=self.method_key,
+            )
+            return await sync_to_async(self.record_auth)(
+                response,
+                token_string=token_string,
+                amount=amount,
+                update_session=update_session,
+                card_expiry_date=card_expiry_date,
+                token=token,
+            )
+
+
+class ReverseAuthorizationMixin(SOAPActionBase):
+    api: CyberSourceSoap
+
+    def reverse_auth(
+        self,
+        response: SoapResponse,
+        reason: str,
+        reply_log_entry: CyberSourceReply | None = None,
+    ) -> None:
+        """
+        Reverse a successful authorization which we aren't going to use, so
+        that the hold on the customer's funds is released.
+        """
+        if reply_log_entry is None:
+            CyberSourceReply.log_soap_response(
+                order=self.order,
+                response=response,
+                request=self.request,
+            )
+        reversal = self.api.reverse_authorization(
+            self.order,
+            response.requestID,
+            Decimal(response.ccAuthReply.amount),
+            request=self.request,
+        )
+        if reversal is not None:
+            CyberSourceReply.log_soap_response(
+                order=self.order,
+                response=reversal,
+                request=self.request,
+            )
+        if reversal is None or reversal.decision != Decision.ACCEPT:
+            logger.error(
+                "Failed to reverse authorization %s on Order %s (%s). It must be reversed manually.",
+                response.requestID,
+                self.order.number,
+                reason,
+            )
+            msg = _(
+                "Failed to reverse authorization %(transaction_id)s (%(reason)s). It must be reversed manually."
+            )
+        else:
+            logger.warning(
+                "Reversed authorization %s on Order %s (%s)",
+                response.requestID,
+                self.order.number,
+                reason,
+            )
+            msg = _("Reversed authorization %(transaction_id)s (%(reason)s).")
+        OrderNote.objects.create(
+            note_type=OrderNote.SYSTEM,
+            order=self.order,
+            message=msg % {"transaction_id": response.requestID, "reason": reason},
+        )
+
+
+class ProcessBluefinPayment(
+    GetPaymentTokenMixin,
+    AuthorizePaymentMixin,
+    ReverseAuthorizationMixin,
+    SOAPAction,
+):
+    """
+    Tokenize and authorize a Bluefin encrypted card, sending independent SOAP
+    calls concurrently on the shared SOAP thread pool:
+
+    1. Create the payment token and, if ``BLUEFIN_FRAUD_SCREEN`` is enabled,
+       run the advanced fraud screen.
+    2. Once we have a token (and the fraud screen didn't reject the order),
+       look up the card details and authorize the payment.
+
+    If the lookup fails, the token can't be saved, so a successful
+    authorization is reversed and the payment declined.
+
+    End-to-end latency is therefore roughly ``max(token, fraud screen) +
+    max(lookup, authorize)``. Per-stage timings (in seconds) are left on
+    :attr:`timings` and logged.
+
+    Requests are built, and replies recorded, on the calling thread. Only the
+    SOAP round-trips themselves run in the pool, so worker threads never touch
+    the database.
+    """
+
+    timings: dict[str, float]
+
+    def __call__(
+        self,
+        payment_data: str,
+        amount: Decimal,
+    ) -> Declined | Complete:
+        self.timings = {}
+        start = time.perf_counter()
+        try:
+            with order_snapshot_cache():
+                return self._process(payment_data, amount)
+        finally:
+            self.timings["total"] = time.perf_counter() - start
+            logger.info(
+                "Bluefin payment pipeline for Order %s took %s",
+                self.order.number,
+                ", ".join(f"{k}={v * 1000:.0f}ms" for k, v in self.timings.items()),
+            )
+
+    def _process(self, payment_data: str, amount: Decimal) -> Declined | Complete:
+        # Stage 1: Create the token and screen the order for fraud
+        token_future = self._send(
+            "get_token",
+            self.api.build_get_token_request(
+                self.order,
+                payment_data,
+                request=self.request,
+                method_key=self.method_key,
+            ),
+        )
+        afs_future = None
+        if settings.BLUEFIN_FRAUD_SCREEN:
+            afs_future = self._send(
+                "fraud_screen",
+                self.api.build_advanced_fraud_screen_request(self.order, self.request),
+            )
+
+        response = token_future.result()
+        if response is None:
+            if afs_future is not None:
+                self._passed_fraud_screen(afs_future.result())
+            return Declined(amount)
+        reply_log_entry = self.log_reply(response)
+        if response.decision != Decision.ACCEPT:
+            if afs_future is not None:
+                self._passed_fraud_screen(afs_future.result())
+            return Declined(amount)
+
+        # Stage 2: Lookup the card details and, if the fraud screen passed,
+        # authorize the payment.
+        token_string = response.paySubscriptionCreateReply.subscriptionID
+        lookup_future = self._send(
+            "lookup",
+            self.api.build_lookup_payment_token_request(
+                self.order,
+                token_string,
+                request=self.request,
+            ),
+        )
+        auth_future = None
+        if afs_future is None or self._passed_fraud_screen(afs_future.result()):
+            auth_future = self._send(
+                "authorize",
+                self.api.build_authorize_request(
+                    self.order,
+                    token_string,
+                    amount,
+                    request=self.request,
+                    method_key=self.method_key,
+                ),
+            )
+
+        token_details = lookup_future.result()
+        if auth_future is None:
+            with self._timed("record"):
+                self.record_token(reply_log_entry, token_string, token_details)
+            return Declined(amount)
+
+        with self._timed("record"):
+            token = self.record_token(reply_log_entry, token_string, token_details)[0]
+        auth_response = auth_future.result()
+        with self._timed("record"):
+            if token is None and _is_authorized(auth_response):
+                self.reverse_auth(auth_response, reason="card lookup failed")
+                return Declined(amount)
+            return self.record_auth(
+                auth_response,
+                token_string=token_string,
+                amount=amount,
+                update_session=False,
+                card_expiry_date=reply_log_entry.req_card_expiry_date,
+                token=token,
+            )
+
+    def _send(self, stage: str, txndata: SoapRequest) -> Future[SoapResponse | None]:
+        def send() -> SoapResponse | None:
+            with self._timed(stage):
+                return self.api.run_transaction(self.order, txndata)
+
+        return get_executor().submit(send)
+
+    @contextmanager
+    def _timed(self, stage: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[stage] = (
+                self.timings.get(stage, 0.0) + time.perf_counter() - start
+            )
+
+    def _passed_fraud_screen(self, response: SoapResponse | None) -> bool:
+        if response is None:
+            # Don't block checkout when the fraud screen itself is unavailable.
+            logger.warning(
+                "Advanced fraud screen failed for Order %s. Continuing without it.",
+                self.order.number,
+            )
+            return True
+        CyberSourceReply.log_soap_response(
+            order=self.order,
+            response=response,
+            request=self.request,
+        )
+        # The fraud screen rejects with a decision of REJECT, which isn't one
+        # of ours, so only let the known-good decisions through.
+        return response.decision in (Decision.ACCEPT, Decision.REVIEW)
+
+
+class TokenizeAndAuthorizePayment(
+    GetPaymentTokenMixin,
+    AuthorizePaymentMixin,
+    ReverseAuthorizationMixin,
+    SOAPAction,
+):
+    """
+    Tokenize and authorize a Bluefin encrypted card using a single SOAP
+    transaction carrying both the ``paySubscriptionCreateService`` and the
+    ``ccAuthService`` (and, if ``BLUEFIN_FRAUD_SCREEN`` is enabled, the
+    ``afsService``).
+
+    The reply doesn't include the card details we keep on the payment token,
+    so those are still looked up with a second request once the token exists.
+    If that lookup fails, the authorization is reversed and the payment
+    declined. Likewise, if the fraud screen rejects the order, the card may
+    still have been authorized, in which case the authorization is reversed.
+    """
+
+    def __call__(
+        self,
+        payment_data: str,
+        amount: Decimal,
+    ) -> Declined | Complete:
+        with order_snapshot_cache():
+            response = self.api.get_token_and_authorize(
+                self.order,
+                payment_data,
+                amount,
+                request=self.request,
+                method_key=self.method_key,
+                fraud_screen=settings.BLUEFIN_FRAUD_SCREEN,
+            )
+            if response is None:
+                return Declined(amount)
+            # Log the reply once. It's shared by the token and the authorization.
+            reply_log_entry = self.log_reply(response)
+            cc_auth_reply = getattr(response, "ccAuthReply", None)
+            if (
+                response.decision not in (Decision.ACCEPT, Decision.REVIEW)
+                and cc_auth_reply is not None
+                and cc_auth_reply.reasonCode == 100
+            ):
+                # The fraud screen (or Decision Manager) rejected the order, but
+                # the card was still authorized, so release the hold on it.
+                self.reverse_auth(
+                    response,
+                    reason=f"transaction rejected with reason code {response.reasonCode}",
+                    reply_log_entry=reply_log_entry,
+                )
+            create_reply = getattr(response, "paySubscriptionCreateReply", None)
+            if create_reply is None or not create_reply.subscriptionID:
+                # No token was created, so there's nothing to look up. Record the
+                # (most likely declined) authorization without one.
+                return self.record_auth(
+                    response,
+                    token_string="",
+                    amount=amount,
+                    update_session=False,
+                    reply_log_entry=reply_log_entry,
+                )
+            # Lookup and record the token's card details
+            token_string = create_reply.subscriptionID
+            token_details = self.api.lookup_payment_token(
+                self.order,
+                token_string,
+                request=self.request,
+            )
+            token = self.record_token(reply_log_entry, token_string, token_details)[0]
+            if token is None and _is_authorized(response):
+                self.reverse_auth(
+                    response,
+                    reason="card lookup failed",
+                    reply_log_entry=reply_log_entry,
+                )
+                return Declined(amount)
+            # Record the authorization
+            return self.record_auth(
+                response,
+                token_string=token_string,
+                amount=amount,
+                update_session=False,
+                card_expiry_date=reply_log_entry.req_card_expiry_date,
+                reply_log_entry=reply_log_entry,
+                token=token,
+            )
+
+
+def _is_authorized(response: SoapResponse | None) -> TypeGuard[SoapResponse]:
+    return (
+        response is not None
+        and response.decision in (Decision.ACCEPT, Decision.REVIEW)
+        and getattr(response, "ccAuthReply", None) is not None
+    )
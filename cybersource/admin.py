@@ -77,6 +77,59 @@ class CyberSourceReplyAdmin(admin.ModelAdmin[models.CyberSourceReply]):
     formatted_data.short_description = "Reply Data"  # type:ignore[attr-defined]
 
 
+@admin.register(models.ProcessedReply)
+class ProcessedReplyAdmin(admin.ModelAdmin[models.ProcessedReply]):
+    list_filter = ("date_created",)
+    search_fields = ("key", "log__order__number")
+    fields = (
+        "key",
+        "log",
+        "redirect_url",
+        "duplicate_count",
+        "date_modified",
+        "date_created",
+    )
+    list_display = ("key", "log", "duplicate_count", "date_modified", "date_created")
+    readonly_fields = fields
+
+
+@admin.register(models.DeferredAuthorization)
+class DeferredAuthorizationAdmin(admin.ModelAdmin[models.DeferredAuthorization]):
+    list_filter = ("status", "date_created")
+    search_fields = ("order__number", "token__token")
+    fields = (
+        "order",
+        "log",
+        "token",
+        "method_key",
+        "amount",
+        "status",
+        "attempts",
+        "date_modified",
+        "date_created",
+    )
+    list_display = ("id", "order", "amount", "status", "attempts", "date_created")
+    readonly_fields = fields
+
+
+@admin.register(models.DecisionManagerNotification)
+class DecisionManagerNotificationAdmin(
+    admin.ModelAdmin[models.DecisionManagerNotification]
+):
+    list_filter = ("status", "date_created")
+    fields = (
+        "content",
+        "status",
+        "attempts",
+        "last_error",
+        "date_next_attempt",
+        "date_modified",
+        "date_created",
+    )
+    list_display = ("id", "status", "attempts", "date_next_attempt", "date_created")
+    readonly_fields = fields
+
+
 @admin.register(models.SecureAcceptanceProfile)
 class SecureAcceptanceProfileAdmin(admin.ModelAdmin[models.SecureAcceptanceProfile]):
     list_display = ("id", "hostname", "profile_id", "is_default")
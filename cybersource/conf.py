@@ -17,19 +17,33 @@ class CybersourceSettings(BaseModel):
     PROFILE: str | None = None
     ACCESS: str | None = None
     SECRET: str | None = None
+    PROFILE_CACHE_TTL: int
+    PROFILE_CACHE_MAXSIZE: int
+    PROFILE_CACHE_VERSION_KEY: str | None = None
 
     # SOAP API
     ORG_ID: str
     MERCHANT_ID: str
     WSDL: HttpUrl
+    WSDL_BUNDLE: str | None = None
     PKCS12_DATA: Base64Bytes
     PKCS12_PASSWORD: Base64Bytes
+    SOAP_POOL_CONNECTIONS: int
+    SOAP_POOL_MAXSIZE: int
+    SOAP_POOL_BLOCK: bool
+    SOAP_MAX_WORKERS: int
+    SOAP_FAST_SERIALIZER: bool
+    SOAP_FAST_PARSER: bool
+    SOAP_REPLY_LOG_FIELDS: Sequence[str] | None = None
+    BLUEFIN_FRAUD_SCREEN: bool
+    BLUEFIN_COMBINED_AUTH: bool
 
     # Checkout URL flow
     REDIRECT_PENDING: str
     REDIRECT_SUCCESS: str
     REDIRECT_FAIL: str
     ENDPOINT_PAY: HttpUrl
+    DEFERRED_AUTHORIZATION: bool
 
     # Formatting
     DATE_FORMAT: str
@@ -43,6 +57,8 @@ class CybersourceSettings(BaseModel):
     SOURCE_TYPE: str
     DEFAULT_CURRENCY: str
     DECISION_MANAGER_KEYS: Sequence[str]
+    DECISION_MANAGER_DEFERRED: bool
+    DECISION_MANAGER_MAX_ATTEMPTS: int
     SHIPPING_METHOD_DEFAULT: str
     SHIPPING_METHOD_MAPPING: Mapping[str, str]
 
@@ -56,8 +72,19 @@ def load(raw_settings: Mapping[str, Any]) -> CybersourceSettings:
 
 def _get_raw_config() -> Mapping[str, Any]:
     _defaults = {
+        "PROFILE_CACHE_TTL": 300,
+        "PROFILE_CACHE_MAXSIZE": 128,
         "WSDL": "https://ics2wstesta.ic3.com/commerce/1.x/transactionProcessor/CyberSourceTransaction_1.155.wsdl",
+        "SOAP_POOL_CONNECTIONS": 10,
+        "SOAP_POOL_MAXSIZE": 10,
+        "SOAP_POOL_BLOCK": False,
+        "SOAP_MAX_WORKERS": 8,
+        "SOAP_FAST_SERIALIZER": False,
+        "SOAP_FAST_PARSER": False,
+        "BLUEFIN_FRAUD_SCREEN": False,
+        "BLUEFIN_COMBINED_AUTH": False,
         "ENDPOINT_PAY": "https://testsecureacceptance.cybersource.com/silent/pay",
+        "DEFERRED_AUTHORIZATION": False,
         "DATE_FORMAT": "%Y-%m-%dT%H:%M:%SZ",
         "LOCALE": "en",
         "FINGERPRINT_PROTOCOL": "https",
@@ -65,6 +92,8 @@ def _get_raw_config() -> Mapping[str, Any]:
         "SOURCE_TYPE": gettext_noop("Cybersource Secure Acceptance"),
         "DEFAULT_CURRENCY": djsettings.OSCAR_DEFAULT_CURRENCY,
         "DECISION_MANAGER_KEYS": [],
+        "DECISION_MANAGER_DEFERRED": False,
+        "DECISION_MANAGER_MAX_ATTEMPTS": 5,
         "SHIPPING_METHOD_DEFAULT": "none",
         "SHIPPING_METHOD_MAPPING": {},
     }
@@ -21,6 +21,20 @@ class CyberSourceReplyType(IntegerChoices):
     SOAP = 2, _("SOAP API")
 
 
+class DeferredAuthorizationStatus(IntegerChoices):
+    PENDING = 1, _("Pending")
+    PROCESSING = 2, _("Processing")
+    COMPLETE = 3, _("Complete")
+    FAILED = 4, _("Failed")
+
+
+class DecisionManagerNotificationStatus(IntegerChoices):
+    PENDING = 1, _("Pending")
+    PROCESSING = 2, _("Processing")
+    COMPLETE = 3, _("Complete")
+    FAILED = 4, _("Failed")
+
+
 # TERMINAL_DESCRIPTOR = base64.b64encode(b"bluefin")
 TERMINAL_DESCRIPTOR = "Ymx1ZWZpbg=="
 
@@ -1,9 +1,15 @@
 from __future__ import annotations
 
+from collections import OrderedDict
 from decimal import Decimal
-from typing import TYPE_CHECKING, Any
+from typing import TYPE_CHECKING, Any, NamedTuple
+import asyncio
+import hashlib
 import logging
+import threading
+import weakref
 
+from asgiref.sync import sync_to_async
 from cryptography.hazmat.primitives.serialization import (
     Encoding,
     NoEncryption,
@@ -13,11 +19,12 @@ from cryptography.hazmat.primitives.serialization.pkcs12 import (
     PKCS12KeyAndCertificates,
     load_pkcs12,
 )
-from django.dispatch import Signal
+from django.core.signals import setting_changed
+from django.dispatch import Signal, receiver
 from django.http import HttpRequest
 from django.utils.functional import cached_property
 from zeep.client import Factory
-from zeep.transports import Transport
+from zeep.transports import AsyncTransport, Transport
 from zeep.wsse import BinarySignature, MemorySignature
 from zeep.xsd import CompoundValue
 import xmlsec
@@ -26,6 +33,19 @@ import zeep.cache
 
 from . import signals
 from .constants import CHECKOUT_FINGERPRINT_SESSION_ID, PRECISION, TERMINAL_DESCRIPTOR
+from .envelope import (
+    EnvelopeBuilder,
+    UnsupportedEnvelope,
+    build_envelope_builder,
+    build_http_headers,
+    get_binding,
+    get_port,
+)
+from .replies import Reply, ReplyParser, build_reply_parser
+from .snapshot import get_order_snapshot
+from .transport import build_async_http_client, get_session
+from .wsdl import WSDLBundleCache
+from .wsse import make_sign_key, sign_envelope_binary
 
 if TYPE_CHECKING:
     from oscar.apps.order.models import Order
@@ -34,13 +54,16 @@ logger = logging.getLogger(__name__)
 
 
 type SoapRequest = dict[str, Any]
-type SoapResponse = CompoundValue
+type SoapResponse = CompoundValue | Reply
 
 
 class BinaryMemorySignature(BinarySignature):
     """
     Same as `zeep.wsse.BinarySignature`, but uses keys from memory, rather than
     reading them from files on disk.
+
+    The parsed xmlsec key is kept and reused for every envelope, rather than
+    being re-parsed from PEM on each call to ``apply``.
     """
 
     def __init__(
@@ -60,10 +83,100 @@ class BinaryMemorySignature(BinarySignature):
             digest_method=digest_method,
         )
 
+    @cached_property
+    def sign_key(self) -> xmlsec.Key:
+        return make_sign_key(self.key_data, self.cert_data, self.password)
+
+    def apply(self, envelope: Any, headers: Any) -> tuple[Any, Any]:
+        # xmlsec copies the key into each signing context, so sharing the
+        # parsed key between threads is safe.
+        sign_envelope_binary(
+            envelope, self.sign_key, self.signature_method, self.digest_method
+        )
+        return envelope, headers
+
     def verify(self, envelope: Any) -> None:
         """Disable verification since Cybersource doesn't sign responses"""
 
 
+class KeyMaterial:
+    """
+    The decoded contents of a PKCS12 bundle: the key and certificate, their
+    PEM encodings, and a WSSE signer built from them.
+    """
+
+    pkcs12: PKCS12KeyAndCertificates
+    privkey_pem: bytes
+    cert_pem: bytes
+    signer: BinaryMemorySignature
+
+    def __init__(self, pkcs12_data: bytes, pkcs12_password: bytes) -> None:
+        # Decrypt the pkcs12 data using the given password, then extract the
+        # private key and certificate into PEMs.
+        self.pkcs12 = load_pkcs12(pkcs12_data, pkcs12_password)
+        if self.pkcs12.key is None:
+            raise ValueError("pkcs12 data does not contain a valid private key")
+        if self.pkcs12.cert is None:
+            raise ValueError("pkcs12 data does not contain a valid certificate")
+        self.privkey_pem = self.pkcs12.key.private_bytes(
+            encoding=Encoding.PEM,
+            format=PrivateFormat.TraditionalOpenSSL,
+            encryption_algorithm=NoEncryption(),
+        )
+        self.cert_pem = self.pkcs12.cert.certificate.public_bytes(
+            encoding=Encoding.PEM,
+        )
+        self.signer = BinaryMemorySignature(
+            key_data=self.privkey_pem,
+            cert_data=self.cert_pem,
+            signature_method=xmlsec.Transform.RSA_SHA256,  # type:ignore[attr-defined]
+            digest_method=xmlsec.Transform.SHA256,  # type:ignore[attr-defined]
+        )
+
+
+class KeyMaterialCache:
+    """
+    Thread-safe LRU cache of :class:`KeyMaterial`, keyed by the fingerprint of
+    the PKCS12 bundle.
+
+    Decoding the bundle and parsing the RSA key is some of the most expensive
+    CPU work in the authorization path, so we only want to do it once per
+    certificate.
+    """
+
+    def __init__(self, maxsize: int = 8) -> None:
+        self.maxsize = maxsize
+        self._entries: OrderedDict[tuple[str, bytes], KeyMaterial] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, pkcs12_data: bytes, pkcs12_password: bytes) -> KeyMaterial:
+        key = (pkcs12_fingerprint(pkcs12_data), pkcs12_password)
+        with self._lock:
+            material = self._entries.get(key)
+            if material is None:
+                material = KeyMaterial(pkcs12_data, pkcs12_password)
+                self._entries[key] = material
+                if len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+            else:
+                self._entries.move_to_end(key)
+        return material
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+_key_material = KeyMaterialCache()
+
+
+def get_key_material(pkcs12_data: bytes, pkcs12_password: bytes) -> KeyMaterial:
+    """
+    Get the shared, decoded :class:`KeyMaterial` for the given PKCS12 bundle.
+    """
+    return _key_material.get(pkcs12_data, pkcs12_password)
+
+
 class CyberSourceSoap:
     """
     Wrapper around the Cybersource SOAP API.
@@ -78,15 +191,18 @@ class CyberSourceSoap:
     password. This is generated by creating a "REST Certificate" type key. in
     the Cybersource Business Center. Treat this like a password and do not check
     it into version control.
+
+    Instances hold no per-order state, so a single instance (and it's parsed
+    WSDL) can be shared by every request in the process. Use :func:`get_client`
+    rather than constructing this class directly.
     """
 
     wsdl: str
     merchant_id: str
-    pkcs12: PKCS12KeyAndCertificates
-    order: Order
-    request: HttpRequest | None
-    method_key: str | None
+    key_material: KeyMaterial
     wsdl_cache: zeep.cache.Base
+    fast_serializer: bool
+    fast_parser: bool
 
     def __init__(
         self,
@@ -94,18 +210,16 @@ class CyberSourceSoap:
         merchant_id: str,
         pkcs12_data: bytes,
         pkcs12_password: bytes,
-        order: Order,
-        request: HttpRequest | None = None,
-        method_key: str | None = "",
         wsdl_cache: zeep.cache.Base | None = None,
+        fast_serializer: bool = False,
+        fast_parser: bool = False,
     ):
         self.wsdl = wsdl
         self.merchant_id = merchant_id
-        self.pkcs12 = load_pkcs12(pkcs12_data, pkcs12_password)
-        self.order = order
-        self.request = request
-        self.method_key = method_key
+        self.key_material = get_key_material(pkcs12_data, pkcs12_password)
         self.wsdl_cache = wsdl_cache or zeep.cache.InMemoryCache()
+        self.fast_serializer = fast_serializer
+        self.fast_parser = fast_parser
 
     @property
     def client_settings(self) -> zeep.Settings:
@@ -114,27 +228,7 @@ class CyberSourceSoap:
 
     @property
     def client_wsse(self) -> MemorySignature:
-        # Decrypt the pkcs12 data using the given password, then extract the
-        # private key and certificate into PEMs.
-        if self.pkcs12.key is None:
-            raise ValueError("pkcs12 data does not contain a valid private key")
-        if self.pkcs12.cert is None:
-            raise ValueError("pkcs12 data does not contain a valid certificate")
-        privkey_pem = self.pkcs12.key.private_bytes(
-            encoding=Encoding.PEM,
-            format=PrivateFormat.TraditionalOpenSSL,
-            encryption_algorithm=NoEncryption(),
-        )
-        cert_pem = self.pkcs12.cert.certificate.public_bytes(
-            encoding=Encoding.PEM,
-        )
-        wsse = BinaryMemorySignature(
-            key_data=privkey_pem,
-            cert_data=cert_pem,
-            signature_method=xmlsec.Transform.RSA_SHA256,  # type:ignore[attr-defined]
-            digest_method=xmlsec.Transform.SHA256,  # type:ignore[attr-defined]
-        )
-        return wsse
+        return self.key_material.signer
 
     @cached_property
     def client(self) -> zeep.Client:
@@ -145,7 +239,7 @@ class CyberSourceSoap:
             wsdl=self.wsdl,
             settings=self.client_settings,
             wsse=self.client_wsse,
-            transport=Transport(cache=self.wsdl_cache),
+            transport=Transport(cache=self.wsdl_cache, session=get_session()),
         )
         return client
 
@@ -153,21 +247,133 @@ class CyberSourceSoap:
     def factory(self) -> Factory:
         return self.client.type_factory("ns0")
 
-    def run_advanced_fraud_screen(self) -> SoapResponse:
+    @cached_property
+    def envelope_builder(self) -> EnvelopeBuilder | None:
+        """
+        Template-based serializer used in place of zeep's when
+        ``fast_serializer`` is enabled. ``None`` if the WSDL isn't supported.
+        """
+        return build_envelope_builder(self.client)
+
+    @cached_property
+    def reply_parser(self) -> ReplyParser | None:
+        """
+        Streaming parser used in place of zeep's when ``fast_parser`` is
+        enabled. ``None`` if the WSDL isn't supported.
+        """
+        return build_reply_parser(self.client)
+
+    def run_advanced_fraud_screen(
+        self,
+        order: Order,
+        request: HttpRequest | None = None,
+    ) -> SoapResponse | None:
         """
         Screen the order data for signs of possible fraud
         """
-        txndata = self._prep_transaction(
-            amount=self.order.total_incl_tax,
-            afsService=self.factory.AFSService(run="true"),
-        )
-        return self._run_transaction(txndata)
+        txndata = self.build_advanced_fraud_screen_request(order, request)
+        return self._run_transaction(order, txndata)
 
-    def get_token(self, encrypted_payment_data: str) -> SoapResponse:
+    def get_token(
+        self,
+        order: Order,
+        encrypted_payment_data: str,
+        request: HttpRequest | None = None,
+        method_key: str | None = "",
+    ) -> SoapResponse | None:
         """
         Get a token using encrypted card number
         """
+        txndata = self.build_get_token_request(
+            order, encrypted_payment_data, request, method_key
+        )
+        return self._run_transaction(order, txndata)
+
+    def lookup_payment_token(
+        self,
+        order: Order,
+        token: str,
+        request: HttpRequest | None = None,
+    ) -> SoapResponse | None:
+        """
+        Using a payment token, lookup some of the details about the related card
+        """
+        txndata = self.build_lookup_payment_token_request(order, token, request)
+        return self._run_transaction(order, txndata)
+
+    def authorize(
+        self,
+        order: Order,
+        token: str,
+        amount: Decimal,
+        request: HttpRequest | None = None,
+        method_key: str | None = "",
+    ) -> SoapResponse | None:
+        """
+        Authorize with a payment token
+        """
+        txndata = self.build_authorize_request(
+            order, token, amount, request, method_key
+        )
+        return self._run_transaction(order, txndata)
+
+    def get_token_and_authorize(
+        self,
+        order: Order,
+        encrypted_payment_data: str,
+        amount: Decimal,
+        request: HttpRequest | None = None,
+        method_key: str | None = "",
+        fraud_screen: bool = False,
+    ) -> SoapResponse | None:
+        """
+        Get a token using encrypted card number and authorize it, in a single
+        transaction. The reply contains both the ``paySubscriptionCreateReply``
+        and the ``ccAuthReply``.
+        """
+        txndata = self.build_get_token_and_authorize_request(
+            order, encrypted_payment_data, amount, request, method_key, fraud_screen
+        )
+        return self._run_transaction(order, txndata)
+
+    def reverse_authorization(
+        self,
+        order: Order,
+        auth_request_id: str,
+        amount: Decimal,
+        request: HttpRequest | None = None,
+    ) -> SoapResponse | None:
+        """
+        Reverse (void) an authorization, releasing the hold on the customer's
+        funds.
+        """
+        txndata = self.build_auth_reversal_request(
+            order, auth_request_id, amount, request
+        )
+        return self._run_transaction(order, txndata)
+
+    def build_advanced_fraud_screen_request(
+        self,
+        order: Order,
+        request: HttpRequest | None = None,
+    ) -> SoapRequest:
+        return self._prep_transaction(
+            order=order,
+            request=request,
+            amount=order.total_incl_tax,
+            afsService=self.factory.AFSService(run="true"),
+        )
+
+    def build_get_token_request(
+        self,
+        order: Order,
+        encrypted_payment_data: str,
+        request: HttpRequest | None = None,
+        method_key: str | None = "",
+    ) -> SoapRequest:
         txndata = self._prep_transaction(
+            order=order,
+            request=request,
             amount="0",
             paySubscriptionCreateService=self.factory.PaySubscriptionCreateService(
                 run="true",
@@ -184,15 +390,66 @@ class CyberSourceSoap:
         self._trigger_pre_build_hook(
             txndata=txndata,
             signal=signals.pre_build_get_token_request,
+            order=order,
+            request=request,
+            method_key=method_key,
         )
-        # Run transaction
-        return self._run_transaction(txndata)
+        return txndata
 
-    def lookup_payment_token(self, token: str) -> SoapResponse:
-        """
-        Using a payment token, lookup some of the details about the related card
-        """
+    def build_get_token_and_authorize_request(
+        self,
+        order: Order,
+        encrypted_payment_data: str,
+        amount: Decimal,
+        request: HttpRequest | None = None,
+        method_key: str | None = "",
+        fraud_screen: bool = False,
+    ) -> SoapRequest:
         txndata = self._prep_transaction(
+            order=order,
+            request=request,
+            amount=amount,
+            ccAuthService=self.factory.CCAuthService(run="true"),
+            paySubscriptionCreateService=self.factory.PaySubscriptionCreateService(
+                run="true",
+            ),
+            encryptedPayment=self.factory.EncryptedPayment(
+                data=encrypted_payment_data,
+                descriptor=TERMINAL_DESCRIPTOR,
+            ),
+            recurringSubscriptionInfo=self.factory.RecurringSubscriptionInfo(
+                frequency="on-demand"
+            ),
+        )
+        if fraud_screen:
+            txndata["afsService"] = self.factory.AFSService(run="true")
+        # Add extra fields. Since this is both a get token and an auth request,
+        # both hooks get a chance to add fields.
+        self._trigger_pre_build_hook(
+            txndata=txndata,
+            signal=signals.pre_build_get_token_request,
+            order=order,
+            request=request,
+            method_key=method_key,
+        )
+        self._trigger_pre_build_hook(
+            txndata=txndata,
+            signal=signals.pre_build_auth_request,
+            order=order,
+            request=request,
+            method_key=method_key,
+        )
+        return txndata
+
+    def build_lookup_payment_token_request(
+        self,
+        order: Order,
+        token: str,
+        request: HttpRequest | None = None,
+    ) -> SoapRequest:
+        return self._prep_transaction(
+            order=order,
+            request=request,
             amount="0",
             paySubscriptionRetrieveService=self.factory.PaySubscriptionRetrieveService(
                 run="true",
@@ -201,14 +458,18 @@ class CyberSourceSoap:
                 subscriptionID=token,
             ),
         )
-        # Run transaction
-        return self._run_transaction(txndata)
 
-    def authorize(self, token: str, amount: Decimal) -> SoapResponse:
-        """
-        Authorize with a payment token
-        """
+    def build_authorize_request(
+        self,
+        order: Order,
+        token: str,
+        amount: Decimal,
+        request: HttpRequest | None = None,
+        method_key: str | None = "",
+    ) -> SoapRequest:
         txndata = self._prep_transaction(
+            order=order,
+            request=request,
             amount=amount,
             ccAuthService=self.factory.CCAuthService(run="true"),
             recurringSubscriptionInfo=self.factory.RecurringSubscriptionInfo(
@@ -219,64 +480,88 @@ class CyberSourceSoap:
         self._trigger_pre_build_hook(
             txndata=txndata,
             signal=signals.pre_build_auth_request,
+            order=order,
+            request=request,
+            method_key=method_key,
             token=token,
         )
-        # Run transaction
-        return self._run_transaction(txndata)
+        return txndata
+
+    def build_auth_reversal_request(
+        self,
+        order: Order,
+        auth_request_id: str,
+        amount: Decimal,
+        request: HttpRequest | None = None,
+    ) -> SoapRequest:
+        return self._prep_transaction(
+            order=order,
+            request=request,
+            amount=amount,
+            ccAuthReversalService=self.factory.CCAuthReversalService(
+                run="true",
+                authRequestID=auth_request_id,
+            ),
+        )
 
     def _prep_transaction(
         self,
+        order: Order,
+        request: HttpRequest | None,
         amount: Decimal | str,
         **kwargs: Any,
     ) -> SoapRequest:
         data: SoapRequest = {} | kwargs
 
         # Add merchant info
-        if self.request and CHECKOUT_FINGERPRINT_SESSION_ID:
-            fingerprint_id = self.request.session.get(CHECKOUT_FINGERPRINT_SESSION_ID)
+        if request and CHECKOUT_FINGERPRINT_SESSION_ID:
+            fingerprint_id = request.session.get(CHECKOUT_FINGERPRINT_SESSION_ID)
             if fingerprint_id:
                 data["deviceFingerprintID"] = fingerprint_id
 
+        snapshot = get_order_snapshot(order)
         data["merchantID"] = self.merchant_id
-        data["merchantReferenceCode"] = self.order.number
+        data["merchantReferenceCode"] = snapshot.number
 
         # Add order info
-        data["billTo"] = self.factory.BillTo(email=self.order.email)
-        if self.request:
-            data["billTo"].ipAddress = self.request.META.get("REMOTE_ADDR")
-        if self.order.user:
-            data["billTo"].customerID = self.order.user.pk
+        data["billTo"] = self.factory.BillTo(email=snapshot.email)
+        if request:
+            data["billTo"].ipAddress = request.META.get("REMOTE_ADDR")
+        if snapshot.user_id is not None:
+            data["billTo"].customerID = snapshot.user_id
 
         # Add order billing data
-        if self.order.billing_address:
-            data["billTo"].firstName = self.order.billing_address.first_name
-            data["billTo"].lastName = self.order.billing_address.last_name
-            data["billTo"].street1 = self.order.billing_address.line1
-            data["billTo"].street2 = self.order.billing_address.line2
-            data["billTo"].city = self.order.billing_address.line4
-            data["billTo"].state = self.order.billing_address.state
-            data["billTo"].postalCode = self.order.billing_address.postcode
-            data["billTo"].country = self.order.billing_address.country.iso_3166_1_a2
+        billing_address = snapshot.billing_address
+        if billing_address:
+            data["billTo"].firstName = billing_address.first_name
+            data["billTo"].lastName = billing_address.last_name
+            data["billTo"].street1 = billing_address.line1
+            data["billTo"].street2 = billing_address.line2
+            data["billTo"].city = billing_address.line4
+            data["billTo"].state = billing_address.state
+            data["billTo"].postalCode = billing_address.postcode
+            data["billTo"].country = billing_address.country_code
 
         # Add order shipping data
-        if self.order.shipping_address:
+        shipping_address = snapshot.shipping_address
+        if shipping_address:
             data["shipTo"] = self.factory.ShipTo(
-                phoneNumber=self.order.shipping_address.phone_number,
-                firstName=self.order.shipping_address.first_name,
-                lastName=self.order.shipping_address.last_name,
-                street1=self.order.shipping_address.line1,
-                street2=self.order.shipping_address.line2,
-                city=self.order.shipping_address.line4,
-                state=self.order.shipping_address.state,
-                postalCode=self.order.shipping_address.postcode,
-                country=self.order.shipping_address.country.iso_3166_1_a2,
+                phoneNumber=shipping_address.phone_number,
+                firstName=shipping_address.first_name,
+                lastName=shipping_address.last_name,
+                street1=shipping_address.line1,
+                street2=shipping_address.line2,
+                city=shipping_address.line4,
+                state=shipping_address.state,
+                postalCode=shipping_address.postcode,
+                country=shipping_address.country_code,
             )
 
         # Add line items
         data["item"] = [
             self.factory.Item(
                 id=str(i),
-                productName=line.product.title if line.product is not None else "",
+                productName=line.product_title,
                 productSKU=line.partner_sku,
                 quantity=str(line.quantity),
                 unitPrice=str(
@@ -285,12 +570,12 @@ class CyberSourceSoap:
                     else ""
                 ),
             )
-            for i, line in enumerate(self.order.lines.all())
+            for i, line in enumerate(snapshot.lines)
         ]
 
         # Add order total data
         data["purchaseTotals"] = self.factory.PurchaseTotals(
-            currency=self.order.currency,
+            currency=snapshot.currency,
             grandTotalAmount=amount if amount is not None else "0",
         )
 
@@ -301,6 +586,9 @@ class CyberSourceSoap:
         self,
         txndata: SoapRequest,
         signal: Signal,
+        order: Order,
+        request: HttpRequest | None = None,
+        method_key: str | None = "",
         token: str | None = None,
     ) -> None:
         """
@@ -311,26 +599,362 @@ class CyberSourceSoap:
         signal.send(
             sender=self.__class__,
             extra_fields=extra_fields,
-            request=self.request,
-            order=self.order,
+            request=request,
+            order=order,
             token=token,
-            method_key=self.method_key,
+            method_key=method_key,
         )
-        mdata = self.factory.MerchantDefinedData()
+        mdata = txndata.get("merchantDefinedData") or self.factory.MerchantDefinedData()
         for k, v in extra_fields.items():
             field_name = f"field{k}"
             setattr(mdata, field_name, v)
         txndata["merchantDefinedData"] = mdata
 
-    def _run_transaction(self, txndata: SoapRequest) -> SoapResponse:
+    def run_transaction(
+        self, order: Order, txndata: SoapRequest
+    ) -> SoapResponse | None:
+        """
+        Send a request built by one of the ``build_*_request`` methods.
+        """
+        return self._run_transaction(order, txndata)
+
+    def _run_transaction(
+        self, order: Order, txndata: SoapRequest
+    ) -> SoapResponse | None:
         """
         Send the transaction to Cybersource to process
         """
         try:
-            response = self.client.service.runTransaction(**txndata)
+            response = self._send_transaction(txndata)
         except Exception:
             logger.exception(
-                f"Failed to run Cybersource SOAP transaction on Order {self.order.number}"
+                f"Failed to run Cybersource SOAP transaction on Order {order.number}"
             )
             response = None
         return response
+
+    def _send_transaction(self, txndata: SoapRequest) -> SoapResponse:
+        if not self.fast_serializer and not self.fast_parser:
+            return self.client.service.runTransaction(**txndata)
+        client = self.client
+        port = get_port(client)
+        binding = get_binding(client)
+        operation = binding.get("runTransaction")
+        # Serialize
+        envelope, headers = self._serialize_transaction(txndata)
+        # Send
+        response = client.transport.post_xml(
+            port.binding_options["address"],
+            envelope,
+            headers,
+        )
+        # Parse
+        parser = self.reply_parser if self.fast_parser else None
+        if parser is not None:
+            reply = parser.parse_response(response)
+            if reply is not None:
+                return reply
+            logger.debug("Falling back to zeep to parse SOAP reply")
+        return binding.process_reply(client, operation, response)
+
+    def _serialize_transaction(
+        self,
+        txndata: SoapRequest,
+    ) -> tuple[Any, dict[str, str]]:
+        builder = self.envelope_builder if self.fast_serializer else None
+        if builder is not None:
+            try:
+                return builder.sign(builder.build(txndata))
+            except UnsupportedEnvelope:
+                logger.debug(
+                    "Falling back to zeep to serialize SOAP request", exc_info=True
+                )
+        client = self.client
+        binding = get_binding(client)
+        envelope = client.create_message(client.service, "runTransaction", **txndata)
+        return envelope, build_http_headers(
+            client, binding, binding.get("runTransaction")
+        )
+
+
+def pkcs12_fingerprint(pkcs12_data: bytes) -> str:
+    """
+    Return a stable identifier for the given PKCS12 bundle, suitable for use as
+    a cache key without holding onto the key material itself.
+    """
+    return hashlib.sha256(pkcs12_data).hexdigest()
+
+
+class ClientKey(NamedTuple):
+    wsdl: str
+    merchant_id: str
+    cert_fingerprint: str
+    wsdl_bundle: str | None
+    fast_serializer: bool
+    fast_parser: bool
+
+
+class CyberSourceSoapRegistry:
+    """
+    Thread-safe, process-wide registry of :class:`CyberSourceSoap` clients.
+
+    Building a client means parsing the WSDL and it's XSDs and decoding the
+    PKCS12 bundle, so we want to do it once per configuration rather than once
+    per transaction.
+    """
+
+    def __init__(self) -> None:
+        self._clients: dict[ClientKey, CyberSourceSoap] = {}
+        self._lock = threading.Lock()
+
+    def get(
+        self,
+        wsdl: str,
+        merchant_id: str,
+        pkcs12_data: bytes,
+        pkcs12_password: bytes,
+        wsdl_bundle: str | None = None,
+        fast_serializer: bool = False,
+        fast_parser: bool = False,
+    ) -> CyberSourceSoap:
+        key = ClientKey(
+            wsdl=wsdl,
+            merchant_id=merchant_id,
+            cert_fingerprint=pkcs12_fingerprint(pkcs12_data),
+            wsdl_bundle=wsdl_bundle,
+            fast_serializer=fast_serializer,
+            fast_parser=fast_parser,
+        )
+        client = self._clients.get(key)
+        if client is not None:
+            return client
+        with self._lock:
+            # Another thread may have built the client while we were waiting
+            # on the lock.
+            client = self._clients.get(key)
+            if client is None:
+                client = CyberSourceSoap(
+                    wsdl=wsdl,
+                    merchant_id=merchant_id,
+                    pkcs12_data=pkcs12_data,
+                    pkcs12_password=pkcs12_password,
+                    wsdl_cache=(
+                        WSDLBundleCache.load(wsdl_bundle) if wsdl_bundle else None
+                    ),
+                    fast_serializer=fast_serializer,
+                    fast_parser=fast_parser,
+                )
+                self._clients[key] = client
+        return client
+
+    def clear(self) -> None:
+        with self._lock:
+            self._clients.clear()
+
+
+_registry = CyberSourceSoapRegistry()
+
+
+def get_client(
+    wsdl: str,
+    merchant_id: str,
+    pkcs12_data: bytes,
+    pkcs12_password: bytes,
+    wsdl_bundle: str | None = None,
+    fast_serializer: bool = False,
+    fast_parser: bool = False,
+) -> CyberSourceSoap:
+    """
+    Get the shared :class:`CyberSourceSoap` client for the given configuration.
+
+    When ``wsdl_bundle`` is the path to a bundle written by the
+    ``download_cybersource_wsdl`` command, the WSDL and XSDs are loaded from it
+    instead of from the network. When ``fast_serializer`` is set, requests are
+    serialized using an :class:`~cybersource.envelope.EnvelopeBuilder` rather
+    than by zeep. When ``fast_parser`` is set, replies are parsed using a
+    :class:`~cybersource.replies.ReplyParser` rather than by zeep.
+    """
+    return _registry.get(
+        wsdl=wsdl,
+        merchant_id=merchant_id,
+        pkcs12_data=pkcs12_data,
+        pkcs12_password=pkcs12_password,
+        wsdl_bundle=wsdl_bundle,
+        fast_serializer=fast_serializer,
+        fast_parser=fast_parser,
+    )
+
+
+class AsyncCyberSourceSoap:
+    """
+    Asyncio flavor of :class:`CyberSourceSoap`.
+
+    Requests are built by the wrapped sync client (in a thread, since building
+    them reads the order from the database and fires the ``pre_build_*``
+    signals) and are then sent using zeep's httpx-based async transport. The
+    parsed WSDL is shared with the sync client rather than parsed again.
+
+    Instances are bound to the event loop they're created on. Use
+    :func:`get_async_client` rather than constructing this class directly.
+
+    Requires ``httpx``, e.g. ``pip install django-oscar-cybersource[async]``.
+    """
+
+    soap: CyberSourceSoap
+
+    def __init__(self, soap: CyberSourceSoap) -> None:
+        self.soap = soap
+
+    @cached_property
+    def client(self) -> zeep.AsyncClient:
+        """
+        Construct and return an async zeep SOAP client
+        """
+        client = zeep.AsyncClient(
+            wsdl=self.soap.client.wsdl,
+            settings=self.soap.client_settings,
+            wsse=self.soap.client_wsse,
+            transport=AsyncTransport(
+                client=build_async_http_client(),
+                cache=self.soap.wsdl_cache,
+            ),
+        )
+        return client
+
+    async def run_advanced_fraud_screen(
+        self,
+        order: Order,
+        request: HttpRequest | None = None,
+    ) -> SoapResponse | None:
+        """
+        Screen the order data for signs of possible fraud
+        """
+        txndata = await sync_to_async(self.soap.build_advanced_fraud_screen_request)(
+            order, request
+        )
+        return await self._run_transaction(order, txndata)
+
+    async def get_token(
+        self,
+        order: Order,
+        encrypted_payment_data: str,
+        request: HttpRequest | None = None,
+        method_key: str | None = "",
+    ) -> SoapResponse | None:
+        """
+        Get a token using encrypted card number
+        """
+        txndata = await sync_to_async(self.soap.build_get_token_request)(
+            order, encrypted_payment_data, request, method_key
+        )
+        return await self._run_transaction(order, txndata)
+
+    async def lookup_payment_token(
+        self,
+        order: Order,
+        token: str,
+        request: HttpRequest | None = None,
+    ) -> SoapResponse | None:
+        """
+        Using a payment token, lookup some of the details about the related card
+        """
+        txndata = await sync_to_async(self.soap.build_lookup_payment_token_request)(
+            order, token, request
+        )
+        return await self._run_transaction(order, txndata)
+
+    async def authorize(
+        self,
+        order: Order,
+        token: str,
+        amount: Decimal,
+        request: HttpRequest | None = None,
+        method_key: str | None = "",
+    ) -> SoapResponse | None:
+        """
+        Authorize with a payment token
+        """
+        txndata = await sync_to_async(self.soap.build_authorize_request)(
+            order, token, amount, request, method_key
+        )
+        return await self._run_transaction(order, txndata)
+
+    async def _run_transaction(
+        self,
+        order: Order,
+        txndata: SoapRequest,
+    ) -> SoapResponse | None:
+        try:
+            response = await self.client.service.runTransaction(**txndata)
+        except Exception:
+            logger.exception(
+                f"Failed to run Cybersource SOAP transaction on Order {order.number}"
+            )
+            response = None
+        return response
+
+
+class AsyncCyberSourceSoapRegistry:
+    """
+    Registry of :class:`AsyncCyberSourceSoap` clients, one per sync client per
+    event loop.
+    """
+
+    def __init__(self) -> None:
+        self._clients: weakref.WeakKeyDictionary[
+            asyncio.AbstractEventLoop,
+            dict[CyberSourceSoap, AsyncCyberSourceSoap],
+        ] = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    async def get(self, soap: CyberSourceSoap) -> AsyncCyberSourceSoap:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            client = self._clients.get(loop, {}).get(soap)
+        if client is not None:
+            return client
+        # Loading the WSDL is blocking I/O, so make sure the sync client has
+        # done it before the async client needs it.
+        await sync_to_async(lambda: soap.client, thread_sensitive=False)()
+        with self._lock:
+            client = self._clients.setdefault(loop, {}).setdefault(
+                soap, AsyncCyberSourceSoap(soap)
+            )
+        return client
+
+    def clear(self) -> None:
+        with self._lock:
+            self._clients.clear()
+
+
+_async_registry = AsyncCyberSourceSoapRegistry()
+
+
+async def get_async_client(
+    wsdl: str,
+    merchant_id: str,
+    pkcs12_data: bytes,
+    pkcs12_password: bytes,
+    wsdl_bundle: str | None = None,
+) -> AsyncCyberSourceSoap:
+    """
+    Get the shared :class:`AsyncCyberSourceSoap` client for the given
+    configuration and the running event loop.
+    """
+    soap = get_client(
+        wsdl=wsdl,
+        merchant_id=merchant_id,
+        pkcs12_data=pkcs12_data,
+        pkcs12_password=pkcs12_password,
+        wsdl_bundle=wsdl_bundle,
+    )
+    return await _async_registry.get(soap)
+
+
+@receiver(setting_changed)
+def on_setting_changed(*args: Any, **kwargs: Any) -> None:
+    # Drop any clients built from the old settings. They'll be rebuilt lazily
+    # from the new settings the next time they're needed.
+    _registry.clear()
+    _async_registry.clear()
+    _key_material.clear()
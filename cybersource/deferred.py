@@ -0,0 +1,226 @@
+"""
+Deferred authorization of Secure Acceptance payment tokens.
+
+When ``CYBERSOURCE["DEFERRED_AUTHORIZATION"]`` is enabled,
+:class:`~cybersource.views.CyberSourceReplyView` records the new payment
+token, queues a :class:`~cybersource.models.DeferredAuthorization`, and sends
+the user to the pending page. The authorization is then made by
+``manage.py process_cybersource_authorizations``, so the reply view never holds
+a database transaction open while waiting on Cybersource.
+"""
+
+from __future__ import annotations
+
+from decimal import Decimal
+from importlib import import_module
+from typing import TYPE_CHECKING
+import logging
+
+from django.conf import settings as djsettings
+from django.contrib.auth.models import AnonymousUser
+from django.db import transaction
+from django.db.models import F
+from django.http import HttpRequest
+from oscar.apps.order.exceptions import InvalidOrderStatus
+from oscar.core.loading import get_model
+from oscarapicheckout import utils
+from oscarapicheckout.states import Complete, Declined
+
+from . import actions
+from .constants import DeferredAuthorizationStatus
+from .models import CyberSourceReply, DeferredAuthorization, PaymentToken
+from .snapshot import order_snapshot_cache
+from .utils import decrypt_session_id
+
+_Order = get_model("order", "Order")
+
+if TYPE_CHECKING:
+    from oscar.apps.order.models import Order
+else:
+    Order = _Order
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_authorization(
+    order: Order,
+    reply_log_entry: CyberSourceReply,
+    token: PaymentToken,
+    method_key: str,
+    amount: Decimal,
+    request: HttpRequest,
+    encrypted_session_id: str,
+) -> DeferredAuthorization:
+    """
+    Queue an authorization of ``amount`` against the given token. Should be
+    called inside the transaction that recorded the token, so that the
+    authorization can't be picked up before the token exists.
+    """
+    return DeferredAuthorization.objects.create(
+        order=order,
+        log=reply_log_entry,
+        token=token,
+        method_key=method_key,
+        amount=amount,
+        encrypted_session_id=encrypted_session_id,
+        customer_ip_address=request.META.get("REMOTE_ADDR"),
+    )
+
+
+def claim_authorizations(limit: int) -> list[DeferredAuthorization]:
+    """
+    Claim up to ``limit`` of the oldest pending authorizations, marking them
+    as processing. Rows which another worker is claiming are skipped rather
+    than waited on, and the row locks are released as soon as the rows are
+    marked.
+    """
+    with transaction.atomic():
+        jobs = list(
+            DeferredAuthorization.objects.select_for_update(
+                skip_locked=True,
+                of=("self",),
+            )
+            .select_related("token", "log__user")
+            .filter(status=DeferredAuthorizationStatus.PENDING)
+            .order_by("date_created")[:limit]
+        )
+        DeferredAuthorization.objects.filter(pk__in=[job.pk for job in jobs]).update(
+            status=DeferredAuthorizationStatus.PROCESSING,
+            attempts=F("attempts") + 1,
+        )
+    for job in jobs:
+        job.status = DeferredAuthorizationStatus.PROCESSING
+        job.attempts += 1
+    return jobs
+
+
+def run_authorization(job: DeferredAuthorization) -> Complete | Declined:
+    """
+    Make a claimed authorization and record its result, both in the database
+    and in the customer's session.
+
+    A claimed authorization is never retried automatically: if the worker dies
+    while it's processing, Cybersource may or may not have authorized the
+    payment, so it's left for someone to look into.
+    """
+    request: HttpRequest | None = None
+    order: Order | None = None
+    state: Complete | Declined
+    try:
+        request = _get_job_request(job)
+        order = Order.objects.select_related("billing_address", "shipping_address").get(
+            pk=job.order_id
+        )
+        action = actions.AuthorizePayment(order, request, job.method_key)
+        with order_snapshot_cache():
+            # No transaction is open while we wait on Cybersource
+            response = action.api.authorize(
+                order,
+                token=job.token.token,
+                amount=job.amount,
+                request=request,
+                method_key=job.method_key,
+            )
+            if response is None:
+                # Cybersource may or may not have received the request
+                raise RuntimeError("No reply received from Cybersource")
+            with transaction.atomic():
+                order.refresh_from_db(
+                    from_queryset=Order.objects.select_for_update(of=("self",))
+                )
+                state = action.record_auth(
+                    response,
+                    token_string=job.token.token,
+                    amount=job.amount,
+                    update_session=True,
+                    token=job.token,
+                )
+                job.status = DeferredAuthorizationStatus.COMPLETE
+                job.save(update_fields=["status", "date_modified"])
+    except Exception:
+        logger.exception(
+            "Deferred authorization %s for order ID %s failed",
+            job.pk,
+            job.order_id,
+        )
+        state = _fail_authorization(
+            job,
+            order or job.order,
+            request or _get_fallback_request(),
+        )
+    # The fallback request's session isn't the customer's, so isn't kept
+    if request is not None:
+        request.session.save()
+    return state
+
+
+def process_authorizations(limit: int) -> int:
+    """
+    Claim and run up to ``limit`` pending authorizations. Returns the number
+    of authorizations run.
+    """
+    jobs = claim_authorizations(limit)
+    for job in jobs:
+        try:
+            run_authorization(job)
+        except Exception:
+            # Leave it processing, for someone to look into, but carry on with
+            # the rest of the batch.
+            logger.exception(
+                "Failed to record the failure of deferred authorization %s", job.pk
+            )
+    return len(jobs)
+
+
+def _fail_authorization(
+    job: DeferredAuthorization,
+    order: Order,
+    request: HttpRequest,
+) -> Declined:
+    with transaction.atomic():
+        job.status = DeferredAuthorizationStatus.FAILED
+        job.save(update_fields=["status", "date_modified"])
+        # Decline the payment, so that the user isn't left waiting on it
+        try:
+            utils.mark_payment_method_declined(
+                order, request, job.method_key, job.amount
+            )
+        except InvalidOrderStatus:
+            logger.exception(
+                "Failed to set Order %s to payment declined. Order is current in status %s. Examine DeferredAuthorization[%s]",
+                order.number,
+                order.status,
+                job.pk,
+            )
+    return Declined(job.amount)
+
+
+def _get_job_request(job: DeferredAuthorization) -> HttpRequest:
+    """
+    Build a stand-in for the customer's request, carrying their session, for
+    the actions and signals which expect one.
+    """
+    session_engine = import_module(djsettings.SESSION_ENGINE)
+    session_key = (
+        decrypt_session_id(job.encrypted_session_id)
+        if job.encrypted_session_id
+        else None
+    )
+    request = HttpRequest()
+    request.session = session_engine.SessionStore(session_key)
+    request.user = job.log.user or AnonymousUser()
+    if job.customer_ip_address:
+        request.META["REMOTE_ADDR"] = job.customer_ip_address
+    return request
+
+
+def _get_fallback_request() -> HttpRequest:
+    """
+    Build a request with a new, empty session, for when the customer's request
+    can't be rebuilt.
+    """
+    session_engine = import_module(djsettings.SESSION_ENGINE)
+    request = HttpRequest()
+    request.session = session_engine.SessionStore()
+    request.user = AnonymousUser()
+    return request
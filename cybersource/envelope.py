@@ -0,0 +1,281 @@
+from __future__ import annotations
+
+from collections.abc import Callable, Iterable, Mapping
+from types import MappingProxyType
+from typing import TYPE_CHECKING, Any, NamedTuple
+import logging
+
+from lxml import etree
+from zeep.wsdl.bindings.soap import Soap12Binding, SoapBinding
+from zeep.xsd import ComplexType, CompoundValue, Element, Sequence
+
+if TYPE_CHECKING:
+    from zeep.client import Client
+    from zeep.wsdl.bindings.soap import SoapOperation
+    from zeep.wsdl.definitions import Port
+
+logger = logging.getLogger(__name__)
+
+
+class UnsupportedEnvelope(Exception):
+    """
+    Raised when a request can't be serialized by the :class:`EnvelopeBuilder`,
+    in which case the caller should fall back to zeep's own serializer.
+    """
+
+
+def get_port(client: Client) -> Port:
+    """
+    The port which ``client.service`` uses (the first port of the WSDL's first
+    service), looked up through the WSDL document, rather than zeep's private
+    service proxy attributes.
+    """
+    service = next(iter(client.wsdl.services.values()))
+    return next(iter(service.ports.values()))
+
+
+def get_binding(client: Client) -> SoapBinding:
+    """
+    The SOAP binding of the port which ``client.service`` uses.
+    """
+    binding = get_port(client).binding
+    if not isinstance(binding, SoapBinding):
+        raise TypeError(f"Expected a SOAP binding, got {binding!r}")
+    return binding
+
+
+def build_http_headers(
+    client: Client,
+    binding: SoapBinding,
+    operation: SoapOperation,
+) -> dict[str, str]:
+    """
+    The HTTP headers which zeep sends a request for the given operation with.
+    """
+    # Mirrors the headers set by zeep.wsdl.messages.soap.SoapMessage.serialize
+    # and the binding.
+    soapaction = operation.soapaction
+    headers = {"SOAPAction": f'"{soapaction}"' if soapaction else '""'}
+    if isinstance(binding, Soap12Binding):
+        headers["Content-Type"] = (
+            f'application/soap+xml; charset=utf-8; action="{soapaction}"'
+        )
+    else:
+        headers["Content-Type"] = "text/xml; charset=utf-8"
+    if client.settings.extra_http_headers:
+        headers.update(client.settings.extra_http_headers)
+    return headers
+
+
+class AttributeTemplate(NamedTuple):
+    name: str
+    qname: str
+    xmlvalue: Callable[[Any], str]
+    pythonvalue: Callable[[str], Any]
+
+
+class ElementTemplate(NamedTuple):
+    """
+    Pre-computed instructions for rendering (or parsing) a single schema
+    element: its qualified name, how to convert a leaf value to and from XML,
+    and (for complex types) its attributes and child elements, in schema order.
+    """
+
+    name: str
+    qname: etree.QName
+    is_optional: bool
+    accepts_multiple: bool
+    xmlvalue: Callable[[Any], str] | None
+    pythonvalue: Callable[[str], Any] | None = None
+    attributes: tuple[AttributeTemplate, ...] = ()
+    children: tuple[ElementTemplate, ...] = ()
+    children_by_tag: Mapping[str, ElementTemplate] = MappingProxyType({})
+    field_names: frozenset[str] = frozenset()
+    unsupported: str | None = None
+
+
+def build_template(
+    name: str,
+    element: Element,
+    seen: frozenset[int] = frozenset(),
+) -> ElementTemplate:
+    """
+    Walk the schema for the given element once, recording everything needed
+    to render it.
+
+    Only plain sequences of elements and attributes are supported. Anything
+    else (choices, wildcards, recursive types, etc.) is marked as unsupported,
+    so that requests using it fall back to zeep.
+    """
+    xsd_type = element.type
+    template = ElementTemplate(
+        name=name,
+        qname=element.qname,
+        is_optional=element.is_optional,
+        accepts_multiple=element.accepts_multiple,
+        xmlvalue=None,
+    )
+    if not isinstance(xsd_type, ComplexType):
+        return template._replace(
+            xmlvalue=xsd_type.xmlvalue,
+            pythonvalue=xsd_type.pythonvalue,
+        )
+    if id(xsd_type) in seen:
+        return template._replace(unsupported=f"recursive type {xsd_type.name}")
+    elements = _plain_elements(xsd_type.elements_nested)
+    if elements is None:
+        return template._replace(unsupported=f"unsupported particle in {xsd_type.name}")
+    children = [
+        build_template(child_name, child, seen | {id(xsd_type)})
+        for child_name, child in elements
+    ]
+    attributes = tuple(
+        AttributeTemplate(
+            name=attr_name,
+            qname=attr.qname,
+            xmlvalue=attr.type.xmlvalue,
+            pythonvalue=attr.type.pythonvalue,
+        )
+        for attr_name, attr in xsd_type.attributes
+    )
+    return template._replace(
+        attributes=attributes,
+        children=tuple(children),
+        children_by_tag={child.qname.text: child for child in children},
+        field_names=frozenset(
+            [child.name for child in children] + [attr.name for attr in attributes]
+        ),
+    )
+
+
+def _plain_elements(
+    particles: Iterable[tuple[str, Any]],
+) -> list[tuple[str, Element]] | None:
+    """
+    Flatten (non-repeating) sequences into the list of elements they contain,
+    or return ``None`` if they contain anything else.
+    """
+    elements: list[tuple[str, Element]] = []
+    for name, particle in particles:
+        if isinstance(particle, Element):
+            if particle.qname is None:
+                return None
+            elements.append((name, particle))
+        elif isinstance(particle, Sequence) and not particle.accepts_multiple:
+            nested = _plain_elements((child.attr_name, child) for child in particle)
+            if nested is None:
+                return None
+            elements.extend(nested)
+        else:
+            return None
+    return elements
+
+
+def _render(parent: etree._Element, template: ElementTemplate, value: Any) -> None:
+    if value is None:
+        if template.is_optional:
+            return
+        raise UnsupportedEnvelope(f"Missing required element {template.name}")
+    if isinstance(value, list):
+        if not template.accepts_multiple:
+            raise UnsupportedEnvelope(f"Element {template.name} isn't repeatable")
+        for item in value:
+            _render(parent, template, item)
+        return
+    if template.unsupported:
+        raise UnsupportedEnvelope(template.unsupported)
+    node = etree.SubElement(parent, template.qname)
+    if template.xmlvalue is not None:
+        node.text = template.xmlvalue(value)
+        return
+    _render_children(node, template, value)
+
+
+def _render_children(
+    node: etree._Element,
+    template: ElementTemplate,
+    value: Mapping[str, Any] | CompoundValue,
+) -> None:
+    values = value.__values__ if isinstance(value, CompoundValue) else value
+    if not isinstance(values, Mapping):
+        raise UnsupportedEnvelope(f"Expected a complex value for {template.name}")
+    unknown = values.keys() - template.field_names
+    if unknown:
+        raise UnsupportedEnvelope(f"Unexpected fields {unknown} in {template.name}")
+    for attr in template.attributes:
+        attr_value = values.get(attr.name)
+        if attr_value is not None:
+            node.set(attr.qname, attr.xmlvalue(attr_value))
+    for child in template.children:
+        _render(node, child, values.get(child.name))
+
+
+class EnvelopeBuilder:
+    """
+    Serializes ``runTransaction`` requests straight into a SOAP envelope,
+    without zeep's per-request schema walk.
+
+    The schema is walked once, when the builder is created, to record each
+    element's name, order, and value serializer. Requests are then rendered
+    from that template. The output is identical to zeep's (see the test
+    suite), so it can be signed and sent in exactly the same way.
+    """
+
+    operation_name = "runTransaction"
+
+    def __init__(self, client: Client) -> None:
+        self.client = client
+        self.binding = get_binding(client)
+        self.operation: SoapOperation = self.binding.get(self.operation_name)
+        body = self.operation.input.body
+        self.template = build_template(body.qname.localname, body)
+        if self.template.unsupported:
+            raise UnsupportedEnvelope(self.template.unsupported)
+        self._soap_ns = self.operation.input.nsmap["soap-env"]
+        # zeep also declares any prefixes registered with
+        # Client.set_ns_prefix, which we never use.
+        self._nsmap = {"soap-env": self._soap_ns}
+        self.http_headers = build_http_headers(client, self.binding, self.operation)
+
+    def build(self, txndata: Mapping[str, Any]) -> etree._Element:
+        """
+        Render the given request data into an (unsigned) SOAP envelope.
+
+        Raises :class:`UnsupportedEnvelope` if the data doesn't fit the
+        template.
+        """
+        envelope = etree.Element(
+            etree.QName(self._soap_ns, "Envelope"), nsmap=self._nsmap
+        )
+        body = etree.SubElement(envelope, etree.QName(self._soap_ns, "Body"))
+        node = etree.SubElement(body, self.template.qname)
+        _render_children(node, self.template, txndata)
+        return envelope
+
+    def sign(
+        self,
+        envelope: etree._Element,
+    ) -> tuple[etree._Element, dict[str, str]]:
+        """
+        Apply WSSE to the given envelope, exactly as zeep would, and return it
+        along with the HTTP headers to send it with.
+        """
+        headers = dict(self.http_headers)
+        if self.client.wsse:
+            envelope, headers = self.client.wsse.apply(envelope, headers)
+        return envelope, headers
+
+
+def build_envelope_builder(client: Client) -> EnvelopeBuilder | None:
+    """
+    Build an :class:`EnvelopeBuilder` for the given client, or return
+    ``None`` (after logging why) if its schema isn't supported.
+    """
+    try:
+        return EnvelopeBuilder(client)
+    except UnsupportedEnvelope:
+        logger.warning(
+            "Unable to build a fast SOAP envelope template. Using zeep's serializer.",
+            exc_info=True,
+        )
+        return None
@@ -0,0 +1,144 @@
+"""
+Deferred processing of Decision Manager notifications.
+
+When ``CYBERSOURCE["DECISION_MANAGER_DEFERRED"]`` is enabled,
+:class:`~cybersource.views.DecisionManagerNotificationView` saves each
+notification as a :class:`~cybersource.models.DecisionManagerNotification`
+and acknowledges it right away, so the webhook's response time doesn't depend
+on the ``received_decision_manager_update`` receivers. The notifications are
+then applied by ``manage.py process_cybersource_notifications``.
+"""
+
+from __future__ import annotations
+
+from datetime import timedelta
+import logging
+import traceback
+
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .conf import settings
+from .constants import DecisionManagerNotificationStatus
+from .models import DecisionManagerNotification
+from .views import DecisionManagerNotificationView
+
+logger = logging.getLogger(__name__)
+
+#: Delay before the first retry of a failed notification. Doubles with each
+#: further attempt.
+RETRY_DELAY = timedelta(minutes=1)
+
+#: How long a notification may stay claimed before it's assumed that the worker
+#: processing it died, and it's claimed again. Should comfortably exceed the
+#: time taken to apply a notification.
+CLAIM_TIMEOUT = timedelta(minutes=15)
+
+
+def claim_notifications(limit: int) -> list[DecisionManagerNotification]:
+    """
+    Claim up to ``limit`` of the oldest pending notifications which are due,
+    marking them as processing. Rows which another worker is claiming are
+    skipped rather than waited on.
+
+    Notifications which have been processing for longer than
+    :data:`CLAIM_TIMEOUT` are claimed again, since their worker most likely
+    died. That counts as a failed attempt, so one which keeps killing its
+    worker is eventually marked as failed.
+    """
+    now = timezone.now()
+    stale = Q(
+        status=DecisionManagerNotificationStatus.PROCESSING,
+        date_modified__lt=now - CLAIM_TIMEOUT,
+    )
+    with transaction.atomic():
+        abandoned = DecisionManagerNotification.objects.filter(
+            stale,
+            attempts__gte=settings.DECISION_MANAGER_MAX_ATTEMPTS,
+        ).update(
+            status=DecisionManagerNotificationStatus.FAILED,
+            last_error="Timed out while processing",
+            date_modified=now,
+        )
+        if abandoned:
+            logger.warning(
+                "Gave up on %s Decision Manager notifications which timed out on their last attempt",
+                abandoned,
+            )
+        jobs = list(
+            DecisionManagerNotification.objects.select_for_update(skip_locked=True)
+            .filter(
+                Q(
+                    status=DecisionManagerNotificationStatus.PENDING,
+                    date_next_attempt__lte=now,
+                )
+                | stale
+            )
+            .order_by("date_next_attempt")[:limit]
+        )
+        # Bulk updates skip auto_now, but date_modified is what times out the
+        # claim, so it's set explicitly.
+        DecisionManagerNotification.objects.filter(
+            pk__in=[job.pk for job in jobs]
+        ).update(
+            status=DecisionManagerNotificationStatus.PROCESSING,
+            attempts=F("attempts") + 1,
+            date_modified=now,
+        )
+    for job in jobs:
+        job.status = DecisionManagerNotificationStatus.PROCESSING
+        job.attempts += 1
+        job.date_modified = now
+    return jobs
+
+
+def run_notification(job: DecisionManagerNotification) -> bool:
+    """
+    Apply a claimed notification. Returns whether it succeeded.
+
+    The whole notification is applied in one transaction, so a failed attempt
+    leaves nothing behind, and is retried later. Receivers of
+    ``received_decision_manager_update`` may therefore be sent the same update
+    more than once. Once ``CYBERSOURCE["DECISION_MANAGER_MAX_ATTEMPTS"]`` attempts
+    have failed, the notification is marked as failed and left for someone to
+    look into.
+    """
+    view = DecisionManagerNotificationView()
+    try:
+        with transaction.atomic():
+            view.handle_notification(job.content.encode())
+            job.status = DecisionManagerNotificationStatus.COMPLETE
+            job.save(update_fields=["status", "date_modified"])
+    except Exception:
+        logger.exception(
+            "Attempt %s to process Decision Manager notification %s failed",
+            job.attempts,
+            job.pk,
+        )
+        _retry_notification(job, traceback.format_exc())
+        return False
+    return True
+
+
+def process_notifications(limit: int) -> int:
+    """
+    Claim and run up to ``limit`` pending notifications. Returns the number of
+    notifications run.
+    """
+    jobs = claim_notifications(limit)
+    for job in jobs:
+        run_notification(job)
+    return len(jobs)
+
+
+def _retry_notification(job: DecisionManagerNotification, error: str) -> None:
+    job.last_error = error
+    if job.attempts >= settings.DECISION_MANAGER_MAX_ATTEMPTS:
+        job.status = DecisionManagerNotificationStatus.FAILED
+    else:
+        job.status = DecisionManagerNotificationStatus.PENDING
+        job.date_next_attempt = timezone.now() + RETRY_DELAY * 2 ** (job.attempts - 1)
+    job.save(
+        update_fields=["status", "last_error", "date_next_attempt", "date_modified"]
+    )
@@ -0,0 +1,76 @@
+from typing import Any
+import time
+
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+from zeep.transports import Transport
+import zeep
+import zeep.cache
+
+from ...conf import settings
+from ...wsdl import RecordingCache, WSDLBundleCache, write_bundle
+
+
+class Command(BaseCommand):
+    help = (
+        "Download the Cybersource transaction WSDL and every XSD it imports into a single bundle file. "
+        "Point the CYBERSOURCE WSDL_BUNDLE setting at the file to load the SOAP client without any network I/O."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            "--wsdl",
+            default=str(settings.WSDL),
+            help="WSDL URL to download. Defaults to the WSDL setting.",
+        )
+        parser.add_argument(
+            "--output",
+            default=settings.WSDL_BUNDLE,
+            help="Path to write the bundle to. Defaults to the WSDL_BUNDLE setting.",
+        )
+        parser.add_argument(
+            "--benchmark",
+            action="store_true",
+            help="Compare client boot and first-request latency with and without the bundle.",
+        )
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        wsdl = options["wsdl"]
+        output = options["output"]
+        if not output:
+            raise CommandError(
+                "No --output given and the WSDL_BUNDLE setting isn't set."
+            )
+
+        # Load the WSDL once, recording every document zeep fetches along the way.
+        recorder = RecordingCache()
+        zeep.Client(wsdl=wsdl, transport=Transport(cache=recorder))
+        write_bundle(output, wsdl=wsdl, documents=recorder.documents)
+        self.stdout.write(f"Wrote {len(recorder.documents)} documents to {output}")
+
+        if options["benchmark"]:
+            bundle = WSDLBundleCache.load(output)
+            self._benchmark("network", wsdl, None)
+            self._benchmark("bundle", wsdl, bundle)
+
+    def _benchmark(
+        self,
+        label: str,
+        wsdl: str,
+        cache: zeep.cache.Base | None,
+    ) -> None:
+        start = time.perf_counter()
+        client = zeep.Client(wsdl=wsdl, transport=Transport(cache=cache))
+        boot = time.perf_counter() - start
+        # Building the first message resolves the types used by runTransaction,
+        # which is the rest of the work a cold worker does before its first
+        # request hits the network.
+        client.create_message(
+            client.service,
+            "runTransaction",
+            merchantID="benchmark",
+            merchantReferenceCode="benchmark",
+        )
+        first_request = time.perf_counter() - start
+        self.stdout.write(
+            f"{label}: boot {boot * 1000:.1f}ms, first request {first_request * 1000:.1f}ms"
+        )
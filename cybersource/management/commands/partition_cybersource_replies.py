@@ -0,0 +1,67 @@
+from typing import Any
+
+from django.core.management.base import BaseCommand, CommandError, CommandParser
+from django.utils import timezone
+
+from ... import partitions
+
+
+class Command(BaseCommand):
+    help = (
+        "Maintain the monthly partitions of the CyberSourceReply table: create upcoming partitions, and detach "
+        "or drop expired ones. Should be run regularly (e.g. daily) once the table has been converted with "
+        "--convert."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            "--convert",
+            action="store_true",
+            help="Convert the table into a partitioned table first, if it isn't one already.",
+        )
+        parser.add_argument(
+            "--months-ahead",
+            type=int,
+            default=3,
+            help="Number of future months to create partitions for.",
+        )
+        parser.add_argument(
+            "--retain-months",
+            type=int,
+            default=None,
+            help="Expire partitions which only hold replies received before this many months ago.",
+        )
+        parser.add_argument(
+            "--drop",
+            action="store_true",
+            help="Drop expired partitions, rather than only detaching them.",
+        )
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        if not partitions.is_partitioned():
+            if not options["convert"]:
+                raise CommandError(
+                    "The CyberSourceReply table isn't partitioned. Run with --convert to convert it."
+                )
+            try:
+                partitions.convert()
+            except ValueError as e:
+                raise CommandError(str(e))
+            self.stdout.write("Converted the CyberSourceReply table")
+
+        for name in partitions.create_partitions(options["months_ahead"]):
+            self.stdout.write(f"Created partition {name}")
+
+        if options["retain_months"] is None:
+            return
+        cutoff = partitions.add_months(
+            partitions.month_start(timezone.now()),
+            -options["retain_months"],
+        )
+        try:
+            expired = partitions.expire_partitions(cutoff, drop=options["drop"])
+        except ValueError as e:
+            raise CommandError(str(e))
+        for name in expired:
+            action = "Dropped" if options["drop"] else "Detached"
+            self.stdout.write(f"{action} partition {name}")
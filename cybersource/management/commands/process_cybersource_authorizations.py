@@ -0,0 +1,42 @@
+from typing import Any
+import time
+
+from django.core.management.base import BaseCommand, CommandParser
+
+from ...deferred import process_authorizations
+
+
+class Command(BaseCommand):
+    help = (
+        "Make the payment authorizations queued by the Secure Acceptance reply view when the "
+        "CYBERSOURCE DEFERRED_AUTHORIZATION setting is enabled. Any number of these workers may run at once."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=10,
+            help="Number of authorizations to claim at a time.",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=1.0,
+            help="Seconds to wait before checking again once the queue is empty.",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Exit once the queue is empty, rather than waiting for more authorizations.",
+        )
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        while True:
+            count = process_authorizations(options["batch_size"])
+            if count:
+                self.stdout.write(f"Processed {count} authorizations")
+                continue
+            if options["once"]:
+                return
+            time.sleep(options["interval"])
@@ -0,0 +1,42 @@
+from typing import Any
+import time
+
+from django.core.management.base import BaseCommand, CommandParser
+
+from ...inbox import process_notifications
+
+
+class Command(BaseCommand):
+    help = (
+        "Apply the Decision Manager notifications queued by the notification view when the "
+        "CYBERSOURCE DECISION_MANAGER_DEFERRED setting is enabled. Any number of these workers may run at once."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=10,
+            help="Number of notifications to claim at a time.",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=1.0,
+            help="Seconds to wait before checking again once no notifications are due.",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Exit once no notifications are due, rather than waiting for more.",
+        )
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        while True:
+            count = process_notifications(options["batch_size"])
+            if count:
+                self.stdout.write(f"Processed {count} notifications")
+                continue
+            if options["once"]:
+                return
+            time.sleep(options["interval"])
@@ -0,0 +1,86 @@
+from datetime import timedelta
+from typing import Any
+import time
+
+from django.core.management.base import BaseCommand, CommandParser
+from django.utils import timezone
+
+from ...models import CyberSourceReply
+
+
+class Command(BaseCommand):
+    help = (
+        "Blank the raw reply data of CyberSourceReply rows older than the given number of days. Rows are "
+        "scrubbed in small batches, each its own short transaction, so it's safe to run against a live database."
+    )
+
+    def add_arguments(self, parser: CommandParser) -> None:
+        parser.add_argument(
+            "--days",
+            type=int,
+            required=True,
+            help="Scrub replies received more than this many days ago.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of replies to scrub at a time.",
+        )
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=0.1,
+            help="Seconds to wait between batches.",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Count the replies which would be scrubbed, without changing them.",
+        )
+
+    def handle(self, *args: Any, **options: Any) -> None:
+        cutoff = timezone.now() - timedelta(days=options["days"])
+        # Matches the partial cybersource_reply_scrub_cands index, so finding
+        # candidates never scans rows which have already been scrubbed.
+        candidates = CyberSourceReply.objects.filter(date_created__lt=cutoff).exclude(
+            data={}
+        )
+
+        if options["dry_run"]:
+            count = candidates.count()
+            self.stdout.write(f"Would scrub {count} replies received before {cutoff}")
+            return
+
+        total = 0
+        last_date_created = None
+        while True:
+            batch = candidates
+            # Scrubbed rows drop out of the candidates, so it's enough to
+            # resume from the last date seen. Walking forward, rather than
+            # restarting from the oldest candidate, skips the index entries
+            # of rows which were scrubbed by earlier batches.
+            if last_date_created is not None:
+                batch = batch.filter(date_created__gte=last_date_created)
+            rows = list(
+                batch.order_by("date_created").values_list("pk", "date_created")[
+                    : options["batch_size"]
+                ]
+            )
+            if not rows:
+                break
+            # A single UPDATE per batch, committed on its own, so that locks
+            # are short lived and vacuum can keep up.
+            count = (
+                CyberSourceReply.objects.filter(pk__in=[pk for pk, _date in rows])
+                .exclude(data={})
+                .update(data={})
+            )
+            total += count
+            last_date_created = rows[-1][1]
+            self.stdout.write(
+                f"Scrubbed {total} replies, up to those received at {last_date_created}"
+            )
+            if options["sleep"]:
+                time.sleep(options["sleep"])
+        self.stdout.write(f"Finished scrubbing {total} replies")
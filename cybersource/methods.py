@@ -151,18 +151,13 @@ class Bluefin(PaymentMethod[BluefinPaymentMethodData]):
             method_key=method_key,
         )
 
-        # Get token via SOAP
-        token, get_token_log = actions.GetPaymentToken(order, request, method_key)(
-            payment_data
+        # Get a token and authorize the payment via SOAP
+        action_cls = (
+            actions.TokenizeAndAuthorizePayment
+            if settings.BLUEFIN_COMBINED_AUTH
+            else actions.ProcessBluefinPayment
         )
-        if token is None or get_token_log is None:
-            return Declined(amount)
-
-        # Attempt to authorize payment via SOAP
-        new_state = actions.AuthorizePayment(order, request, method_key)(
-            token_string=token.token,
+        return action_cls(order, request, method_key)(
+            payment_data=payment_data,
             amount=amount,
-            update_session=False,
-            card_expiry_date=get_token_log.req_card_expiry_date,
         )
-        return new_state
@@ -0,0 +1,94 @@
+# Generated by Django 5.2.11 on 2026-03-02 10:14
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("cybersource", "0010_add_scrub_candidates_index"),
+        ("order", "0004_auto_20160111_1108"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DeferredAuthorization",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("method_key", models.CharField(max_length=128)),
+                ("amount", models.DecimalField(decimal_places=2, max_digits=12)),
+                ("encrypted_session_id", models.TextField(blank=True, default="")),
+                (
+                    "customer_ip_address",
+                    models.GenericIPAddressField(blank=True, null=True),
+                ),
+                (
+                    "status",
+                    models.SmallIntegerField(
+                        choices=[
+                            (1, "Pending"),
+                            (2, "Processing"),
+                            (3, "Complete"),
+                            (4, "Failed"),
+                        ],
+                        default=1,
+                    ),
+                ),
+                ("attempts", models.PositiveSmallIntegerField(default=0)),
+                (
+                    "date_modified",
+                    models.DateTimeField(auto_now=True, verbose_name="Date Modified"),
+                ),
+                (
+                    "date_created",
+                    models.DateTimeField(
+                        auto_now_add=True, verbose_name="Date Created"
+                    ),
+                ),
+                (
+                    "log",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="deferred_authorizations",
+                        to="cybersource.cybersourcereply",
+                    ),
+                ),
+                (
+                    "order",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="cybersource_deferred_authorizations",
+                        to="order.order",
+                    ),
+                ),
+                (
+                    "token",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="deferred_authorizations",
+                        to="cybersource.paymenttoken",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Deferred Authorization",
+                "verbose_name_plural": "Deferred Authorizations",
+                "ordering": ("date_created",),
+                "indexes": [
+                    models.Index(
+                        condition=models.Q(("status", 1)),
+                        fields=["date_created"],
+                        name="cybersource_deferred_pending",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.11 on 2026-03-09 15:31
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("cybersource", "0011_deferredauthorization"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ProcessedReply",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("key", models.CharField(max_length=100, unique=True)),
+                ("redirect_url", models.CharField(max_length=2000)),
+                ("duplicate_count", models.PositiveIntegerField(default=0)),
+                (
+                    "date_modified",
+                    models.DateTimeField(auto_now=True, verbose_name="Date Modified"),
+                ),
+                (
+                    "date_created",
+                    models.DateTimeField(
+                        auto_now_add=True, verbose_name="Date Created"
+                    ),
+                ),
+                (
+                    "log",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="processed_replies",
+                        to="cybersource.cybersourcereply",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Processed Reply",
+                "verbose_name_plural": "Processed Replies",
+            },
+        ),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 5.2.11 on 2026-03-16 11:02
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("cybersource", "0012_processedreply"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DecisionManagerNotification",
+            fields=[
+                (
+                    "id",
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("content", models.TextField()),
+                (
+                    "status",
+                    models.SmallIntegerField(
+                        choices=[
+                            (1, "Pending"),
+                            (2, "Processing"),
+                            (3, "Complete"),
+                            (4, "Failed"),
+                        ],
+                        default=1,
+                    ),
+                ),
+                ("attempts", models.PositiveSmallIntegerField(default=0)),
+                ("last_error", models.TextField(blank=True, default="")),
+                (
+                    "date_next_attempt",
+                    models.DateTimeField(default=django.utils.timezone.now),
+                ),
+                (
+                    "date_modified",
+                    models.DateTimeField(auto_now=True, verbose_name="Date Modified"),
+                ),
+                (
+                    "date_created",
+                    models.DateTimeField(
+                        auto_now_add=True, verbose_name="Date Created"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Decision Manager Notification",
+                "verbose_name_plural": "Decision Manager Notifications",
+                "ordering": ("date_created",),
+                "indexes": [
+                    models.Index(
+                        condition=models.Q(("status", 1)),
+                        fields=["date_next_attempt"],
+                        name="cybersource_dm_pending",
+                    )
+                ],
+            },
+        ),
+    ]
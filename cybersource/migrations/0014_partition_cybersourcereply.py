@@ -0,0 +1,13 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    # Intentionally empty. Partitioning the reply table is left to
+    # `manage.py partition_cybersource_replies --convert`, rather than done
+    # here, so that every install has the same schema after migrating.
+
+    dependencies = [
+        ("cybersource", "0013_decisionmanagernotification"),
+    ]
+
+    operations: list[migrations.operations.base.Operation] = []
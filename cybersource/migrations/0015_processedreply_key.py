@@ -0,0 +1,17 @@
+# Generated by Django 5.2.11 on 2026-10-18 20:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("cybersource", "0014_partition_cybersourcereply"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="processedreply",
+            name="key",
+            field=models.CharField(max_length=255, unique=True),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.11 on 2026-10-18 20:26
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("cybersource", "0015_processedreply_key"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="deferredauthorization",
+            name="log",
+            field=models.ForeignKey(
+                db_constraint=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="deferred_authorizations",
+                to="cybersource.cybersourcereply",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="paymenttoken",
+            name="log",
+            field=models.ForeignKey(
+                db_constraint=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="tokens",
+                to="cybersource.cybersourcereply",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="processedreply",
+            name="log",
+            field=models.ForeignKey(
+                db_constraint=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="processed_replies",
+                to="cybersource.cybersourcereply",
+            ),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.11 on 2026-10-18 20:26
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("cybersource", "0016_reply_log_db_constraint"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="processedreply",
+            name="log",
+            field=models.ForeignKey(
+                db_constraint=False,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="processed_replies",
+                to="cybersource.cybersourcereply",
+            ),
+        ),
+    ]
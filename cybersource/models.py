@@ -1,13 +1,21 @@
 from __future__ import annotations
 
+from collections import OrderedDict
+from collections.abc import Mapping
 from datetime import datetime
 from typing import TYPE_CHECKING, Any, ClassVar, Self
 import logging
+import threading
+import time
 
 from cryptography.fernet import InvalidToken
 from django.contrib.postgres.fields import HStoreField
-from django.db import models
-from django.db.models import Q
+from django.core.cache import cache
+from django.core.signals import setting_changed
+from django.db import connections, models, router, transaction
+from django.db.models import F, Q, Sum
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from django.http import HttpRequest
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
@@ -20,9 +28,14 @@ from thelabdb.fields import EncryptedTextField
 import dateutil.parser
 
 from .conf import settings as cyb_settings
-from .constants import CyberSourceReplyType, Decision
+from .constants import (
+    CyberSourceReplyType,
+    Decision,
+    DecisionManagerNotificationStatus,
+    DeferredAuthorizationStatus,
+)
 from .cybersoap import SoapResponse
-from .utils import get_request_data, zeepobj_to_dict
+from .utils import KeyFilter, get_request_data, zeepobj_to_dict
 
 if TYPE_CHECKING:
     from oscar.apps.order.models import Order
@@ -57,6 +70,21 @@ class SecureAcceptanceProfile(models.Model):
 
     @classmethod
     def get_profile(cls, hostname: str) -> Self:
+        """
+        Get the profile to use for the given hostname.
+
+        Lookups are cached in-process (see :class:`SecureAcceptanceProfileCache`),
+        so the returned instance may be shared and must not be modified.
+        """
+        profile = _profile_cache.get(hostname)
+        if isinstance(profile, cls):
+            return profile
+        profile = cls._get_profile(hostname)
+        _profile_cache.set(hostname, profile)
+        return profile
+
+    @classmethod
+    def _get_profile(cls, hostname: str) -> Self:
         # Lambda function to get profiles whilst catching cryptography exceptions (in-case the Fernet key
         # unexpectedly changed, the data somehow got corrupted, etc).
         def _get_safe(**filters: str | bool) -> Self | None:
@@ -108,7 +136,104 @@ class SecureAcceptanceProfile(models.Model):
         ) % {"hostname": self.hostname, "profile_id": self.profile_id}
 
 
+class SecureAcceptanceProfileCache:
+    """
+    Thread-safe, per-process TTL/LRU cache of
+    :meth:`SecureAcceptanceProfile.get_profile` lookups, keyed by the lowercase
+    hostname.
+
+    Profiles are cached with their secret key already decrypted, so a cache
+    hit costs neither a query nor a Fernet decryption. Saving or deleting a
+    profile clears the cache. If ``PROFILE_CACHE_VERSION_KEY`` is set, it also
+    bumps a version number stored under that key in Django's cache, which
+    tells every other process to clear theirs too.
+    """
+
+    def __init__(self) -> None:
+        self._entries: OrderedDict[str, tuple[float, SecureAcceptanceProfile]] = (
+            OrderedDict()
+        )
+        self._lock = threading.Lock()
+        self._version: int | None = None
+
+    def get(self, hostname: str) -> SecureAcceptanceProfile | None:
+        if cyb_settings.PROFILE_CACHE_TTL <= 0:
+            return None
+        self._check_version()
+        key = hostname.lower()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, profile = entry
+            if expires <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+        return profile
+
+    def set(self, hostname: str, profile: SecureAcceptanceProfile) -> None:
+        ttl = cyb_settings.PROFILE_CACHE_TTL
+        if ttl <= 0:
+            return
+        key = hostname.lower()
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, profile)
+            self._entries.move_to_end(key)
+            while len(self._entries) > cyb_settings.PROFILE_CACHE_MAXSIZE:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def invalidate(self) -> None:
+        """
+        Clear this process's cache, and tell other processes to clear theirs.
+        """
+        self.clear()
+        version_key = cyb_settings.PROFILE_CACHE_VERSION_KEY
+        if version_key:
+            try:
+                cache.incr(version_key)
+            except ValueError:
+                # The key doesn't exist (yet, or any more)
+                cache.add(version_key, 1, timeout=None)
+
+    def _check_version(self) -> None:
+        version_key = cyb_settings.PROFILE_CACHE_VERSION_KEY
+        if not version_key:
+            return
+        version = cache.get(version_key, 0)
+        if version != self._version:
+            with self._lock:
+                self._entries.clear()
+                self._version = version
+
+
+_profile_cache = SecureAcceptanceProfileCache()
+
+
+@receiver(post_save, sender=SecureAcceptanceProfile)
+@receiver(post_delete, sender=SecureAcceptanceProfile)
+def on_profile_changed(*args: Any, **kwargs: Any) -> None:
+    # Drop cached profiles now, so that this connection sees the change. Then
+    # once it's committed (and visible to other connections), drop them again
+    # and tell other processes to do the same.
+    _profile_cache.clear()
+    transaction.on_commit(_profile_cache.invalidate)
+
+
+@receiver(setting_changed)
+def on_setting_changed(*args: Any, **kwargs: Any) -> None:
+    _profile_cache.clear()
+
+
 class CyberSourceReply(models.Model):
+    # Foreign keys which reference this model don't have database constraints
+    # (db_constraint=False), since PostgreSQL only allows them to reference a
+    # partitioned table if they include the partition key. See partitions.py.
+
     # Reply Metadata
     user = models.ForeignKey(
         AUTH_USER_MODEL,
@@ -207,11 +332,21 @@ class CyberSourceReply(models.Model):
         request: HttpRequest | None = None,
         card_expiry_date: str | None = None,
     ) -> Self:
-        reply_data = zeepobj_to_dict(response)
+        log_fields = cyb_settings.SOAP_REPLY_LOG_FIELDS
+        reply_data = zeepobj_to_dict(
+            response,
+            key_filter=KeyFilter(log_fields) if log_fields is not None else None,
+        )
         user = request.user if request and request.user.is_authenticated else None
         req_transaction_type = None
-        if getattr(response, "paySubscriptionCreateReply", None):
+        if getattr(response, "ccAuthReply", None):
+            req_transaction_type = "authorization"
+        elif getattr(response, "paySubscriptionCreateReply", None):
             req_transaction_type = "create_payment_token"
+        elif getattr(response, "afsReply", None):
+            req_transaction_type = "fraud_screen"
+        elif getattr(response, "ccAuthReversalReply", None):
+            req_transaction_type = "auth_reversal"
         else:
             req_transaction_type = "authorization"
         baddr = order.billing_address
@@ -311,6 +446,70 @@ class CyberSourceReply(models.Model):
         return Decision.ERROR
 
 
+class ProcessedReply(models.Model):
+    """
+    Where a handled Secure Acceptance reply sent the user, so that retried and
+    double-submitted copies of the reply can be answered the same way, without
+    handling them again.
+    """
+
+    key = models.CharField(max_length=255, unique=True)
+    log = models.ForeignKey(
+        CyberSourceReply,
+        related_name="processed_replies",
+        null=True,
+        on_delete=models.SET_NULL,
+        db_constraint=False,
+    )
+    redirect_url = models.CharField(max_length=2000)
+    duplicate_count = models.PositiveIntegerField(default=0)
+
+    date_modified = models.DateTimeField(_("Date Modified"), auto_now=True)
+    date_created = models.DateTimeField(_("Date Created"), auto_now_add=True)
+
+    class Meta(TypedModelMeta):
+        verbose_name = _("Processed Reply")
+        verbose_name_plural = _("Processed Replies")
+
+    @staticmethod
+    def get_key(data: Mapping[str, Any]) -> str | None:
+        """
+        Identify a reply by the order and the UUID of the form submission it
+        answers, or if that's missing, by its (globally unique) transaction ID.
+        """
+        transaction_uuid = data.get("req_transaction_uuid")
+        reference_number = data.get("req_reference_number")
+        if transaction_uuid and reference_number:
+            return f"uuid:{reference_number}:{transaction_uuid}"
+        if transaction_id := data.get("transaction_id"):
+            return f"txn:{transaction_id}"
+        return None
+
+    @classmethod
+    def get_duplicate_rate(cls) -> float:
+        """
+        The fraction of all received replies which were duplicates.
+        """
+        totals = cls.objects.aggregate(
+            replies=models.Count("pk"),
+            duplicates=Sum("duplicate_count"),
+        )
+        duplicates = totals["duplicates"] or 0
+        if not duplicates:
+            return 0.0
+        return duplicates / (totals["replies"] + duplicates)
+
+    def record_duplicate(self) -> None:
+        type(self).objects.filter(pk=self.pk).update(
+            duplicate_count=F("duplicate_count") + 1,
+            date_modified=timezone.now(),
+        )
+        self.duplicate_count += 1
+
+    def __str__(self) -> str:
+        return self.key
+
+
 class PaymentToken(models.Model):
     TYPES: ClassVar[dict[str, str]] = {
         "001": "Visa",
@@ -338,6 +537,7 @@ class PaymentToken(models.Model):
         CyberSourceReply,
         related_name="tokens",
         on_delete=models.CASCADE,
+        db_constraint=False,
     )
     token = models.CharField(max_length=100, unique=True)
     masked_card_number = models.CharField(max_length=25)
@@ -347,6 +547,52 @@ class PaymentToken(models.Model):
         verbose_name = _("Payment Token")
         verbose_name_plural = _("Payment Token")
 
+    @classmethod
+    def record(
+        cls,
+        log: CyberSourceReply,
+        token: str,
+        masked_card_number: str,
+        card_type: str,
+    ) -> Self:
+        """
+        Save a new payment token, or if the token has already been saved, get
+        the existing row, using a single ``INSERT ... ON CONFLICT`` statement.
+        Concurrent calls for the same token get the same row, rather than one
+        of them failing on the unique constraint.
+        """
+        db = router.db_for_write(cls)
+        connection = connections[db]
+        qn = connection.ops.quote_name
+        columns: dict[str, str] = {}
+        attnames: list[str] = []
+        for field in cls._meta.concrete_fields:
+            # Concrete fields always have a column
+            if field.column is not None:
+                columns[field.name] = qn(field.column)
+                attnames.append(field.attname)
+        values: dict[str, Any] = {
+            "log": log.pk,
+            "token": token,
+            "masked_card_number": masked_card_number,
+            "card_type": card_type,
+        }
+        insert_columns = ", ".join(columns[name] for name in values)
+        # Updating the conflicting row with its own value (rather than doing
+        # nothing) is what makes Postgres return it.
+        token_column = columns["token"]
+        sql = (
+            f"INSERT INTO {qn(cls._meta.db_table)} ({insert_columns}) "
+            f"VALUES ({', '.join(['%s'] * len(values))}) "
+            f"ON CONFLICT ({token_column}) "
+            f"DO UPDATE SET {token_column} = EXCLUDED.{token_column} "
+            f"RETURNING {', '.join(columns.values())}"
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, list(values.values()))
+            row = cursor.fetchone()
+        return cls.from_db(db, attnames, row)
+
     def log_field(self, key: str, default: str = "") -> str:
         return self.log.data.get(key, default)
 
@@ -382,6 +628,99 @@ class PaymentToken(models.Model):
         return self.masked_card_number
 
 
+class DeferredAuthorization(models.Model):
+    """
+    An authorization, against a newly created payment token, which is waiting
+    to be made by ``manage.py process_cybersource_authorizations``. Only used
+    when ``CYBERSOURCE["DEFERRED_AUTHORIZATION"]`` is enabled.
+    """
+
+    order = models.ForeignKey(
+        "order.Order",
+        related_name="cybersource_deferred_authorizations",
+        on_delete=models.CASCADE,
+    )
+    log = models.ForeignKey(
+        CyberSourceReply,
+        related_name="deferred_authorizations",
+        on_delete=models.CASCADE,
+        db_constraint=False,
+    )
+    token = models.ForeignKey(
+        PaymentToken,
+        related_name="deferred_authorizations",
+        on_delete=models.CASCADE,
+    )
+    method_key = models.CharField(max_length=128)
+    amount = models.DecimalField(decimal_places=2, max_digits=12)
+    # The customer's session ID, encrypted the same way as it was round-tripped
+    # through Secure Acceptance, so that the payment state can be updated.
+    encrypted_session_id = models.TextField(blank=True, default="")
+    customer_ip_address = models.GenericIPAddressField(null=True, blank=True)
+
+    status = models.SmallIntegerField(
+        choices=DeferredAuthorizationStatus.choices,
+        default=DeferredAuthorizationStatus.PENDING,
+    )
+    attempts = models.PositiveSmallIntegerField(default=0)
+
+    date_modified = models.DateTimeField(_("Date Modified"), auto_now=True)
+    date_created = models.DateTimeField(_("Date Created"), auto_now_add=True)
+
+    class Meta(TypedModelMeta):
+        verbose_name = _("Deferred Authorization")
+        verbose_name_plural = _("Deferred Authorizations")
+        ordering = ("date_created",)
+        indexes: ClassVar = [
+            models.Index(
+                fields=["date_created"],
+                name="cybersource_deferred_pending",
+                condition=Q(status=DeferredAuthorizationStatus.PENDING),
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return _("Deferred Authorization %(created)s") % {"created": self.date_created}
+
+
+class DecisionManagerNotification(models.Model):
+    """
+    A Decision Manager notification, as received, which is waiting to be
+    applied by ``manage.py process_cybersource_notifications``. Only used when
+    ``CYBERSOURCE["DECISION_MANAGER_DEFERRED"]`` is enabled.
+    """
+
+    content = models.TextField()
+
+    status = models.SmallIntegerField(
+        choices=DecisionManagerNotificationStatus.choices,
+        default=DecisionManagerNotificationStatus.PENDING,
+    )
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True, default="")
+
+    date_next_attempt = models.DateTimeField(default=timezone.now)
+    date_modified = models.DateTimeField(_("Date Modified"), auto_now=True)
+    date_created = models.DateTimeField(_("Date Created"), auto_now_add=True)
+
+    class Meta(TypedModelMeta):
+        verbose_name = _("Decision Manager Notification")
+        verbose_name_plural = _("Decision Manager Notifications")
+        ordering = ("date_created",)
+        indexes: ClassVar = [
+            models.Index(
+                fields=["date_next_attempt"],
+                name="cybersource_dm_pending",
+                condition=Q(status=DecisionManagerNotificationStatus.PENDING),
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return _("Decision Manager Notification %(created)s") % {
+            "created": self.date_created
+        }
+
+
 class TransactionMixin(AbstractTransaction):  # type: ignore[override]  # auto-generated get_next_by/get_previous_by return type mismatch
     log = models.ForeignKey(
         CyberSourceReply,
@@ -389,6 +728,7 @@ class TransactionMixin(AbstractTransaction):  # type: ignore[override]  # auto-g
         null=True,
         blank=True,
         on_delete=models.SET_NULL,
+        db_constraint=False,
     )
     token = models.ForeignKey(
         PaymentToken,
@@ -0,0 +1,136 @@
+"""
+Streaming parser for Decision Manager (Case Management Order Status)
+notifications.
+"""
+
+from __future__ import annotations
+
+from collections.abc import Iterator
+from io import BytesIO
+from typing import TYPE_CHECKING, NamedTuple
+
+from django.utils.encoding import force_str
+from lxml import etree
+
+if TYPE_CHECKING:
+    from lxml.etree import _Element
+
+
+class DecisionManagerNote(NamedTuple):
+    added_by: str
+    comment: str
+    date: str
+
+
+class DecisionManagerUpdate(NamedTuple):
+    order_number: str
+    request_id: str
+    new_decision: str | None
+    reviewer: str | None
+    reviewer_comments: str | None
+    notes: tuple[DecisionManagerNote, ...]
+    #: The ``<Update>`` element itself. It's cleared once the next update is
+    #: read, so it must not be kept around.
+    element: _Element
+
+    @classmethod
+    def from_element(cls, elem: _Element) -> DecisionManagerUpdate:
+        # A single pass over the update's children, rather than an XPath query
+        # per field
+        children: dict[str | None, _Element] = {}
+        notes: list[DecisionManagerNote] = []
+        for child in elem:
+            name = _local_name(child)
+            if name == "Notes":
+                notes.extend(
+                    DecisionManagerNote(
+                        added_by=force_str(note.attrib["AddedBy"]),
+                        comment=force_str(note.attrib["Comment"]),
+                        date=force_str(note.attrib["Date"]),
+                    )
+                    for note in child
+                    if _local_name(note) == "Note"
+                )
+            else:
+                children.setdefault(name, child)
+        new_decision = children.get("NewDecision")
+        reviewer = children.get("Reviewer")
+        reviewer_comments = children.get("ReviewerComments")
+        return cls(
+            order_number=force_str(elem.attrib["MerchantReferenceNumber"]),
+            request_id=force_str(elem.attrib["RequestID"]),
+            new_decision=(
+                force_str(new_decision.text) if new_decision is not None else None
+            ),
+            reviewer=reviewer.text if reviewer is not None else "",
+            reviewer_comments=(
+                reviewer_comments.text if reviewer_comments is not None else ""
+            ),
+            notes=tuple(notes),
+            element=elem,
+        )
+
+
+def iter_updates(content: bytes) -> Iterator[DecisionManagerUpdate]:
+    """
+    Yield each ``<Update>`` in a Decision Manager notification, in document
+    order. Each update's element is freed once the next one is read, so memory
+    use doesn't grow with the number of updates in the notification.
+    """
+    for elem in _iter_update_elements(content):
+        yield DecisionManagerUpdate.from_element(elem)
+        _free(elem)
+
+
+def iter_update_batches(
+    content: bytes,
+    batch_size: int,
+) -> Iterator[list[DecisionManagerUpdate]]:
+    """
+    Like :func:`iter_updates`, but yield the updates in lists of up to
+    ``batch_size``. Every element of a batch is freed once the caller moves on
+    to the next batch.
+    """
+    batch: list[DecisionManagerUpdate] = []
+    for elem in _iter_update_elements(content):
+        batch.append(DecisionManagerUpdate.from_element(elem))
+        if len(batch) >= batch_size:
+            yield batch
+            for update in batch:
+                _free(update.element)
+            batch = []
+    if batch:
+        yield batch
+
+
+def _iter_update_elements(content: bytes) -> Iterator[_Element]:
+    context = etree.iterparse(
+        BytesIO(content),
+        events=("end",),
+        tag="{*}Update",
+        resolve_entities=False,
+        no_network=True,
+    )
+    for _event, elem in context:
+        yield elem
+
+
+def _free(elem: _Element) -> None:
+    """
+    Free the given element, and remove it and everything before it from the
+    tree.
+    """
+    elem.clear()
+    parent = elem.getparent()
+    if parent is None:
+        return
+    while elem.getprevious() is not None:
+        del parent[0]
+
+
+def _local_name(elem: _Element) -> str | None:
+    tag = elem.tag
+    if not isinstance(tag, str):
+        # Comments and processing instructions
+        return None
+    return tag.rpartition("}")[2]
@@ -0,0 +1,394 @@
+"""
+Optional PostgreSQL range partitioning of the :class:`CyberSourceReply` log
+table by ``date_created``, one partition per month.
+
+Once the table is partitioned, expired replies are removed by detaching (and
+optionally dropping) whole partitions, rather than by deleting or scrubbing
+rows one batch at a time. The table is converted, and its partitions
+maintained, by ``manage.py partition_cybersource_replies``.
+
+PostgreSQL doesn't allow foreign keys to reference a partitioned table unless
+they include the partition key, so the foreign keys which reference
+:class:`CyberSourceReply` are declared with ``db_constraint=False``, and the
+table can't be converted while any other foreign key constraint references it.
+Django still applies their ``on_delete`` behavior, and
+:func:`expire_partitions` applies it before removing a partition.
+"""
+
+from __future__ import annotations
+
+from datetime import UTC, datetime
+from typing import NamedTuple
+import re
+
+from django.db import connections, models, router, transaction
+from django.db.backends.base.base import BaseDatabaseWrapper
+from django.db.models.expressions import RawSQL
+from django.utils import timezone
+import dateutil.parser
+
+from .models import CyberSourceReply, PaymentToken
+
+_BOUND_RE = re.compile(r"FROM \((?P<lower>.+?)\) TO \((?P<upper>.+?)\)")
+_INDEX_RE = re.compile(r"^CREATE (?P<unique>UNIQUE )?INDEX \S+ ON \S+ ")
+
+# PostgreSQL's limit on the length of identifiers
+_MAX_NAME_LENGTH = 63
+
+
+class ReplyPartition(NamedTuple):
+    name: str
+    #: Inclusive lower bound, or ``None`` if the partition has no lower bound.
+    lower: datetime | None
+    #: Exclusive upper bound, or ``None`` if the partition has no upper bound.
+    upper: datetime | None
+    is_default: bool
+
+
+def month_start(dt: datetime) -> datetime:
+    """
+    The start of the (UTC) month containing the given time.
+    """
+    return dt.astimezone(UTC).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def add_months(dt: datetime, months: int) -> datetime:
+    years, month = divmod(dt.month - 1 + months, 12)
+    return dt.replace(year=dt.year + years, month=month + 1)
+
+
+def is_partitioned(using: str | None = None) -> bool:
+    connection = _get_connection(using)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT relkind FROM pg_class WHERE oid = %s::regclass",
+            [_get_table()],
+        )
+        row = cursor.fetchone()
+    return row is not None and row[0] == "p"
+
+
+def list_partitions(using: str | None = None) -> list[ReplyPartition]:
+    """
+    List the partitions of the reply table, oldest first, and the default
+    partition last.
+    """
+    connection = _get_connection(using)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) "
+            "FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = %s::regclass",
+            [_get_table()],
+        )
+        rows = cursor.fetchall()
+    partitions = []
+    for name, bound in rows:
+        match = _BOUND_RE.search(bound)
+        if match is None:
+            partitions.append(ReplyPartition(name, None, None, is_default=True))
+            continue
+        partitions.append(
+            ReplyPartition(
+                name,
+                _parse_bound(match["lower"]),
+                _parse_bound(match["upper"]),
+                is_default=False,
+            )
+        )
+    return sorted(
+        partitions,
+        key=lambda p: (
+            p.is_default,
+            p.lower or datetime.min.replace(tzinfo=UTC),
+        ),
+    )
+
+
+def convert(using: str | None = None, now: datetime | None = None) -> None:
+    """
+    Convert the reply table into a partitioned table. The existing table
+    becomes its first partition, holding every reply received before the start
+    of next month, so no rows are copied. A default partition catches replies
+    which don't fall into any monthly partition.
+
+    The slow steps (building an index, and validating the existing rows
+    against the first partition's bound) don't block writes. The table is
+    then locked while it's converted, which only changes the catalog.
+
+    Raises ``ValueError`` if a foreign key constraint references the table.
+    Such foreign keys must be declared with ``db_constraint=False`` first.
+    """
+    connection = _get_connection(using)
+    qn = connection.ops.quote_name
+    table = _get_table()
+    legacy = _get_name(table, "_legacy")
+    legacy_pkey = _get_name(legacy, "_pkey")
+    id_date_index = _get_name(table, "_id_date_uniq")
+    bound_check = _get_name(table, "_legacy_bound")
+    boundary = add_months(month_start(now or timezone.now()), 1)
+
+    referencing = _get_referencing_constraints(connection)
+    if referencing:
+        raise ValueError(
+            f"Can't partition {table} while foreign key constraints reference it: "
+            f"{', '.join(referencing)}. Declare them with db_constraint=False."
+        )
+
+    # Must run outside of a transaction, for CREATE INDEX CONCURRENTLY
+    with connection.cursor() as cursor:
+        # PostgreSQL requires the primary key to include the partition key
+        cursor.execute(
+            f"CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS {qn(id_date_index)} "
+            f"ON {qn(table)} (id, date_created)"
+        )
+        # Lets the table be attached as a partition without scanning it
+        cursor.execute(
+            f"ALTER TABLE {qn(table)} DROP CONSTRAINT IF EXISTS {qn(bound_check)}"
+        )
+        cursor.execute(
+            f"ALTER TABLE {qn(table)} ADD CONSTRAINT {qn(bound_check)} "
+            f"CHECK (date_created < {_literal(boundary)}) NOT VALID"
+        )
+        cursor.execute(f"ALTER TABLE {qn(table)} VALIDATE CONSTRAINT {qn(bound_check)}")
+
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        cursor.execute(f"LOCK TABLE {qn(table)} IN ACCESS EXCLUSIVE MODE")
+
+        cursor.execute(
+            "SELECT pg_get_serial_sequence(%s, 'id'), attidentity <> '' "
+            "FROM pg_attribute WHERE attrelid = %s::regclass AND attname = 'id'",
+            [table, table],
+        )
+        sequence, is_identity = cursor.fetchone()
+        cursor.execute(f"SELECT last_value, is_called FROM {sequence}")
+        last_value, is_called = cursor.fetchone()
+
+        # Collect the table's own foreign keys and indexes, to recreate on the
+        # partitioned table
+        cursor.execute(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+            "WHERE conrelid = %s::regclass AND contype = 'f'",
+            [table],
+        )
+        foreign_keys = cursor.fetchall()
+        cursor.execute(
+            "SELECT conname FROM pg_constraint "
+            "WHERE conrelid = %s::regclass AND contype = 'p'",
+            [table],
+        )
+        (pkey,) = cursor.fetchone()
+        cursor.execute(
+            "SELECT i.relname, pg_get_indexdef(i.oid) "
+            "FROM pg_index x JOIN pg_class i ON i.oid = x.indexrelid "
+            "WHERE x.indrelid = %s::regclass AND NOT x.indisprimary "
+            "AND i.relname <> %s",
+            [table, id_date_index],
+        )
+        indexes = cursor.fetchall()
+
+        # Move the existing table, and its indexes, out of the way
+        cursor.execute(f"ALTER TABLE {qn(table)} DROP CONSTRAINT {qn(pkey)}")
+        cursor.execute(f"ALTER TABLE {qn(table)} RENAME TO {qn(legacy)}")
+        cursor.execute(
+            f"ALTER TABLE {qn(legacy)} ADD CONSTRAINT {qn(legacy_pkey)} "
+            f"PRIMARY KEY USING INDEX {qn(id_date_index)}"
+        )
+        for name, _definition in indexes:
+            cursor.execute(
+                f"ALTER INDEX {qn(name)} RENAME TO {qn(_get_name(name, '_legacy'))}"
+            )
+
+        # The ID sequence moves to the partitioned table, so that it isn't
+        # dropped along with the old table.
+        if is_identity:
+            cursor.execute(f"ALTER TABLE {qn(legacy)} ALTER COLUMN id DROP IDENTITY")
+            cursor.execute(f"CREATE SEQUENCE {sequence}")
+            cursor.execute(
+                "SELECT setval(%s, %s, %s)", [sequence, last_value, is_called]
+            )
+        else:
+            cursor.execute(f"ALTER TABLE {qn(legacy)} ALTER COLUMN id DROP DEFAULT")
+
+        cursor.execute(
+            f"CREATE TABLE {qn(table)} "
+            f"(LIKE {qn(legacy)} INCLUDING DEFAULTS INCLUDING STORAGE) "
+            f"PARTITION BY RANGE (date_created)"
+        )
+        cursor.execute(
+            f"ALTER TABLE {qn(table)} ADD CONSTRAINT {qn(pkey)} "
+            f"PRIMARY KEY (id, date_created)"
+        )
+        cursor.execute(
+            f"ALTER TABLE {qn(table)} ALTER COLUMN id "
+            f"SET DEFAULT nextval('{sequence}'::regclass)"
+        )
+        cursor.execute(f"ALTER SEQUENCE {sequence} OWNED BY {qn(table)}.id")
+        for name, definition in indexes:
+            cursor.execute(_rewrite_index(definition, qn(name), qn(table)))
+        for name, definition in foreign_keys:
+            cursor.execute(
+                f"ALTER TABLE {qn(table)} ADD CONSTRAINT {qn(name)} {definition}"
+            )
+
+        # Existing indexes and foreign keys of the old table are reused
+        cursor.execute(
+            f"ALTER TABLE {qn(table)} ATTACH PARTITION {qn(legacy)} "
+            f"FOR VALUES FROM (MINVALUE) TO ({_literal(boundary)})"
+        )
+        cursor.execute(f"ALTER TABLE {qn(legacy)} DROP CONSTRAINT {qn(bound_check)}")
+        cursor.execute(
+            f"CREATE TABLE {qn(_get_name(table, '_default'))} "
+            f"PARTITION OF {qn(table)} DEFAULT"
+        )
+
+
+def create_partitions(
+    months_ahead: int = 3,
+    using: str | None = None,
+    now: datetime | None = None,
+) -> list[str]:
+    """
+    Create the monthly partitions, from this month until ``months_ahead``
+    months from now, which don't already exist. Returns the names of the
+    partitions created.
+
+    Should be run regularly, so that replies are never sent to the default
+    partition. A partition can't be created while the default partition holds
+    replies which belong in it.
+    """
+    connection = _get_connection(using)
+    qn = connection.ops.quote_name
+    table = _get_table()
+    existing = list_partitions(using=connection.alias)
+    start = month_start(now or timezone.now())
+    created = []
+    for i in range(months_ahead + 1):
+        lower = add_months(start, i)
+        upper = add_months(lower, 1)
+        if any(_overlaps(p, lower, upper) for p in existing):
+            continue
+        name = _get_name(table, f"_p{lower:%Y%m}")
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE TABLE {qn(name)} PARTITION OF {qn(table)} "
+                f"FOR VALUES FROM ({_literal(lower)}) TO ({_literal(upper)})"
+            )
+        created.append(name)
+    return created
+
+
+def expire_partitions(
+    before: datetime,
+    drop: bool = False,
+    using: str | None = None,
+) -> list[str]:
+    """
+    Detach every partition which only holds replies received before the given
+    time, and if ``drop`` is set, drop it. Returns the names of the expired
+    partitions.
+
+    Rows which reference the expired replies are first deleted or updated, as
+    their foreign key's ``on_delete`` requires. Raises ``ValueError``, leaving
+    the partition in place, if it holds the reply which created a saved
+    payment token.
+    """
+    connection = _get_connection(using)
+    qn = connection.ops.quote_name
+    table = _get_table()
+    expired = []
+    for partition in list_partitions(using=connection.alias):
+        if partition.is_default or partition.upper is None:
+            continue
+        if partition.upper > before:
+            continue
+        with transaction.atomic(using=connection.alias):
+            _release_dependents(partition.name, connection)
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"ALTER TABLE {qn(table)} DETACH PARTITION {qn(partition.name)}"
+                )
+                if drop:
+                    cursor.execute(f"DROP TABLE {qn(partition.name)}")
+        expired.append(partition.name)
+    return expired
+
+
+def _release_dependents(partition: str, connection: BaseDatabaseWrapper) -> None:
+    reply_ids = RawSQL(
+        f"SELECT id FROM {connection.ops.quote_name(partition)}",
+        (),
+    )
+    # Payment tokens are customers' saved cards, so must never be deleted
+    # along with the replies which created them.
+    tokens = PaymentToken._base_manager.using(connection.alias).filter(
+        log_id__in=reply_ids
+    )
+    if tokens.exists():
+        raise ValueError(
+            f"Can't expire partition {partition}: it holds the replies which "
+            f"created {tokens.count()} saved payment tokens"
+        )
+    for rel in CyberSourceReply._meta.related_objects:
+        if rel.many_to_many:
+            continue
+        related = rel.related_model._base_manager.using(connection.alias).filter(
+            **{f"{rel.field.attname}__in": reply_ids}
+        )
+        if rel.on_delete is models.CASCADE:
+            related.delete()
+        elif rel.on_delete is models.SET_NULL:
+            related.update(**{rel.field.attname: None})
+        elif rel.on_delete is not models.DO_NOTHING and related.exists():
+            raise ValueError(
+                f"Can't expire partition {partition}: it's still referenced by "
+                f"{rel.related_model._meta.label}.{rel.field.name}"
+            )
+
+
+def _get_referencing_constraints(connection: BaseDatabaseWrapper) -> list[str]:
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT conrelid::regclass::text || '.' || conname FROM pg_constraint "
+            "WHERE confrelid = %s::regclass AND contype = 'f'",
+            [_get_table()],
+        )
+        return [name for (name,) in cursor.fetchall()]
+
+
+def _get_connection(using: str | None) -> BaseDatabaseWrapper:
+    return connections[using or router.db_for_write(CyberSourceReply)]
+
+
+def _get_table() -> str:
+    return CyberSourceReply._meta.db_table
+
+
+def _get_name(base: str, suffix: str) -> str:
+    return base[: _MAX_NAME_LENGTH - len(suffix)] + suffix
+
+
+def _literal(dt: datetime) -> str:
+    return f"'{dt.isoformat()}'"
+
+
+def _parse_bound(value: str) -> datetime | None:
+    if value in ("MINVALUE", "MAXVALUE"):
+        return None
+    return dateutil.parser.parse(value.strip("'"))
+
+
+def _overlaps(partition: ReplyPartition, lower: datetime, upper: datetime) -> bool:
+    if partition.is_default:
+        return False
+    return (partition.lower is None or partition.lower < upper) and (
+        partition.upper is None or partition.upper > lower
+    )
+
+
+def _rewrite_index(definition: str, name: str, table: str) -> str:
+    match = _INDEX_RE.match(definition)
+    if match is None:
+        raise ValueError(f"Unrecognized index definition: {definition}")
+    unique = match["unique"] or ""
+    return f"CREATE {unique}INDEX {name} ON {table} {definition[match.end() :]}"
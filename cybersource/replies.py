@@ -0,0 +1,212 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Any
+import io
+import logging
+
+from lxml import etree
+from zeep.xsd.const import xsi_ns
+
+from .envelope import ElementTemplate, build_template, get_binding
+
+if TYPE_CHECKING:
+    from requests import Response
+    from zeep.client import Client
+
+    from .utils import FlattenedZeepDict
+
+logger = logging.getLogger(__name__)
+
+_XSI_NIL = xsi_ns("nil")
+
+
+class ReplyValue(dict[str, Any]):
+    """
+    A parsed complex element from a SOAP reply. Fields can be read either as
+    keys or as attributes. Like zeep's ``CompoundValue``, fields which weren't
+    in the reply read as ``None``, and a value is truthy even if it's empty.
+    """
+
+    def __getattr__(self, name: str) -> Any:
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return self.get(name)
+
+    def __bool__(self) -> bool:
+        return True
+
+
+class Reply(ReplyValue):
+    """
+    A parsed ``replyMessage``. Also carries the flattened copy of itself
+    which is logged to :class:`cybersource.models.CyberSourceReply`.
+    """
+
+    flattened: FlattenedZeepDict
+
+
+class _Frame:
+    __slots__ = ("key", "template", "value")
+
+    def __init__(
+        self,
+        template: ElementTemplate,
+        key: str,
+        value: ReplyValue | None,
+    ) -> None:
+        self.template = template
+        self.key = key
+        self.value = value
+
+
+class ReplyParser:
+    """
+    Parses ``runTransaction`` replies in a single streaming pass, producing
+    both the typed reply object read by the actions and the flattened dict
+    that's logged, without going through zeep's ``CompoundValue`` and
+    ``serialize_object``.
+
+    The reply schema is walked once, when the parser is created. Each value
+    is converted with the same schema type as zeep would use, so the results
+    match zeep's (see the test suite). Replies which don't match the schema
+    (including SOAP faults) aren't handled, and :meth:`parse` returns
+    ``None`` so that the caller can fall back to zeep.
+    """
+
+    operation_name = "runTransaction"
+
+    def __init__(self, client: Client) -> None:
+        operation = get_binding(client).get(self.operation_name)
+        body = operation.output.body
+        self.template = build_template(body.qname.localname, body)
+        self.body_tag = etree.QName(operation.output.nsmap["soap-env"], "Body").text
+
+    def parse_response(self, response: Response) -> Reply | None:
+        if response.status_code != 200 or not response.content:
+            return None
+        return self.parse(response.content)
+
+    def parse(self, content: bytes) -> Reply | None:
+        try:
+            return self._parse(content)
+        except etree.XMLSyntaxError:
+            logger.debug("Unable to parse SOAP reply", exc_info=True)
+            return None
+
+    def _parse(self, content: bytes) -> Reply | None:
+        events = etree.iterparse(
+            io.BytesIO(content),
+            events=("start", "end"),
+            resolve_entities=False,
+            no_network=True,
+            remove_comments=True,
+        )
+        flattened: FlattenedZeepDict = {}
+        stack: list[_Frame] = []
+        reply: Reply | None = None
+        in_body = False
+        for event, elem in events:
+            if not in_body:
+                in_body = event == "start" and elem.tag == self.body_tag
+                continue
+            if event == "start":
+                if not stack:
+                    if reply is not None or elem.tag != self.template.qname.text:
+                        # A fault, or an unexpected body
+                        return None
+                    reply = Reply()
+                    stack.append(_Frame(self.template, "", reply))
+                    continue
+                parent = stack[-1]
+                template = parent.template.children_by_tag.get(elem.tag)
+                if template is None or template.unsupported:
+                    return None
+                key = self._key(parent, template)
+                value = None
+                if template.pythonvalue is None:
+                    value = ReplyValue()
+                    self._parse_attributes(elem, template, key, value, flattened)
+                stack.append(_Frame(template, key, value))
+            elif stack:
+                frame = stack.pop()
+                if not stack:
+                    # End of the replyMessage. Ignore the rest of the envelope.
+                    break
+                template = frame.template
+                if elem.get(_XSI_NIL) == "true":
+                    value = None
+                elif template.pythonvalue is None:
+                    value = frame.value
+                else:
+                    value = self._pythonvalue(template.pythonvalue, elem.text)
+                    if value is not None:
+                        flattened[frame.key] = value
+                parent_value = stack[-1].value
+                if parent_value is not None:
+                    self._assign(parent_value, template, value)
+                elem.clear()
+            elif elem.tag == self.body_tag:
+                break
+        if reply is None:
+            return None
+        reply.flattened = flattened
+        return reply
+
+    def _key(self, parent: _Frame, template: ElementTemplate) -> str:
+        key = f"{parent.key}.{template.name}" if parent.key else template.name
+        if template.accepts_multiple and parent.value is not None:
+            siblings = parent.value.get(template.name) or []
+            key = f"{key}[{len(siblings)}]"
+        return key
+
+    def _parse_attributes(
+        self,
+        elem: etree._Element,
+        template: ElementTemplate,
+        key: str,
+        value: ReplyValue,
+        flattened: FlattenedZeepDict,
+    ) -> None:
+        for attr in template.attributes:
+            raw = elem.get(attr.qname)
+            if raw is None:
+                continue
+            attr_value = self._pythonvalue(attr.pythonvalue, raw)
+            value[attr.name] = attr_value
+            if attr_value is not None:
+                flattened[f"{key}.{attr.name}"] = attr_value
+
+    def _pythonvalue(self, pythonvalue: Any, text: str | None) -> Any:
+        if text is None:
+            return None
+        try:
+            return pythonvalue(text)
+        except (TypeError, ValueError):
+            logger.exception("Error during xml -> python translation")
+            return None
+
+    def _assign(
+        self,
+        parent: ReplyValue,
+        template: ElementTemplate,
+        value: Any,
+    ) -> None:
+        if template.accepts_multiple:
+            parent.setdefault(template.name, []).append(value)
+        else:
+            parent[template.name] = value
+
+
+def build_reply_parser(client: Client) -> ReplyParser | None:
+    """
+    Build a :class:`ReplyParser` for the given client, or return ``None``
+    (after logging why) if its schema isn't supported.
+    """
+    parser = ReplyParser(client)
+    if parser.template.unsupported:
+        logger.warning(
+            "Unable to build a fast SOAP reply parser (%s). Using zeep's parser.",
+            parser.template.unsupported,
+        )
+        return None
+    return parser
@@ -5,3 +5,5 @@ pre_build_get_token_request = django.dispatch.Signal()
 pre_build_auth_request = django.dispatch.Signal()
 
 received_decision_manager_update = django.dispatch.Signal()
+
+received_duplicate_reply = django.dispatch.Signal()
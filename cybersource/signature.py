@@ -1,6 +1,7 @@
 from __future__ import annotations
 
-from collections.abc import Mapping, Sequence
+from collections.abc import Iterable, Mapping, Sequence
+from functools import lru_cache
 from typing import TYPE_CHECKING
 import base64
 import hashlib
@@ -16,16 +17,36 @@ class SecureAcceptanceSigner:
     def __init__(self, secret_key: str) -> None:
         self.secret_key = secret_key
 
+    @property
+    def secret_key(self) -> str:
+        return self._secret_key
+
+    @secret_key.setter
+    def secret_key(self, secret_key: str) -> None:
+        self._secret_key = secret_key
+        # Key the HMAC once, then copy it for each message
+        self._hmac = hmac.new(secret_key.encode("utf-8"), digestmod=hashlib.sha256)
+
     def sign(
         self,
         data: Mapping[str, str | tuple[str]],
         signed_fields: Sequence[str] | set[str],
     ) -> bytes:
-        key = self.secret_key.encode("utf-8")
-        msg_raw = self._build_message(data, signed_fields).encode("utf-8")
-        msg_hmac = hmac.new(key, msg_raw, hashlib.sha256)
+        msg_hmac = self._hmac.copy()
+        msg_hmac.update(self._build_message(data, signed_fields).encode("utf-8"))
         return base64.b64encode(msg_hmac.digest())
 
+    def sign_many(
+        self,
+        messages: Iterable[
+            tuple[Mapping[str, str | tuple[str]], Sequence[str] | set[str]]
+        ],
+    ) -> list[bytes]:
+        """
+        Sign each of the given ``(data, signed_fields)`` pairs.
+        """
+        return [self.sign(data, signed_fields) for data, signed_fields in messages]
+
     def verify_request(self, request: HttpRequest) -> bool:
         # Ensure the signature is valid and that this request can be trusted
         signed_field_names_str = request.POST.get("signed_field_names")
@@ -41,7 +62,14 @@ class SecureAcceptanceSigner:
         data: Mapping[str, str | tuple[str]],
         signed_fields: Sequence[str] | set[str],
     ) -> str:
-        parts = []
-        for field in signed_fields:
-            parts.append("{}={}".format(field, data.get(field, "")))
-        return ",".join(parts)
+        get = data.get
+        return ",".join([f"{field}={get(field, '')}" for field in signed_fields])
+
+
+@lru_cache(maxsize=32)
+def get_signer(secret_key: str) -> SecureAcceptanceSigner:
+    """
+    Get a shared signer for the given secret key, so that the keyed HMAC is
+    only set up once per profile. The returned signer must not be modified.
+    """
+    return SecureAcceptanceSigner(secret_key)
@@ -0,0 +1,219 @@
+from __future__ import annotations
+
+from collections.abc import Iterable, Iterator, Sequence
+from contextlib import contextmanager
+from contextvars import ContextVar
+from decimal import Decimal
+from typing import TYPE_CHECKING, NamedTuple
+import copy
+
+from django.db.models import Prefetch, prefetch_related_objects
+
+if TYPE_CHECKING:
+    from oscar.apps.order.models import BillingAddress, Line, Order, ShippingAddress
+    from phonenumber_field.phonenumber import PhoneNumber
+
+#: The snapshots shared within the current :func:`order_snapshot_cache` block,
+#: keyed by the ``id`` of the order instance they were taken from (which is
+#: kept alongside, so the ``id`` can't be reused while the block is open).
+_snapshots: ContextVar[dict[int, tuple[Order, OrderSnapshot]] | None] = ContextVar(
+    "cybersource_order_snapshots", default=None
+)
+
+
+class AddressSnapshot(NamedTuple):
+    first_name: str
+    last_name: str
+    line1: str
+    line2: str
+    line4: str
+    state: str
+    postcode: str
+    country_code: str
+    phone_number: PhoneNumber | None = None
+
+    @classmethod
+    def from_address(
+        cls,
+        address: BillingAddress | ShippingAddress,
+    ) -> AddressSnapshot:
+        return cls(
+            first_name=address.first_name,
+            last_name=address.last_name,
+            line1=address.line1,
+            line2=address.line2,
+            line4=address.line4,
+            state=address.state,
+            postcode=address.postcode,
+            # Country's primary key is its ISO 3166-1 alpha-2 code, so there's
+            # no need to fetch the country itself.
+            country_code=address.country_id,
+            phone_number=getattr(address, "phone_number", None),
+        )
+
+
+class LineSnapshot(NamedTuple):
+    line: Line
+    product_title: str
+    partner_sku: str
+    quantity: int
+    unit_price_incl_tax: Decimal | None
+
+
+class OrderSnapshot(NamedTuple):
+    """
+    Immutable copy of the order data sent to Cybersource.
+
+    Token, authorization, and fraud screen requests for the same order all
+    send the same addresses and line items, so within an
+    :func:`order_snapshot_cache` block we load them once (with their related
+    objects) rather than once per request.
+    """
+
+    number: str
+    currency: str
+    email: str
+    user_id: int | None
+    shipping_code: str
+    billing_address: AddressSnapshot | None
+    shipping_address: AddressSnapshot | None
+    lines: tuple[LineSnapshot, ...]
+
+    @classmethod
+    def from_order(cls, order: Order) -> OrderSnapshot:
+        return cls._from_prefetched(_load_order_data([order])[0])
+
+    @classmethod
+    def _from_prefetched(cls, order: Order) -> OrderSnapshot:
+        return cls(
+            number=order.number,
+            currency=order.currency,
+            email=order.email,
+            user_id=order.user_id,
+            shipping_code=str(order.shipping_code),
+            billing_address=(
+                AddressSnapshot.from_address(order.billing_address)
+                if order.billing_address
+                else None
+            ),
+            shipping_address=(
+                AddressSnapshot.from_address(order.shipping_address)
+                if order.shipping_address
+                else None
+            ),
+            lines=tuple(
+                LineSnapshot(
+                    line=line,
+                    product_title=(
+                        line.product.title if line.product is not None else ""
+                    ),
+                    partner_sku=line.partner_sku,
+                    quantity=line.quantity,
+                    unit_price_incl_tax=line.unit_price_incl_tax,
+                )
+                for line in order.lines.all()
+            ),
+        )
+
+
+def _load_order_data(orders: Sequence[Order]) -> list[Order]:
+    """
+    Load the addresses and lines (with their products) of all the given
+    orders, with one query each.
+
+    The data is loaded onto (and returned on) copies of the orders, so the
+    caller's instances are left as they were. Related objects already cached
+    on them are reused.
+    """
+    copies = [_copy_order(order) for order in orders]
+    if not copies:
+        return copies
+    line_model = copies[0].lines.model
+    addresses = [
+        name
+        for name in ("billing_address", "shipping_address")
+        if any(getattr(order, f"{name}_id") is not None for order in copies)
+    ]
+    prefetch_related_objects(
+        copies,
+        *addresses,
+        Prefetch(
+            "lines",
+            queryset=line_model._default_manager.select_related("product"),
+        ),
+    )
+    return copies
+
+
+def _copy_order(order: Order) -> Order:
+    clone = copy.copy(order)
+    # Model.__getstate__ copies the related object cache, but not the
+    # prefetched objects cache.
+    prefetched = order.__dict__.get("_prefetched_objects_cache")
+    if prefetched is not None:
+        clone.__dict__["_prefetched_objects_cache"] = dict(prefetched)
+    return clone
+
+
+@contextmanager
+def order_snapshot_cache() -> Iterator[None]:
+    """
+    Share each order's :class:`OrderSnapshot` between all the requests built
+    within the block, e.g. the token, fraud screen, and authorization requests
+    for one payment.
+
+    Outside of a block every request loads the order data afresh, so a
+    snapshot never outlives the work it was taken for (and never misses later
+    changes to the order's lines or addresses). Nested blocks share the
+    outermost block's snapshots.
+    """
+    if _snapshots.get() is not None:
+        yield
+        return
+    token = _snapshots.set({})
+    try:
+        yield
+    finally:
+        _snapshots.reset(token)
+
+
+def get_order_snapshot(order: Order) -> OrderSnapshot:
+    """
+    Get the :class:`OrderSnapshot` for the given order. Within an
+    :func:`order_snapshot_cache` block, it's only built on first use.
+    """
+    snapshots = _snapshots.get()
+    if snapshots is None:
+        return OrderSnapshot.from_order(order)
+    cached = snapshots.get(id(order))
+    if cached is None:
+        cached = snapshots[id(order)] = (order, OrderSnapshot.from_order(order))
+    return cached[1]
+
+
+def prefetch_order_snapshots(orders: Iterable[Order]) -> None:
+    """
+    Within an :func:`order_snapshot_cache` block, build the
+    :class:`OrderSnapshot` for each of the given orders that doesn't already
+    have one. The orders' addresses and lines are loaded together, so the
+    number of queries doesn't depend on the number of orders.
+
+    Outside of a block, this does nothing, since the snapshots wouldn't be kept.
+    """
+    snapshots = _snapshots.get()
+    if snapshots is None:
+        return
+    pending = [order for order in orders if id(order) not in snapshots]
+    for order, loaded in zip(pending, _load_order_data(pending), strict=True):
+        snapshots[id(order)] = (order, OrderSnapshot._from_prefetched(loaded))
+
+
+def clear_order_snapshot(order: Order) -> None:
+    """
+    Discard the snapshot kept for the given order by the current
+    :func:`order_snapshot_cache` block, e.g. after editing its lines or
+    addresses.
+    """
+    snapshots = _snapshots.get()
+    if snapshots is not None:
+        snapshots.pop(id(order), None)
@@ -0,0 +1,52 @@
+from collections.abc import Callable
+from typing import Any
+from unittest import skipUnless
+import os
+import sys
+import timeit
+
+#: Benchmarks are slow and their results depend on the machine, so they only
+#: run when ``CYBERSOURCE_BENCHMARKS`` is set in the environment, e.g.
+#: ``CYBERSOURCE_BENCHMARKS=1 python manage.py test cybersource``.
+BENCHMARKS_ENABLED = bool(os.environ.get("CYBERSOURCE_BENCHMARKS"))
+
+benchmark = skipUnless(BENCHMARKS_ENABLED, "Set CYBERSOURCE_BENCHMARKS=1 to run")
+
+
+def best_of(
+    func: Callable[[], Any],
+    number: int = 200,
+    repeat: int = 5,
+) -> float:
+    """
+    Return the best per-call time, in seconds, of ``repeat`` runs of
+    ``number`` calls to ``func``.
+    """
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number
+
+
+def report(name: str, baseline: float, candidate: float) -> float:
+    """
+    Print a comparison of two per-call timings and return the speedup.
+    """
+    speedup = baseline / candidate
+    sys.stderr.write(
+        f"\n{name}: {baseline * 1e6:.1f}us -> {candidate * 1e6:.1f}us "
+        f"({speedup:.1f}x)\n"
+    )
+    return speedup
+
+
+def report_throughput(
+    name: str, count: int, baseline: float, candidate: float
+) -> float:
+    """
+    Print a comparison of two timings of ``count`` items as items per second,
+    and return the speedup.
+    """
+    speedup = baseline / candidate
+    sys.stderr.write(
+        f"\n{name}: {count / baseline:.0f}/s -> {count / candidate:.0f}/s "
+        f"({speedup:.1f}x)\n"
+    )
+    return speedup
@@ -10,12 +10,23 @@ if TYPE_CHECKING:
 _base = Path(__file__).resolve().parent / "responses/"
 
 SOAP_AFS_ACCEPT = (_base / "soap-afs-accept.xml").read_text()
+SOAP_TOKEN_CREATE_AUTH_AFS_REJECT = (
+    _base / "soap-token-create-auth-afs-reject.xml"
+).read_text()
 SOAP_AFS_REVIEW = (_base / "soap-afs-review.xml").read_text()
 SOAP_AFS_REJECT = (_base / "soap-afs-reject.xml").read_text()
 
 SOAP_AUTH_ACCEPT = (_base / "soap-auth-accept.xml").read_text()
 SOAP_AUTH_REVIEW = (_base / "soap-auth-review.xml").read_text()
 SOAP_AUTH_REJECT = (_base / "soap-auth-reject.xml").read_text()
+SOAP_AUTH_REVERSAL_ACCEPT = (_base / "soap-auth-reversal-accept.xml").read_text()
+
+SOAP_TOKEN_CREATE_ACCEPT = (_base / "soap-token-create-accept.xml").read_text()
+SOAP_TOKEN_CREATE_REJECT = (_base / "soap-token-create-reject.xml").read_text()
+SOAP_TOKEN_RETRIEVE_ACCEPT = (_base / "soap-token-retrieve-accept.xml").read_text()
+SOAP_TOKEN_CREATE_AUTH_ACCEPT = (
+    _base / "soap-token-create-auth-accept.xml"
+).read_text()
 
 
 def mock_soap_transaction_response(rmock: "Mocker", resp_xml: str) -> None:
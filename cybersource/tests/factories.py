@@ -1,10 +1,85 @@
-from datetime import UTC, datetime
+from datetime import UTC, datetime, timedelta
+from functools import cache
+from pathlib import Path
 from random import randrange
+import base64
 import uuid
 
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.hazmat.primitives.serialization import BestAvailableEncryption
+from cryptography.hazmat.primitives.serialization.pkcs12 import (
+    serialize_key_and_certificates,
+)
+from cryptography.x509.oid import NameOID
+from django.conf import settings as djsettings
+
 from ..models import SecureAcceptanceProfile
 from ..signature import SecureAcceptanceSigner
 from ..utils import encrypt_session_id
+from ..wsdl import write_bundle
+
+TEST_WSDL_DIR = Path(__file__).resolve().parent.parent / "test" / "wsdl"
+TEST_WSDL = "https://ics2wstesta.ic3.com/commerce/1.x/transactionProcessor/CyberSourceTransaction_test.wsdl"
+TEST_XSD = "https://ics2wstesta.ic3.com/commerce/1.x/transactionProcessor/CyberSourceTransaction_test.xsd"
+
+
+@cache
+def build_pkcs12(password=b"password", common_name="cybersource-test"):
+    """Build a self-signed PKCS12 bundle, like the one downloaded from the Business Center"""
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, common_name)])
+    now = datetime.now(UTC)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now)
+        .not_valid_after(now + timedelta(days=1))
+        .sign(key, hashes.SHA256())
+    )
+    return serialize_key_and_certificates(
+        name=common_name.encode(),
+        key=key,
+        cert=cert,
+        cas=None,
+        encryption_algorithm=BestAvailableEncryption(password),
+    )
+
+
+def build_test_wsdl_bundle(path):
+    """
+    Write a WSDL bundle holding the trimmed down test WSDL and XSD to the given
+    path, and return the URL it's registered under.
+    """
+    documents = {
+        TEST_WSDL: (TEST_WSDL_DIR / "CyberSourceTransaction_test.wsdl").read_bytes(),
+        TEST_XSD: (TEST_WSDL_DIR / "CyberSourceTransaction_test.xsd").read_bytes(),
+    }
+    write_bundle(path, wsdl=TEST_WSDL, documents=documents)
+    return TEST_WSDL
+
+
+def soap_test_settings(bundle_path, **overrides):
+    """
+    Build a CYBERSOURCE settings dict that points the SOAP client at the test
+    WSDL bundle and a throwaway certificate, so no network I/O is needed to
+    build a client.
+    """
+    return (
+        djsettings.CYBERSOURCE
+        | {
+            "MERCHANT_ID": "cybersource-test",
+            "WSDL": TEST_WSDL,
+            "WSDL_BUNDLE": str(bundle_path),
+            "PKCS12_DATA": base64.b64encode(build_pkcs12()).decode(),
+            "PKCS12_PASSWORD": base64.b64encode(b"password").decode(),
+        }
+        | overrides
+    )
 
 
 def get_sa_profile():
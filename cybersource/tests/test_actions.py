@@ -0,0 +1,386 @@
+from decimal import Decimal as D
+from unittest import mock
+import tempfile
+import threading
+
+from django.test import TestCase, override_settings
+from oscar.core.loading import get_model
+from oscar.test import factories
+from oscarapicheckout.states import Complete, Declined
+import requests_mock
+
+from ..actions import (
+    CreatePaymentToken,
+    ProcessBluefinPayment,
+    TokenizeAndAuthorizePayment,
+)
+from ..cybersoap import CyberSourceSoap
+from ..models import CyberSourceReply, PaymentToken, SecureAcceptanceProfile
+from ..signature import SecureAcceptanceSigner
+from ..test import benchmark, responses
+from . import factories as cs_factories
+
+Order = get_model("order", "Order")
+Transaction = get_model("payment", "Transaction")
+
+
+class BaseBluefinActionTest(TestCase):
+    action_class = ProcessBluefinPayment
+
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.bundle_path = f"{tmpdir.name}/cybersource-wsdl.json"
+        cs_factories.build_test_wsdl_bundle(self.bundle_path)
+        self.order = factories.create_order()
+        self.replies = {
+            b"paySubscriptionCreateService": responses.SOAP_TOKEN_CREATE_ACCEPT,
+            b"paySubscriptionRetrieveService": responses.SOAP_TOKEN_RETRIEVE_ACCEPT,
+            b"ccAuthService": responses.SOAP_AUTH_ACCEPT,
+            b"afsService": responses.SOAP_AFS_ACCEPT,
+            b"ccAuthReversalService": responses.SOAP_AUTH_REVERSAL_ACCEPT,
+        }
+        self.sent = []
+        self.sent_bodies = []
+        # Services whose requests must both be in flight before either is
+        # allowed to go out
+        self.concurrent = ()
+
+    def _respond(self, request, context):
+        self.sent_bodies.append(request.body)
+        for service, reply in self.replies.items():
+            if service in request.body:
+                self.sent.append(service)
+                return reply
+        raise AssertionError("Unexpected SOAP request")
+
+    def _run_transaction(self, barrier):
+        run_transaction = CyberSourceSoap.run_transaction
+
+        def wrapper(api, order, txndata):
+            # Wait here, rather than in the requests_mock callback, since
+            # requests_mock only handles one request at a time.
+            if any(service in txndata for service in self.concurrent):
+                barrier.wait(timeout=5)
+            return run_transaction(api, order, txndata)
+
+        return wrapper
+
+    def _process(self, fraud_screen=False):
+        soap_settings = cs_factories.soap_test_settings(
+            self.bundle_path,
+            BLUEFIN_FRAUD_SCREEN=fraud_screen,
+        )
+        barrier = threading.Barrier(2)
+        with (
+            override_settings(CYBERSOURCE=soap_settings),
+            requests_mock.mock() as rmock,
+            mock.patch.object(
+                CyberSourceSoap, "run_transaction", self._run_transaction(barrier)
+            ),
+        ):
+            rmock.post(requests_mock.ANY, text=self._respond)
+            action = self.action_class(self.order, method_key="bluefin")
+            state = action(payment_data="encrypted", amount=D("10.00"))
+            self.request_count = rmock.call_count
+        # Fails if only one of the concurrent requests was sent
+        self.assertFalse(barrier.broken)
+        return action, state
+
+
+class ProcessBluefinPaymentTest(BaseBluefinActionTest):
+    def test_authorize(self):
+        action, state = self._process()
+        self.assertIsInstance(state, Complete)
+        self.assertEqual(state.amount, D("10.00"))
+        token = PaymentToken.objects.get()
+        self.assertEqual(token.masked_card_number, "411111XXXXXX1111")
+        self.assertEqual(token.card_type, "001")
+        self.assertNotIn(b"afsService", self.sent)
+        self.assertEqual(
+            set(action.timings.keys()),
+            {"get_token", "lookup", "authorize", "record", "total"},
+        )
+
+    def test_lookup_and_authorize_run_concurrently(self):
+        self.concurrent = ("paySubscriptionRetrieveService", "ccAuthService")
+        _, state = self._process()
+        self.assertIsInstance(state, Complete)
+        auth_log = CyberSourceReply.objects.filter(
+            req_transaction_type="authorization"
+        ).get()
+        self.assertEqual(auth_log.req_card_expiry_date, "12-2050")
+
+    def test_lookup_failure_reverses_auth(self):
+        self.replies[b"paySubscriptionRetrieveService"] = "Not a SOAP reply"
+        _, state = self._process()
+        self.assertIsInstance(state, Declined)
+        self.assertEqual(self.sent[-1], b"ccAuthReversalService")
+        # A token without card details isn't saved
+        self.assertFalse(PaymentToken.objects.exists())
+        self.assertFalse(Transaction.objects.exists())
+        reversal_log = CyberSourceReply.objects.get(
+            req_transaction_type="auth_reversal"
+        )
+        self.assertEqual(reversal_log.decision, "ACCEPT")
+        self.assertIn(
+            "Reversed authorization 5579568773646201204011",
+            self.order.notes.get().message,
+        )
+
+    def test_lookup_failure_with_declined_auth(self):
+        self.replies[b"paySubscriptionRetrieveService"] = "Not a SOAP reply"
+        self.replies[b"ccAuthService"] = responses.SOAP_AUTH_REJECT
+        _, state = self._process()
+        self.assertIsInstance(state, Declined)
+        self.assertNotIn(b"ccAuthReversalService", self.sent)
+        self.assertFalse(PaymentToken.objects.exists())
+
+    def test_fraud_screen_runs_concurrently_with_token(self):
+        self.concurrent = ("paySubscriptionCreateService", "afsService")
+        action, state = self._process(fraud_screen=True)
+        self.assertIsInstance(state, Complete)
+        self.assertIn("fraud_screen", action.timings)
+        self.assertTrue(
+            CyberSourceReply.objects.filter(
+                req_transaction_type="fraud_screen"
+            ).exists()
+        )
+
+    def test_fraud_screen_reject_skips_authorization(self):
+        self.replies[b"afsService"] = responses.SOAP_AFS_REJECT
+        _, state = self._process(fraud_screen=True)
+        self.assertIsInstance(state, Declined)
+        self.assertNotIn(b"ccAuthService", self.sent)
+        # The card was still tokenized
+        self.assertTrue(PaymentToken.objects.exists())
+
+    def test_fraud_screen_reject_logged(self):
+        self.replies[b"afsService"] = responses.SOAP_AFS_REJECT
+        self.concurrent = ("paySubscriptionCreateService", "afsService")
+        _, state = self._process(fraud_screen=True)
+        self.assertIsInstance(state, Declined)
+        afs_log = CyberSourceReply.objects.get(req_transaction_type="fraud_screen")
+        self.assertEqual(afs_log.decision, "REJECT")
+        self.assertEqual(afs_log.reason_code, 400)
+
+    def test_fraud_screen_review_authorizes(self):
+        self.replies[b"afsService"] = responses.SOAP_AFS_REVIEW
+        _, state = self._process(fraud_screen=True)
+        self.assertIsInstance(state, Complete)
+        self.assertIn(b"ccAuthService", self.sent)
+
+    def test_token_declined_with_fraud_screen(self):
+        self.replies[b"paySubscriptionCreateService"] = (
+            responses.SOAP_TOKEN_CREATE_REJECT
+        )
+        self.replies[b"afsService"] = responses.SOAP_AFS_REJECT
+        _, state = self._process(fraud_screen=True)
+        self.assertIsInstance(state, Declined)
+        self.assertNotIn(b"ccAuthService", self.sent)
+        self.assertFalse(PaymentToken.objects.exists())
+
+    def test_token_declined(self):
+        self.replies[b"paySubscriptionCreateService"] = (
+            responses.SOAP_TOKEN_CREATE_REJECT
+        )
+        _, state = self._process()
+        self.assertIsInstance(state, Declined)
+        self.assertEqual(self.sent, [b"paySubscriptionCreateService"])
+        self.assertFalse(PaymentToken.objects.exists())
+
+
+class TokenizeAndAuthorizePaymentTest(BaseBluefinActionTest):
+    action_class = TokenizeAndAuthorizePayment
+
+    def setUp(self):
+        super().setUp()
+        self.replies = {
+            b"paySubscriptionCreateService": responses.SOAP_TOKEN_CREATE_AUTH_ACCEPT,
+            b"paySubscriptionRetrieveService": responses.SOAP_TOKEN_RETRIEVE_ACCEPT,
+        }
+
+    def test_authorize(self):
+        _, state = self._process()
+        self.assertIsInstance(state, Complete)
+        self.assertEqual(state.amount, D("10.00"))
+        # One request to tokenize and authorize, and one to lookup the card
+        self.assertEqual(self.request_count, 2)
+        token = PaymentToken.objects.get()
+        self.assertEqual(token.token, "7D2B5D6A4F3C2B1A0E9D8C7B6A5F4E3D")
+        self.assertEqual(token.masked_card_number, "411111XXXXXX1111")
+        # The token and the authorization share a single reply log entry
+        log = CyberSourceReply.objects.get()
+        self.assertEqual(log.req_transaction_type, "authorization")
+        self.assertEqual(log.req_card_expiry_date, "12-2050")
+        self.assertEqual(token.log, log)
+
+    def test_declined(self):
+        self.replies[b"paySubscriptionCreateService"] = responses.SOAP_AUTH_REJECT
+        _, state = self._process()
+        self.assertIsInstance(state, Declined)
+        self.assertEqual(self.request_count, 1)
+        self.assertFalse(PaymentToken.objects.exists())
+
+    def test_fraud_screen(self):
+        _, state = self._process(fraud_screen=True)
+        self.assertIsInstance(state, Complete)
+        self.assertIn(b"afsService", self.sent_bodies[0])
+
+    def test_fraud_screen_reject_reverses_auth(self):
+        self.replies[b"paySubscriptionCreateService"] = (
+            responses.SOAP_TOKEN_CREATE_AUTH_AFS_REJECT
+        )
+        self.replies[b"ccAuthReversalService"] = responses.SOAP_AUTH_REVERSAL_ACCEPT
+        _, state = self._process(fraud_screen=True)
+        self.assertIsInstance(state, Declined)
+        self.assertEqual(self.sent[-1], b"ccAuthReversalService")
+        self.assertIn(b"5579568773646201204011", self.sent_bodies[-1])
+        self.assertIn(
+            "Reversed authorization 5579568773646201204011",
+            self.order.notes.get().message,
+        )
+        # The declined authorization is still recorded
+        self.assertEqual(Transaction.objects.get().status, "DECLINE")
+
+    def test_lookup_failure_reverses_auth(self):
+        self.replies[b"paySubscriptionRetrieveService"] = "Not a SOAP reply"
+        self.replies[b"ccAuthReversalService"] = responses.SOAP_AUTH_REVERSAL_ACCEPT
+        _, state = self._process()
+        self.assertIsInstance(state, Declined)
+        self.assertEqual(self.sent[-1], b"ccAuthReversalService")
+        self.assertIn(b"5579568773646201204011", self.sent_bodies[-1])
+        self.assertFalse(PaymentToken.objects.exists())
+        self.assertTrue(
+            CyberSourceReply.objects.filter(
+                req_transaction_type="auth_reversal"
+            ).exists()
+        )
+
+
+class CreatePaymentTokenFieldsTest(TestCase):
+    def setUp(self):
+        basket = factories.create_basket(empty=True)
+        for title in ("Shirt", "Pants"):
+            product = factories.create_product(title=title, price=D("10.00"))
+            basket.add_product(product)
+        self.order = factories.create_order(
+            basket=basket,
+            billing_address=factories.BillingAddressFactory(),
+            shipping_address=factories.ShippingAddressFactory(),
+        )
+
+    def _action(self):
+        return CreatePaymentToken(
+            session_id="session",
+            order=self.order,
+            method_key="cybersource",
+            amount=D("20.00"),
+            server_hostname="example.com",
+        )
+
+    def test_layout_is_built_once_per_class(self):
+        layout = self._action().field_layout
+        self.assertIs(self._action().field_layout, layout)
+        self.assertIn("amount", layout.signed)
+        self.assertIn("card_number", layout.unsigned)
+        self.assertEqual(list(layout.signed), sorted(layout.signed))
+
+    def test_field_order_is_deterministic(self):
+        fields = self._action().fields()
+        signed = fields["signed_field_names"].split(",")
+        unsigned = fields["unsigned_field_names"].split(",")
+        self.assertEqual(
+            self._action().fields()["signed_field_names"], ",".join(signed)
+        )
+        # Static fields first, then the line items
+        layout = self._action().field_layout
+        self.assertEqual(tuple(signed[: len(layout.signed)]), layout.signed)
+        self.assertEqual(
+            signed[len(layout.signed) :],
+            [
+                f"item_{i}_{field}"
+                for i in range(2)
+                for field in ("name", "sku", "quantity", "unit_price")
+            ],
+        )
+        self.assertEqual(tuple(unsigned), layout.unsigned)
+        self.assertEqual(fields["item_1_name"], "Pants")
+        # The signature covers the signed fields, in the given order
+        signer = SecureAcceptanceSigner(self._action().profile.secret_key)
+        self.assertEqual(signer.sign(fields, signed).decode(), fields["signature"])
+
+
+class CreatePaymentTokenBulkTest(TestCase):
+    num_orders = 5
+
+    def setUp(self):
+        self.order_ids = []
+        for i in range(self.num_orders):
+            basket = factories.create_basket(empty=True)
+            for title in ("Shirt", "Pants"):
+                product = factories.create_product(
+                    title=f"{title} {i}",
+                    price=D("10.00"),
+                )
+                basket.add_product(product)
+            order = factories.create_order(
+                basket=basket,
+                billing_address=factories.BillingAddressFactory(),
+                shipping_address=factories.ShippingAddressFactory(),
+            )
+            self.order_ids.append(order.pk)
+        self.profile = SecureAcceptanceProfile.get_profile("example.com")
+
+    def _requests(self):
+        orders = Order.objects.filter(pk__in=self.order_ids).order_by("pk")
+        return [
+            {
+                "session_id": f"session-{order.pk}",
+                "order": order,
+                "method_key": "cybersource",
+                "amount": D("20.00"),
+            }
+            for order in orders
+        ]
+
+    def test_fields_many(self):
+        requests = self._requests()
+        # One query each for the billing addresses, shipping addresses, and
+        # lines, no matter how many orders there are.
+        with self.assertNumQueries(3):
+            forms = CreatePaymentToken.fields_many("example.com", requests)
+        self.assertEqual(len(forms), self.num_orders)
+        signer = SecureAcceptanceSigner(self.profile.secret_key)
+        for request, fields in zip(requests, forms, strict=True):
+            self.assertEqual(fields["reference_number"], request["order"].number)
+            self.assertTrue(fields["item_1_name"].startswith("Pants "))
+            signed = fields["signed_field_names"].split(",")
+            self.assertEqual(signer.sign(fields, signed).decode(), fields["signature"])
+
+    def test_matches_single_form(self):
+        request = self._requests()[0]
+        bulk = CreatePaymentToken.fields_many("example.com", [request])[0]
+        single = CreatePaymentToken(
+            server_hostname="example.com",
+            **self._requests()[0],
+        ).fields()
+        self.assertEqual(bulk.keys(), single.keys())
+        self.assertEqual(bulk["signed_field_names"], single["signed_field_names"])
+        self.assertEqual(bulk["item_0_sku"], single["item_0_sku"])
+
+    @benchmark.benchmark
+    def test_benchmark(self):
+        def one_at_a_time():
+            for request in self._requests():
+                CreatePaymentToken(server_hostname="example.com", **request).fields()
+
+        def bulk():
+            CreatePaymentToken.fields_many("example.com", self._requests())
+
+        baseline = benchmark.best_of(one_at_a_time, number=10)
+        candidate = benchmark.best_of(bulk, number=10)
+        speedup = benchmark.report_throughput(
+            "token forms", self.num_orders, baseline, candidate
+        )
+        self.assertGreater(speedup, 1)
@@ -0,0 +1,90 @@
+from decimal import Decimal as D
+from unittest import mock
+import tempfile
+
+from django.test import TestCase, override_settings
+from oscar.test import factories
+from oscarapicheckout.states import Complete
+import httpx
+
+from ..actions import AsyncAuthorizePayment
+from ..conf import settings
+from ..constants import Decision
+from ..cybersoap import get_async_client
+from ..models import CyberSourceReply, PaymentToken
+from ..test import responses
+from . import factories as cs_factories
+
+
+class AsyncSOAPTest(TestCase):
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        bundle_path = f"{tmpdir.name}/cybersource-wsdl.json"
+        cs_factories.build_test_wsdl_bundle(bundle_path)
+        settings_override = override_settings(
+            CYBERSOURCE=cs_factories.soap_test_settings(bundle_path),
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.sent = []
+        http_client = mock.patch(
+            "cybersource.cybersoap.build_async_http_client",
+            side_effect=lambda: httpx.AsyncClient(
+                transport=httpx.MockTransport(self._handle_request)
+            ),
+        )
+        http_client.start()
+        self.addCleanup(http_client.stop)
+
+        self.order = factories.create_order()
+
+    def _handle_request(self, request):
+        self.sent.append(request.content)
+        return httpx.Response(
+            200,
+            text=responses.SOAP_AUTH_ACCEPT,
+            headers={"Content-Type": "text/xml"},
+        )
+
+    async def _get_client(self):
+        return await get_async_client(
+            wsdl=str(settings.WSDL),
+            merchant_id=settings.MERCHANT_ID,
+            pkcs12_data=settings.PKCS12_DATA,
+            pkcs12_password=settings.PKCS12_PASSWORD,
+            wsdl_bundle=settings.WSDL_BUNDLE,
+        )
+
+    async def test_client_is_shared_per_loop(self):
+        client = await self._get_client()
+        self.assertIs(client, await self._get_client())
+
+    async def test_authorize(self):
+        client = await self._get_client()
+        response = await client.authorize(self.order, token="abc", amount=D("10.00"))
+        self.assertEqual(response.decision, Decision.ACCEPT)
+        self.assertEqual(response.ccAuthReply.amount, "10.00")
+        # Request was built from the order, and signed
+        self.assertEqual(len(self.sent), 1)
+        self.assertIn(str(self.order.number).encode(), self.sent[0])
+        self.assertIn(b"Signature", self.sent[0])
+
+    async def test_authorize_payment_action(self):
+        token = await PaymentToken.objects.acreate(
+            log=await CyberSourceReply.objects.acreate(data={}),
+            token="abc",
+            masked_card_number="xxxxxxxxxxxx1111",
+            card_type="001",
+        )
+        state = await AsyncAuthorizePayment(self.order, method_key="cybersource")(
+            token_string=token.token,
+            amount=D("10.00"),
+            update_session=False,
+        )
+        self.assertIsInstance(state, Complete)
+        self.assertEqual(state.amount, D("10.00"))
+        self.assertEqual(
+            await CyberSourceReply.objects.filter(order=self.order).acount(), 1
+        )
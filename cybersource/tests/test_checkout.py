@@ -1,7 +1,13 @@
 from decimal import Decimal as D
+from io import StringIO
 from unittest import mock, skipIf, skipUnless
 import datetime
 
+from django.conf import settings as djsettings
+from django.core.management import call_command
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils.crypto import get_random_string
 from oscar.core.loading import get_model
@@ -11,8 +17,12 @@ from rest_framework.test import APITestCase
 import requests_mock
 
 from ..conf import settings
-from ..constants import Decision
+from ..constants import Decision, DeferredAuthorizationStatus
+from ..cybersoap import CyberSourceSoap
+from ..deferred import claim_authorizations
+from ..models import CyberSourceReply, DeferredAuthorization, ProcessedReply
 from ..test import responses
+from ..views import CyberSourceReplyView
 from . import factories as cs_factories
 
 Basket = get_model("basket", "Basket")
@@ -749,6 +759,150 @@ class CSReplyViewTest(BaseCheckoutTest):
 
         return order_number
 
+    @mock.patch("oscarapicheckout.signals.order_payment_authorized.send")
+    def test_query_budget(self, order_payment_authorized):
+        """A reply reads the order, then locks it once, within a fixed query budget"""
+        # Includes the session, the reply log and its receipt, savepoints, and
+        # everything Oscar does to mark the order's payment as declined.
+        query_budget = 28
+
+        session = self.client.session
+        session.save()
+        order_number = self.prepare_order()
+        data = cs_factories.build_declined_token_reply_data(
+            order_number, session.session_key
+        )
+        data = cs_factories.sign_reply_data(data)
+
+        url = reverse("cybersource-reply")
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.post(url, data)
+        self.assertRedirects(
+            resp, reverse("checkout:index"), fetch_redirect_response=False
+        )
+
+        order_table = connection.ops.quote_name(Order._meta.db_table)
+        order_selects = [
+            query["sql"]
+            for query in ctx.captured_queries
+            if query["sql"].startswith("SELECT")
+            and f"FROM {order_table}" in query["sql"]
+        ]
+        self.assertEqual(len(order_selects), 2, order_selects)
+        self.assertNotIn("FOR UPDATE", order_selects[0])
+        self.assertIn("FOR UPDATE", order_selects[1])
+        self.assertLessEqual(
+            len(ctx.captured_queries),
+            query_budget,
+            "\n".join(query["sql"] for query in ctx.captured_queries),
+        )
+
+    @mock.patch("cybersource.signals.received_duplicate_reply.send_robust")
+    def test_duplicate_declined_token(self, received_duplicate_reply):
+        """A retried reply gets the same answer, without being handled again"""
+        session = self.client.session
+        session.save()
+        order_number = self.prepare_order()
+        data = cs_factories.build_declined_token_reply_data(
+            order_number, session.session_key
+        )
+        data = cs_factories.sign_reply_data(data)
+
+        url = reverse("cybersource-reply")
+        for _ in range(2):
+            resp = self.client.post(url, data)
+            self.assertRedirects(
+                resp, reverse("checkout:index"), fetch_redirect_response=False
+            )
+
+        # Every copy is logged, but only the first is handled
+        self.assertEqual(CyberSourceReply.objects.count(), 2)
+        processed = ProcessedReply.objects.get()
+        self.assertEqual(processed.log, CyberSourceReply.objects.order_by("pk").first())
+        self.assertEqual(processed.duplicate_count, 1)
+        self.assertEqual(received_duplicate_reply.call_count, 1)
+        self.assertEqual(ProcessedReply.get_duplicate_rate(), 0.5)
+
+    @mock.patch("oscarapicheckout.signals.order_payment_authorized.send")
+    @requests_mock.mock()
+    def test_duplicate_accepted_token(self, order_payment_authorized, rmock):
+        """A retried reply doesn't make another authorization"""
+        session = self.client.session
+        session.save()
+        order_number = self.prepare_order()
+        data = cs_factories.build_accepted_token_reply_data(
+            order_number, session.session_key
+        )
+        data = cs_factories.sign_reply_data(data)
+        responses.mock_soap_transaction_response(rmock, responses.SOAP_AUTH_ACCEPT)
+
+        url = reverse("cybersource-reply")
+        for _ in range(2):
+            resp = self.client.post(url, data)
+            self.assertRedirects(
+                resp, reverse("checkout:thank-you"), fetch_redirect_response=False
+            )
+
+        soap_requests = [req for req in rmock.request_history if req.method == "POST"]
+        self.assertEqual(len(soap_requests), 1)
+        self.assertEqual(order_payment_authorized.call_count, 1)
+        order = Order.objects.get(number=order_number)
+        self.assertEqual(order.sources.get().transactions.count(), 1)
+        self.assertEqual(ProcessedReply.objects.get().duplicate_count, 1)
+
+    @requests_mock.mock()
+    def test_authorized_outside_transaction(self, rmock):
+        """The order isn't locked while waiting on the authorization"""
+        session = self.client.session
+        session.save()
+        order_number = self.prepare_order()
+        data = cs_factories.build_accepted_token_reply_data(
+            order_number, session.session_key
+        )
+        data = cs_factories.sign_reply_data(data)
+        responses.mock_soap_transaction_response(rmock, responses.SOAP_AUTH_ACCEPT)
+
+        # Only the test case's own transactions are open
+        test_atomic_blocks = len(connection.atomic_blocks)
+        run_transaction = CyberSourceSoap._run_transaction
+        atomic_blocks = []
+
+        def _run_transaction(api, order, txndata):
+            atomic_blocks.append(len(connection.atomic_blocks))
+            return run_transaction(api, order, txndata)
+
+        url = reverse("cybersource-reply")
+        with mock.patch.object(CyberSourceSoap, "_run_transaction", _run_transaction):
+            resp = self.client.post(url, data)
+        self.assertRedirects(
+            resp, reverse("checkout:thank-you"), fetch_redirect_response=False
+        )
+        self.assertEqual(atomic_blocks, [test_atomic_blocks])
+        self.assertEqual(
+            ProcessedReply.objects.get().redirect_url, reverse("checkout:thank-you")
+        )
+
+    def test_reply_logged_when_handling_fails(self):
+        """The reply log is kept, even if handling the reply fails"""
+        session = self.client.session
+        session.save()
+        order_number = self.prepare_order()
+        data = cs_factories.build_accepted_token_reply_data(
+            order_number, session.session_key
+        )
+        data = cs_factories.sign_reply_data(data)
+
+        url = reverse("cybersource-reply")
+        with (
+            mock.patch.object(
+                CyberSourceReplyView, "record_token", side_effect=RuntimeError
+            ),
+            self.assertRaises(RuntimeError),
+        ):
+            self.client.post(url, data)
+        self.assertEqual(CyberSourceReply.objects.count(), 1)
+        self.assertFalse(ProcessedReply.objects.exists())
+
     @mock.patch("oscarapicheckout.signals.order_payment_authorized.send")
     def test_invalid_signature(self, order_payment_authorized):
         """Invalid signature should result in 400 Bad Request"""
@@ -931,6 +1085,158 @@ class CSReplyViewTest(BaseCheckoutTest):
             "Payment Declined",
         )
 
+    @mock.patch("oscarapicheckout.signals.order_payment_authorized.send")
+    @requests_mock.mock()
+    def test_failed_auth(self, order_payment_authorized, rmock):
+        """An auth which gets no reply should be declined"""
+        order_number = self.prepare_order()
+        session = self.client.session
+        session.save()
+        data = cs_factories.build_accepted_token_reply_data(
+            order_number,
+            session.session_key,
+        )
+        data = cs_factories.sign_reply_data(data)
+        responses.mock_soap_transaction_response(rmock, responses.SOAP_AUTH_ACCEPT)
+        rmock.post(requests_mock.ANY, status_code=500, text="Server Error")
+
+        url = reverse("cybersource-reply")
+        resp = self.client.post(url, data)
+
+        self.assertRedirects(
+            resp,
+            reverse("checkout:index"),
+            fetch_redirect_response=False,
+        )
+        self.assertEqual(order_payment_authorized.call_count, 0)
+        self.assertEqual(
+            self.do_fetch_payment_states().data["order_status"],
+            "Payment Declined",
+        )
+
+
+class DeferredAuthorizationTest(BaseCheckoutTest):
+    """Checkout with the authorization left to process_cybersource_authorizations"""
+
+    def setUp(self):
+        super().setUp()
+        settings_override = override_settings(
+            CYBERSOURCE=djsettings.CYBERSOURCE | {"DEFERRED_AUTHORIZATION": True},
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def get_token(self, rmock, soap_response):
+        product = self.create_product()
+
+        resp = self.do_get_basket()
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        basket_id = resp.data["id"]
+
+        resp = self.do_add_to_basket(product.id)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+
+        resp = self.do_checkout(basket_id)
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        order_number = resp.data["number"]
+
+        responses.mock_soap_transaction_response(rmock, soap_response)
+
+        resp = self.do_fetch_payment_states()
+        action = resp.data["payment_method_states"]["cybersource"]["required_action"]
+        resp = self.do_cs_get_token(action["url"], action["fields"])
+        self.assertRedirects(
+            resp, reverse("checkout:index"), fetch_redirect_response=False
+        )
+
+        # The authorization hasn't been made yet
+        self.assertFalse(self.soap_requests(rmock))
+        job = DeferredAuthorization.objects.get()
+        self.assertEqual(job.status, DeferredAuthorizationStatus.PENDING)
+        self.assertEqual(job.order.number, order_number)
+        self.assertEqual(job.amount, D("10.00"))
+        resp = self.do_fetch_payment_states()
+        self.assertEqual(resp.data["order_status"], "Pending")
+        self.assertEqual(
+            resp.data["payment_method_states"]["cybersource"]["status"], "Pending"
+        )
+        return order_number, product
+
+    def soap_requests(self, rmock):
+        return [req for req in rmock.request_history if req.method == "POST"]
+
+    def process_authorizations(self):
+        call_command("process_cybersource_authorizations", "--once", stdout=StringIO())
+
+    @requests_mock.mock()
+    def test_accepted_auth(self, rmock):
+        order_number, product = self.get_token(rmock, responses.SOAP_AUTH_ACCEPT)
+        self.process_authorizations()
+
+        self.assertEqual(len(self.soap_requests(rmock)), 1)
+        job = DeferredAuthorization.objects.get()
+        self.assertEqual(job.status, DeferredAuthorizationStatus.COMPLETE)
+        self.assertEqual(job.attempts, 1)
+        resp = self.do_fetch_payment_states()
+        self.assertEqual(resp.data["order_status"], "Authorized")
+        self.assertEqual(
+            resp.data["payment_method_states"]["cybersource"]["status"], "Consumed"
+        )
+        self.check_finished_order(order_number, product.id)
+
+    @requests_mock.mock()
+    def test_declined_auth(self, rmock):
+        self.get_token(rmock, responses.SOAP_AUTH_REJECT)
+        self.process_authorizations()
+
+        job = DeferredAuthorization.objects.get()
+        self.assertEqual(job.status, DeferredAuthorizationStatus.COMPLETE)
+        resp = self.do_fetch_payment_states()
+        self.assertEqual(resp.data["order_status"], "Payment Declined")
+        self.assertEqual(
+            resp.data["payment_method_states"]["cybersource"]["status"], "Declined"
+        )
+
+    @requests_mock.mock()
+    def test_failed_auth(self, rmock):
+        self.get_token(rmock, responses.SOAP_AUTH_ACCEPT)
+        rmock.post(requests_mock.ANY, status_code=500, text="Server Error")
+        self.process_authorizations()
+
+        job = DeferredAuthorization.objects.get()
+        self.assertEqual(job.status, DeferredAuthorizationStatus.FAILED)
+        resp = self.do_fetch_payment_states()
+        self.assertEqual(resp.data["order_status"], "Payment Declined")
+        self.assertEqual(
+            resp.data["payment_method_states"]["cybersource"]["status"], "Declined"
+        )
+
+    @requests_mock.mock()
+    def test_unrestorable_session(self, rmock):
+        order_number, _product = self.get_token(rmock, responses.SOAP_AUTH_ACCEPT)
+        DeferredAuthorization.objects.update(encrypted_session_id="not-encrypted")
+        self.process_authorizations()
+
+        # Failed, rather than left processing, without making the authorization
+        job = DeferredAuthorization.objects.get()
+        self.assertEqual(job.status, DeferredAuthorizationStatus.FAILED)
+        self.assertFalse(self.soap_requests(rmock))
+        self.assertEqual(
+            Order.objects.get(number=order_number).status, "Payment Declined"
+        )
+
+    @requests_mock.mock()
+    def test_claimed_once(self, rmock):
+        self.get_token(rmock, responses.SOAP_AUTH_ACCEPT)
+        jobs = claim_authorizations(10)
+        self.assertEqual(len(jobs), 1)
+        self.assertEqual(jobs[0].status, DeferredAuthorizationStatus.PROCESSING)
+        self.assertEqual(
+            DeferredAuthorization.objects.get().status,
+            DeferredAuthorizationStatus.PROCESSING,
+        )
+        self.assertEqual(claim_authorizations(10), [])
+
 
 class CybersourceMethodTest(BaseCheckoutTest):
     @mock.patch("cybersource.signals.pre_build_auth_request.send")
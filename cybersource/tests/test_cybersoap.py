@@ -0,0 +1,131 @@
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+from lxml import etree
+from zeep.wsse import BinarySignature, MemorySignature
+import xmlsec
+
+from ..cybersoap import (
+    CyberSourceSoap,
+    KeyMaterialCache,
+    get_client,
+    get_key_material,
+    pkcs12_fingerprint,
+)
+from ..wsse import make_sign_key
+from .factories import build_pkcs12
+
+WSDL = "https://ics2wstesta.ic3.com/commerce/1.x/transactionProcessor/CyberSourceTransaction_1.155.wsdl"
+
+
+class ClientRegistryTest(SimpleTestCase):
+    def test_same_configuration_shares_client(self) -> None:
+        pkcs12_data = build_pkcs12()
+        client1 = get_client(WSDL, "merchant-a", pkcs12_data, b"password")
+        client2 = get_client(WSDL, "merchant-a", pkcs12_data, b"password")
+        self.assertIsInstance(client1, CyberSourceSoap)
+        self.assertIs(client1, client2)
+
+    def test_different_configuration_gets_new_client(self) -> None:
+        pkcs12_data = build_pkcs12()
+        other_pkcs12_data = build_pkcs12(common_name="cybersource-test-2")
+        client = get_client(WSDL, "merchant-a", pkcs12_data, b"password")
+        self.assertIsNot(
+            client,
+            get_client(WSDL, "merchant-b", pkcs12_data, b"password"),
+        )
+        self.assertIsNot(
+            client,
+            get_client(WSDL, "merchant-a", other_pkcs12_data, b"password"),
+        )
+
+    def test_setting_change_rebuilds_clients(self) -> None:
+        pkcs12_data = build_pkcs12()
+        client = get_client(WSDL, "merchant-a", pkcs12_data, b"password")
+        with override_settings(CYBERSOURCE_LOCALE="es"):
+            self.assertIsNot(
+                client,
+                get_client(WSDL, "merchant-a", pkcs12_data, b"password"),
+            )
+
+    def test_fingerprint(self) -> None:
+        pkcs12_data = build_pkcs12()
+        self.assertEqual(
+            pkcs12_fingerprint(pkcs12_data), pkcs12_fingerprint(pkcs12_data)
+        )
+        self.assertNotEqual(
+            pkcs12_fingerprint(pkcs12_data),
+            pkcs12_fingerprint(build_pkcs12(common_name="cybersource-test-2")),
+        )
+
+
+ENVELOPE = b"""<soap-env:Envelope xmlns:soap-env="http://schemas.xmlsoap.org/soap/envelope/">
+  <soap-env:Header/>
+  <soap-env:Body><foo>bar</foo></soap-env:Body>
+</soap-env:Envelope>"""
+
+
+class KeyMaterialCacheTest(SimpleTestCase):
+    def test_same_certificate_shares_key_material(self) -> None:
+        pkcs12_data = build_pkcs12()
+        material = get_key_material(pkcs12_data, b"password")
+        self.assertIs(material, get_key_material(pkcs12_data, b"password"))
+        self.assertIn(b"BEGIN RSA PRIVATE KEY", material.privkey_pem)
+        self.assertIn(b"BEGIN CERTIFICATE", material.cert_pem)
+
+    def test_clients_share_signer(self) -> None:
+        pkcs12_data = build_pkcs12()
+        client1 = get_client(WSDL, "merchant-a", pkcs12_data, b"password")
+        client2 = get_client(WSDL, "merchant-b", pkcs12_data, b"password")
+        self.assertIsNot(client1, client2)
+        self.assertIs(client1.client_wsse, client2.client_wsse)
+
+    def test_setting_change_clears_key_material(self) -> None:
+        pkcs12_data = build_pkcs12()
+        material = get_key_material(pkcs12_data, b"password")
+        with override_settings(CYBERSOURCE_LOCALE="es"):
+            self.assertIsNot(material, get_key_material(pkcs12_data, b"password"))
+
+    def test_lru_eviction(self) -> None:
+        cache = KeyMaterialCache(maxsize=1)
+        pkcs12_a = build_pkcs12()
+        pkcs12_b = build_pkcs12(common_name="cybersource-test-2")
+        material_a = cache.get(pkcs12_a, b"password")
+        self.assertIs(material_a, cache.get(pkcs12_a, b"password"))
+        cache.get(pkcs12_b, b"password")
+        self.assertIsNot(material_a, cache.get(pkcs12_a, b"password"))
+
+    def test_signer_parses_key_once(self) -> None:
+        signer = KeyMaterialCache().get(build_pkcs12(), b"password").signer
+        with mock.patch(
+            "cybersource.cybersoap.make_sign_key",
+            wraps=make_sign_key,
+        ) as mock_make_sign_key:
+            for i in range(3):
+                envelope = etree.fromstring(ENVELOPE)
+                signer.apply(envelope, {})
+                self.assertIsNotNone(
+                    envelope.find(".//{http://www.w3.org/2000/09/xmldsig#}Signature")
+                )
+        self.assertEqual(mock_make_sign_key.call_count, 1)
+
+    def test_signature_matches_zeep(self) -> None:
+        material = KeyMaterialCache().get(build_pkcs12(), b"password")
+        zeep_signer = BinarySignature.__new__(BinarySignature)
+        MemorySignature.__init__(
+            zeep_signer,
+            key_data=material.privkey_pem,
+            cert_data=material.cert_pem,
+            signature_method=xmlsec.Transform.RSA_SHA256,
+            digest_method=xmlsec.Transform.SHA256,
+        )
+        ours = etree.fromstring(ENVELOPE)
+        material.signer.apply(ours, {})
+        theirs = etree.fromstring(ENVELOPE)
+        zeep_signer.apply(theirs, {})
+        self.assertEqual(
+            [node.tag for node in ours.iter()],
+            [node.tag for node in theirs.iter()],
+        )
+        # The signature is valid
+        MemorySignature(material.privkey_pem, material.cert_pem).verify(ours)
@@ -0,0 +1,131 @@
+from decimal import Decimal as D
+from unittest import mock
+import tempfile
+
+from django.test import TestCase, override_settings
+from lxml import etree
+from oscar.test import factories
+import requests_mock
+
+from ..actions import SOAPAction
+from ..envelope import EnvelopeBuilder, UnsupportedEnvelope
+from ..test import benchmark, responses
+from . import factories as cs_factories
+
+
+class EnvelopeBuilderTest(TestCase):
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        bundle_path = f"{tmpdir.name}/cybersource-wsdl.json"
+        cs_factories.build_test_wsdl_bundle(bundle_path)
+        settings_override = override_settings(
+            CYBERSOURCE=cs_factories.soap_test_settings(
+                bundle_path,
+                SOAP_FAST_SERIALIZER=True,
+            ),
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        basket = factories.create_basket(empty=True)
+        for title in ("Shirt", "Pants & <Socks>"):
+            product = factories.create_product(
+                title=title,
+                price=D("10.00"),
+                num_in_stock=10,
+            )
+            basket.add_product(product, quantity=2)
+        self.order = factories.create_order(
+            basket=basket,
+            billing_address=factories.BillingAddressFactory(),
+            shipping_address=factories.ShippingAddressFactory(),
+        )
+        self.api = SOAPAction(self.order).api
+        self.builder = EnvelopeBuilder(self.api.client)
+
+    def _requests(self):
+        api = self.api
+        return {
+            "authorize": api.build_authorize_request(self.order, "token", D("40.00")),
+            "get_token": api.build_get_token_request(self.order, "encrypted"),
+            "get_token_and_authorize": api.build_get_token_and_authorize_request(
+                self.order,
+                "encrypted",
+                D("40.00"),
+                fraud_screen=True,
+            ),
+            "lookup": api.build_lookup_payment_token_request(self.order, "token"),
+            "auth_reversal": api.build_auth_reversal_request(
+                self.order, "5579568773646201204011", D("40.00")
+            ),
+            "fraud_screen": api.build_advanced_fraud_screen_request(self.order),
+        }
+
+    def _zeep_envelope(self, txndata):
+        return self.builder.operation.create(**txndata).content
+
+    def test_matches_zeep(self):
+        for name, txndata in self._requests().items():
+            with self.subTest(name):
+                self.assertEqual(
+                    etree.tostring(self.builder.build(txndata)),
+                    etree.tostring(self._zeep_envelope(txndata)),
+                )
+
+    def test_headers_match_zeep(self):
+        txndata = self._requests()["authorize"]
+        self.assertEqual(
+            self.builder.http_headers,
+            self.builder.operation.create(**txndata).headers,
+        )
+
+    def test_fallback_matches_zeep(self):
+        txndata = self._requests()["authorize"]
+        client = self.api.client
+        self.assertEqual(
+            etree.tostring(
+                client.create_message(client.service, "runTransaction", **txndata)
+            ),
+            etree.tostring(self._zeep_envelope(txndata)),
+        )
+
+    def test_unsupported_fields(self):
+        txndata = self._requests()["authorize"]
+        txndata["notInTheSchema"] = "foo"
+        with self.assertRaises(UnsupportedEnvelope):
+            self.builder.build(txndata)
+
+    def test_send(self):
+        self.assertTrue(self.api.fast_serializer)
+        self.assertIsNotNone(self.api.envelope_builder)
+        with requests_mock.mock() as rmock:
+            rmock.post(requests_mock.ANY, text=responses.SOAP_AUTH_ACCEPT)
+            response = self.api.authorize(self.order, "token", D("40.00"))
+            sent = rmock.last_request
+        self.assertEqual(response.decision, "ACCEPT")
+        self.assertEqual(sent.headers["SOAPAction"], '"runTransaction"')
+        # The envelope is still signed
+        self.assertIn(b"BinarySecurityToken", sent.body)
+
+    def test_send_falls_back_to_zeep(self):
+        with (
+            mock.patch.object(
+                EnvelopeBuilder,
+                "build",
+                side_effect=UnsupportedEnvelope("unsupported"),
+            ),
+            requests_mock.mock() as rmock,
+        ):
+            rmock.post(requests_mock.ANY, text=responses.SOAP_AUTH_ACCEPT)
+            response = self.api.authorize(self.order, "token", D("40.00"))
+        self.assertEqual(response.decision, "ACCEPT")
+        self.assertEqual(rmock.call_count, 1)
+
+    @benchmark.benchmark
+    def test_benchmark(self):
+        txndata = self._requests()["authorize"]
+        zeep_time = benchmark.best_of(lambda: self._zeep_envelope(txndata))
+        fast_time = benchmark.best_of(lambda: self.builder.build(txndata))
+        speedup = benchmark.report("authorize envelope", zeep_time, fast_time)
+        self.assertGreater(speedup, 1)
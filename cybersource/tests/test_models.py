@@ -1,8 +1,23 @@
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command
 from django.db import connection
 from django.db.models import Q
-from django.test import TestCase
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 
-from ..models import CyberSourceReply, PaymentToken, SecureAcceptanceProfile
+from ..models import (
+    CyberSourceReply,
+    PaymentToken,
+    ProcessedReply,
+    SecureAcceptanceProfile,
+    _profile_cache,
+)
 from .factories import build_accepted_token_reply_data
 
 
@@ -42,6 +57,56 @@ class PaymentTokenTest(TestCase):
         self.assertEqual(token.card_last4, "1111")
         self.assertEqual(token.card_holder, "Bob Smith")
 
+    def test_record(self):
+        data = build_accepted_token_reply_data("S123456789", "")
+        log = CyberSourceReply.objects.create(data=data)
+        with self.assertNumQueries(1):
+            token = PaymentToken.record(
+                log=log,
+                token="abc123",
+                masked_card_number="xxxxxxxxxxxx1111",
+                card_type="001",
+            )
+        self.assertIsNotNone(token.pk)
+        self.assertEqual(token.log_id, log.pk)
+        self.assertEqual(token.card_last4, "1111")
+
+        # Recording the same token again gets the existing row
+        other_log = CyberSourceReply.objects.create(data=data)
+        with self.assertNumQueries(1):
+            again = PaymentToken.record(
+                log=other_log,
+                token="abc123",
+                masked_card_number="xxxxxxxxxxxx4242",
+                card_type="002",
+            )
+        self.assertEqual(again.pk, token.pk)
+        self.assertEqual(again.log_id, log.pk)
+        self.assertEqual(again.masked_card_number, "xxxxxxxxxxxx1111")
+        self.assertEqual(again.card_type, "001")
+        self.assertEqual(PaymentToken.objects.count(), 1)
+
+
+class ProcessedReplyKeyTest(SimpleTestCase):
+    def test_scoped_to_order(self):
+        first = ProcessedReply.get_key(
+            {"req_reference_number": "100001", "req_transaction_uuid": "abc"}
+        )
+        second = ProcessedReply.get_key(
+            {"req_reference_number": "100002", "req_transaction_uuid": "abc"}
+        )
+        self.assertEqual(first, "uuid:100001:abc")
+        self.assertNotEqual(first, second)
+
+    def test_transaction_id(self):
+        self.assertEqual(
+            ProcessedReply.get_key(
+                {"req_reference_number": "100001", "transaction_id": "123"}
+            ),
+            "txn:123",
+        )
+        self.assertIsNone(ProcessedReply.get_key({"req_reference_number": "100001"}))
+
 
 class SecureAcceptanceProfileTest(TestCase):
     def setUp(self):
@@ -87,6 +152,106 @@ class SecureAcceptanceProfileTest(TestCase):
         self.assertEqual(profile.profile_id, "2A37F989-C8B2-4FEF-ACCF-2562577780E2")
 
 
+class SecureAcceptanceProfileCacheTest(TestCase):
+    def setUp(self):
+        self.profile = SecureAcceptanceProfile.objects.create(
+            hostname="foo.example.com",
+            profile_id="a",
+            access_key="key-a",
+            secret_key="secret-a",
+            is_default=False,
+        )
+        SecureAcceptanceProfile.objects.create(
+            hostname="www.example.com",
+            profile_id="c",
+            access_key="",
+            secret_key="",
+            is_default=True,
+        )
+
+    def test_cached(self):
+        profile = SecureAcceptanceProfile.get_profile("foo.example.com")
+        self.assertEqual(profile.secret_key, "secret-a")
+        with self.assertNumQueries(0):
+            profile = SecureAcceptanceProfile.get_profile("FOO.example.com")
+            self.assertEqual(profile.profile_id, "a")
+            self.assertEqual(profile.secret_key, "secret-a")
+            profile = SecureAcceptanceProfile.get_profile("foo.example.com")
+            self.assertEqual(profile.profile_id, "a")
+
+    def test_invalidated_on_save(self):
+        SecureAcceptanceProfile.get_profile("foo.example.com")
+        self.profile.secret_key = "secret-b"
+        self.profile.save()
+        profile = SecureAcceptanceProfile.get_profile("foo.example.com")
+        self.assertEqual(profile.secret_key, "secret-b")
+
+    def test_invalidated_on_delete(self):
+        SecureAcceptanceProfile.get_profile("foo.example.com")
+        self.profile.delete()
+        profile = SecureAcceptanceProfile.get_profile("foo.example.com")
+        self.assertEqual(profile.profile_id, "c")
+
+    def test_expires(self):
+        with mock.patch("cybersource.models.time.monotonic", return_value=1000):
+            SecureAcceptanceProfile.get_profile("foo.example.com")
+        with (
+            mock.patch("cybersource.models.time.monotonic", return_value=1299),
+            self.assertNumQueries(0),
+        ):
+            SecureAcceptanceProfile.get_profile("foo.example.com")
+        with (
+            mock.patch("cybersource.models.time.monotonic", return_value=1300),
+            self.assertNumQueries(1),
+        ):
+            SecureAcceptanceProfile.get_profile("foo.example.com")
+
+    @override_settings(
+        CYBERSOURCE=settings.CYBERSOURCE | {"PROFILE_CACHE_MAXSIZE": 1},
+    )
+    def test_lru(self):
+        SecureAcceptanceProfile.get_profile("foo.example.com")
+        SecureAcceptanceProfile.get_profile("www.example.com")
+        with self.assertNumQueries(0):
+            SecureAcceptanceProfile.get_profile("www.example.com")
+        with self.assertNumQueries(1):
+            SecureAcceptanceProfile.get_profile("foo.example.com")
+
+    @override_settings(
+        CYBERSOURCE=settings.CYBERSOURCE | {"PROFILE_CACHE_TTL": 0},
+    )
+    def test_disabled(self):
+        SecureAcceptanceProfile.get_profile("foo.example.com")
+        with self.assertNumQueries(1):
+            SecureAcceptanceProfile.get_profile("foo.example.com")
+
+    @override_settings(
+        CYBERSOURCE=settings.CYBERSOURCE
+        | {"PROFILE_CACHE_VERSION_KEY": "cybersource-profile-version"},
+    )
+    def test_version_key(self):
+        self.addCleanup(cache.delete, "cybersource-profile-version")
+        SecureAcceptanceProfile.get_profile("foo.example.com")
+        with self.assertNumQueries(0):
+            SecureAcceptanceProfile.get_profile("foo.example.com")
+        # Another process changed a profile
+        cache.set("cybersource-profile-version", 5, timeout=None)
+        with self.assertNumQueries(1):
+            SecureAcceptanceProfile.get_profile("foo.example.com")
+        with self.assertNumQueries(0):
+            SecureAcceptanceProfile.get_profile("foo.example.com")
+        # This process changed a profile
+        with self.captureOnCommitCallbacks(execute=True):
+            self.profile.save()
+        self.assertEqual(cache.get("cybersource-profile-version"), 6)
+
+    def test_invalidate(self):
+        SecureAcceptanceProfile.get_profile("foo.example.com")
+        _profile_cache.invalidate()
+        with self.assertNumQueries(1):
+            SecureAcceptanceProfile.get_profile("foo.example.com")
+
+
 class CyberSourceReplyScrubIndexTest(TestCase):
     """Test the partial index on CyberSourceReply for data scrubbing performance."""
 
@@ -120,3 +285,63 @@ class CyberSourceReplyScrubIndexTest(TestCase):
         candidates = CyberSourceReply.objects.exclude(data={})
         self.assertIn(reply_with_data, candidates)
         self.assertNotIn(reply_already_scrubbed, candidates)
+
+
+class ScrubCyberSourceRepliesTest(TestCase):
+    def create_reply(self, days_ago):
+        data = build_accepted_token_reply_data("ORDER-1", "")
+        reply = CyberSourceReply.objects.create(data=data, decision="ACCEPT")
+        CyberSourceReply.objects.filter(pk=reply.pk).update(
+            date_created=timezone.now() - timedelta(days=days_ago)
+        )
+        return reply
+
+    def scrub(self, *args):
+        stdout = StringIO()
+        call_command("scrub_cybersource_replies", "--sleep=0", *args, stdout=stdout)
+        return stdout.getvalue()
+
+    def test_scrub(self):
+        old = [self.create_reply(100 + i % 3) for i in range(7)]
+        recent = self.create_reply(10)
+
+        output = self.scrub("--days=90", "--batch-size=2")
+        self.assertIn("Finished scrubbing 7 replies", output)
+        for reply in old:
+            reply.refresh_from_db()
+            self.assertEqual(reply.data, {})
+            # The normalized fields are kept
+            self.assertEqual(reply.decision, "ACCEPT")
+        recent.refresh_from_db()
+        self.assertNotEqual(recent.data, {})
+
+        # Nothing left to do
+        output = self.scrub("--days=90")
+        self.assertIn("Finished scrubbing 0 replies", output)
+
+    def test_dry_run(self):
+        reply = self.create_reply(100)
+        self.create_reply(10)
+        output = self.scrub("--days=90", "--dry-run")
+        self.assertIn("Would scrub 1 replies", output)
+        reply.refresh_from_db()
+        self.assertNotEqual(reply.data, {})
+
+    def test_batch_query_uses_index(self):
+        """Each batch's candidate query rides the scrub candidates index"""
+        for i in range(5):
+            self.create_reply(100 + i)
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL enable_seqscan = off")
+        with CaptureQueriesContext(connection) as ctx:
+            self.scrub("--days=90", "--batch-size=2")
+        selects = [
+            q["sql"]
+            for q in ctx.captured_queries
+            if q["sql"].startswith("SELECT") and "ORDER BY" in q["sql"]
+        ]
+        self.assertEqual(len(selects), 4)
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN {selects[1]}")
+            plan = "\n".join(row[0] for row in cursor.fetchall())
+        self.assertIn("cybersource_reply_scrub_cands", plan)
@@ -0,0 +1,178 @@
+from datetime import UTC, datetime
+from unittest import mock
+
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+
+from .. import partitions
+from ..models import PaymentToken, ProcessedReply
+
+SCRATCH_TABLE = "cybersource_test_reply"
+NOW = datetime(2026, 10, 18, 12, 30, tzinfo=UTC)
+
+
+class MonthTest(SimpleTestCase):
+    def test_month_start(self):
+        self.assertEqual(
+            partitions.month_start(NOW),
+            datetime(2026, 10, 1, tzinfo=UTC),
+        )
+
+    def test_add_months(self):
+        start = datetime(2026, 10, 1, tzinfo=UTC)
+        self.assertEqual(
+            partitions.add_months(start, 3), datetime(2027, 1, 1, tzinfo=UTC)
+        )
+        self.assertEqual(
+            partitions.add_months(start, -10), datetime(2025, 12, 1, tzinfo=UTC)
+        )
+
+
+class PartitionTest(TransactionTestCase):
+    """
+    Partition a scratch copy of the reply table, since converting can't be
+    undone.
+    """
+
+    def setUp(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE TABLE {SCRATCH_TABLE} "
+                "(LIKE cybersource_cybersourcereply INCLUDING ALL)"
+            )
+        self.addCleanup(self.drop_scratch_tables)
+        patcher = mock.patch.object(
+            partitions, "_get_table", return_value=SCRATCH_TABLE
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        for date in ("2026-08-15", "2026-09-15", "2026-10-10"):
+            self.insert_reply(date)
+
+    def drop_scratch_tables(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT tablename FROM pg_tables WHERE tablename LIKE %s",
+                [f"{SCRATCH_TABLE}%"],
+            )
+            for (name,) in cursor.fetchall():
+                cursor.execute(f"DROP TABLE IF EXISTS {name} CASCADE")
+
+    def insert_reply(self, date):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {SCRATCH_TABLE} "
+                "(data, reply_type, date_modified, date_created) "
+                "VALUES ('decision=>ACCEPT'::hstore, 1, %s, %s) "
+                "RETURNING id, tableoid::regclass::text",
+                [date, date],
+            )
+            return cursor.fetchone()
+
+    def test_partitions(self):
+        self.assertFalse(partitions.is_partitioned())
+        partitions.convert(now=NOW)
+        self.assertTrue(partitions.is_partitioned())
+
+        # The existing table holds everything up to the start of next month
+        legacy, default = partitions.list_partitions()
+        self.assertEqual(legacy.name, f"{SCRATCH_TABLE}_legacy")
+        self.assertIsNone(legacy.lower)
+        self.assertEqual(legacy.upper, datetime(2026, 11, 1, tzinfo=UTC))
+        self.assertTrue(default.is_default)
+
+        # Indexes are recreated on the partitioned table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT tablename, count(*) FROM pg_indexes "
+                "WHERE tablename IN (%s, %s) GROUP BY tablename",
+                [SCRATCH_TABLE, legacy.name],
+            )
+            counts = dict(cursor.fetchall())
+        self.assertEqual(counts[SCRATCH_TABLE], counts[legacy.name])
+        self.assertGreater(counts[SCRATCH_TABLE], 1)
+
+        # This month is covered by the existing table
+        created = partitions.create_partitions(months_ahead=2, now=NOW)
+        self.assertEqual(
+            created, [f"{SCRATCH_TABLE}_p202611", f"{SCRATCH_TABLE}_p202612"]
+        )
+        self.assertEqual(partitions.create_partitions(months_ahead=2, now=NOW), [])
+
+        # IDs carry on from the existing table
+        reply_id, partition = self.insert_reply("2026-11-05")
+        self.assertEqual(reply_id, 4)
+        self.assertEqual(partition, f"{SCRATCH_TABLE}_p202611")
+        _reply_id, partition = self.insert_reply("2027-05-05")
+        self.assertEqual(partition, f"{SCRATCH_TABLE}_default")
+
+        expired = partitions.expire_partitions(
+            datetime(2026, 12, 1, tzinfo=UTC), drop=True
+        )
+        self.assertEqual(expired, [legacy.name, f"{SCRATCH_TABLE}_p202611"])
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT count(*) FROM {SCRATCH_TABLE}")
+            self.assertEqual(cursor.fetchone()[0], 1)
+            cursor.execute("SELECT to_regclass(%s)", [legacy.name])
+            self.assertIsNone(cursor.fetchone()[0])
+
+    def test_referenced(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE TABLE {SCRATCH_TABLE}_ref "
+                f"(log_id integer REFERENCES {SCRATCH_TABLE} (id))"
+            )
+        with self.assertRaises(ValueError):
+            partitions.convert(now=NOW)
+        self.assertFalse(partitions.is_partitioned())
+
+    def test_saved_tokens_kept(self):
+        partitions.convert(now=NOW)
+        partitions.create_partitions(months_ahead=2, now=NOW)
+        reply_id, partition = self.insert_reply("2026-11-05")
+        self.assertEqual(partition, f"{SCRATCH_TABLE}_p202611")
+        # Only the reply tables are scratch copies, so the IDs are faked
+        processed = ProcessedReply.objects.create(
+            key="uuid:1:abc", log_id=1, redirect_url="/"
+        )
+        PaymentToken.objects.create(
+            log_id=reply_id,
+            token="1234",
+            masked_card_number="xxxxxxxxxxxx1111",
+            card_type="001",
+        )
+
+        # Older partitions are expired, but not the one with the token's reply
+        with self.assertRaises(ValueError):
+            partitions.expire_partitions(datetime(2026, 12, 1, tzinfo=UTC), drop=True)
+        self.assertEqual(
+            [p.name for p in partitions.list_partitions()],
+            [
+                f"{SCRATCH_TABLE}_p202611",
+                f"{SCRATCH_TABLE}_p202612",
+                f"{SCRATCH_TABLE}_default",
+            ],
+        )
+        self.assertTrue(PaymentToken.objects.exists())
+        # Processed replies are kept, without their reply
+        processed.refresh_from_db()
+        self.assertIsNone(processed.log_id)
+
+    def test_detach(self):
+        partitions.convert(now=NOW)
+        expired = partitions.expire_partitions(datetime(2026, 11, 1, tzinfo=UTC))
+        self.assertEqual(expired, [f"{SCRATCH_TABLE}_legacy"])
+        # Detached partitions are kept as ordinary tables
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT count(*) FROM {SCRATCH_TABLE}_legacy")
+            self.assertEqual(cursor.fetchone()[0], 3)
+            cursor.execute(f"SELECT count(*) FROM {SCRATCH_TABLE}")
+            self.assertEqual(cursor.fetchone()[0], 0)
+
+
+class PartitionCommandTest(TestCase):
+    def test_not_partitioned(self):
+        with self.assertRaises(CommandError):
+            call_command("partition_cybersource_replies")
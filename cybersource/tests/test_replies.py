@@ -0,0 +1,140 @@
+from decimal import Decimal as D
+from pathlib import Path
+from types import SimpleNamespace
+import tempfile
+
+from django.test import TestCase, override_settings
+from oscar.test import factories
+import requests_mock
+
+from ..actions import SOAPAction
+from ..replies import Reply, ReplyParser
+from ..test import benchmark, responses
+from ..utils import zeepobj_to_dict
+from . import factories as cs_factories
+
+FIXTURES = sorted(
+    (Path(responses.__file__).resolve().parent / "responses").glob("soap-*.xml")
+)
+
+SOAP_FAULT = """<?xml version="1.0" encoding="utf-8"?>
+<soap:Envelope xmlns:soap="http://schemas.xmlsoap.org/soap/envelope/">
+    <soap:Body>
+        <soap:Fault>
+            <faultcode>soap:Client</faultcode>
+            <faultstring>Invalid merchantID</faultstring>
+        </soap:Fault>
+    </soap:Body>
+</soap:Envelope>"""
+
+
+class ReplyParserTest(TestCase):
+    def setUp(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        bundle_path = f"{tmpdir.name}/cybersource-wsdl.json"
+        cs_factories.build_test_wsdl_bundle(bundle_path)
+        settings_override = override_settings(
+            CYBERSOURCE=cs_factories.soap_test_settings(
+                bundle_path,
+                SOAP_FAST_PARSER=True,
+            ),
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        basket = factories.create_basket()
+        self.order = factories.create_order(
+            basket=basket,
+            billing_address=factories.BillingAddressFactory(),
+            shipping_address=factories.ShippingAddressFactory(),
+        )
+        self.api = SOAPAction(self.order).api
+        self.client = self.api.client
+        self.parser = ReplyParser(self.client)
+
+    def _zeep_reply(self, content):
+        binding = self.client.service._binding
+        response = SimpleNamespace(
+            status_code=200,
+            content=content,
+            encoding="utf-8",
+            headers={"Content-Type": "text/xml; charset=utf-8"},
+        )
+        return binding.process_reply(
+            self.client,
+            binding.get("runTransaction"),
+            response,
+        )
+
+    def test_matches_zeep(self):
+        for path in FIXTURES:
+            with self.subTest(path.name):
+                content = path.read_bytes()
+                reply = self.parser.parse(content)
+                self.assertIsInstance(reply, Reply)
+                self.assertEqual(
+                    zeepobj_to_dict(reply),
+                    zeepobj_to_dict(self._zeep_reply(content)),
+                )
+
+    def test_typed_fields(self):
+        reply = self.parser.parse(responses.SOAP_TOKEN_CREATE_AUTH_ACCEPT.encode())
+        zeep_reply = self._zeep_reply(responses.SOAP_TOKEN_CREATE_AUTH_ACCEPT.encode())
+        self.assertEqual(reply.decision, "ACCEPT")
+        self.assertEqual(reply.reasonCode, zeep_reply.reasonCode)
+        self.assertEqual(reply.requestID, zeep_reply.requestID)
+        self.assertEqual(reply.ccAuthReply.amount, zeep_reply.ccAuthReply.amount)
+        self.assertEqual(
+            reply.ccAuthReply.authorizationCode,
+            zeep_reply.ccAuthReply.authorizationCode,
+        )
+        self.assertEqual(
+            reply.paySubscriptionCreateReply.subscriptionID,
+            zeep_reply.paySubscriptionCreateReply.subscriptionID,
+        )
+        # Missing fields read as None, like they do on zeep's objects
+        self.assertIsNone(reply.afsReply)
+        self.assertIsNone(reply.ccAuthReply.notInTheSchema)
+
+    def test_unparseable_replies(self):
+        self.assertIsNone(self.parser.parse(SOAP_FAULT.encode()))
+        self.assertIsNone(self.parser.parse(b"<not-xml"))
+        content = responses.SOAP_AUTH_ACCEPT.replace(
+            "<c:decision>",
+            "<c:notInTheSchema>foo</c:notInTheSchema><c:decision>",
+        )
+        self.assertIsNone(self.parser.parse(content.encode()))
+
+    def test_send(self):
+        self.assertTrue(self.api.fast_parser)
+        self.assertIsNotNone(self.api.reply_parser)
+        with requests_mock.mock() as rmock:
+            rmock.post(requests_mock.ANY, text=responses.SOAP_AUTH_ACCEPT)
+            response = self.api.authorize(self.order, "token", D("40.00"))
+        self.assertIsInstance(response, Reply)
+        self.assertEqual(response.decision, "ACCEPT")
+
+    def test_send_falls_back_to_zeep(self):
+        with requests_mock.mock() as rmock:
+            rmock.post(
+                requests_mock.ANY,
+                text=SOAP_FAULT,
+                status_code=500,
+                headers={"Content-Type": "text/xml; charset=utf-8"},
+            )
+            response = self.api.authorize(self.order, "token", D("40.00"))
+        # zeep raises a Fault, which is logged and swallowed
+        self.assertIsNone(response)
+
+    @benchmark.benchmark
+    def test_benchmark(self):
+        content = responses.SOAP_TOKEN_CREATE_AUTH_ACCEPT.encode()
+        zeep_time = benchmark.best_of(
+            lambda: zeepobj_to_dict(self._zeep_reply(content))
+        )
+        fast_time = benchmark.best_of(
+            lambda: zeepobj_to_dict(self.parser.parse(content))
+        )
+        speedup = benchmark.report("token/auth reply", zeep_time, fast_time)
+        self.assertGreater(speedup, 1)
@@ -1,13 +1,30 @@
+from io import StringIO
+from unittest import mock
+
 from django.conf import settings
-from django.test import TestCase, override_settings
+from django.core.management import call_command
+from django.db import connection
+from django.db.models.signals import post_save
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
+from lxml import etree
 from oscar.core.loading import get_model
 from oscar.test import factories
 
+from .. import inbox
+from ..constants import DecisionManagerNotificationStatus
+from ..models import DecisionManagerNotification
+from ..notifications import DecisionManagerNote, iter_update_batches, iter_updates
+from ..test import benchmark
+from ..views import DecisionManagerNotificationView
+
 Order = get_model("order", "Order")
 Transaction = get_model("payment", "Transaction")
 SourceType = get_model("payment", "SourceType")
 Source = get_model("payment", "Source")
+OrderNote = get_model("order", "OrderNote")
 
 
 ADDED_NOTE = """<?xml version="1.0" encoding="UTF-8"?>
@@ -81,6 +98,166 @@ REJECTED = """<?xml version="1.0" encoding="UTF-8"?>
 </CaseManagementOrderStatus>"""
 
 
+def _bulk_notification(num_updates, start=0, note_date="2016-08-24 16:31:25"):
+    updates = "".join(
+        f"""
+    <Update MerchantReferenceNumber="{i}" RequestID="{4720554329436778504102 + i}">
+        <OriginalDecision>REVIEW</OriginalDecision>
+        <NewDecision>ACCEPT</NewDecision>
+        <Reviewer>Bill</Reviewer>
+        <ReviewerComments>Bulk review.</ReviewerComments>
+        <Notes>
+            <Note AddedBy="Bill" Comment="Took ownership." Date="{note_date}"/>
+            <Note AddedBy="Bill" Comment="Looks fine." Date="2016-08-24 16:32:25"/>
+        </Notes>
+        <Queue>Review Queue</Queue>
+        <Profile>Auths</Profile>
+    </Update>"""
+        for i in range(start, start + num_updates)
+    )
+    return f"""<?xml version="1.0" encoding="UTF-8"?>
+<CaseManagementOrderStatus
+        Date="2016-08-24 16:31:26 GMT"
+        MerchantID="somemerchant"
+        Name="Case Management Order Status"
+        Version="1.1"
+        xmlns="http://reports.cybersource.com/reports/cmos/1.0">{updates}
+</CaseManagementOrderStatus>"""
+
+
+def _create_reviewed_order(i):
+    order = factories.create_order(
+        number=str(i), status=settings.ORDER_STATUS_AUTHORIZED
+    )
+    stype, _created = SourceType.objects.get_or_create(name="Test")
+    source = Source.objects.create(
+        order=order, source_type=stype, amount_allocated="99.99"
+    )
+    return Transaction.objects.create(
+        source=source,
+        txn_type=Transaction.AUTHORISE,
+        amount="99.99",
+        reference=str(4720554329436778504102 + i),
+        status="REVIEW",
+    )
+
+
+def _tree_updates(content):
+    # The original, whole-document, implementation. Used as the benchmark baseline.
+    root = etree.fromstring(content)
+    updates = []
+    for update in root.xpath("*[local-name()='Update']"):
+        notes = [
+            (note.attrib["AddedBy"], note.attrib["Comment"], note.attrib["Date"])
+            for note in update.xpath("*[local-name()='Notes']/*[local-name()='Note']")
+        ]
+        elems = update.xpath("*[local-name()='NewDecision']")
+        new_decision = elems[0].text if len(elems) else None
+        elems = update.xpath("*[local-name()='Reviewer']")
+        reviewer = elems[0].text if len(elems) else ""
+        elems = update.xpath("*[local-name()='ReviewerComments']")
+        comments = elems[0].text if len(elems) else ""
+        updates.append(
+            (
+                update.attrib["MerchantReferenceNumber"],
+                update.attrib["RequestID"],
+                new_decision,
+                reviewer,
+                comments,
+                notes,
+            )
+        )
+    return updates
+
+
+class DecisionManagerNotificationParserTest(SimpleTestCase):
+    def test_iter_updates(self):
+        update = next(iter_updates(REJECTED.encode()))
+        self.assertEqual(update.order_number, "117037850784")
+        self.assertEqual(update.request_id, "4720554329436778504102")
+        self.assertEqual(update.new_decision, "REJECT")
+        self.assertEqual(update.reviewer, "Bill")
+        self.assertEqual(update.reviewer_comments, "some reason. | Order mis-typed.")
+        self.assertEqual(
+            update.notes,
+            (
+                DecisionManagerNote(
+                    added_by="Bill",
+                    comment="Took ownership.",
+                    date="2016-08-24 16:31:25",
+                ),
+            ),
+        )
+
+    def test_no_new_decision(self):
+        update = next(iter_updates(ADDED_NOTE.encode()))
+        self.assertIsNone(update.new_decision)
+        self.assertEqual(update.reviewer_comments, "")
+        self.assertEqual(len(update.notes), 3)
+
+    def test_updates_are_freed(self):
+        content = _bulk_notification(50).encode()
+        num_children = len(etree.fromstring(content)[0])
+        previous = None
+        count = 0
+        for update in iter_updates(content):
+            self.assertEqual(update.order_number, str(count))
+            # The current update is still whole
+            self.assertEqual(len(update.element), num_children)
+            # Earlier updates have been cleared and removed from the tree
+            if previous is not None:
+                self.assertEqual(len(previous), 0)
+            preceding = list(update.element.itersiblings(preceding=True))
+            self.assertLessEqual(len(preceding), 1)
+            previous = update.element
+            count += 1
+        self.assertEqual(count, 50)
+
+    def test_update_batches_are_freed(self):
+        content = _bulk_notification(50).encode()
+        num_children = len(etree.fromstring(content)[0])
+        previous = []
+        sizes = []
+        for batch in iter_update_batches(content, 20):
+            sizes.append(len(batch))
+            # The current batch is still whole
+            for update in batch:
+                self.assertEqual(len(update.element), num_children)
+            # Every update in earlier batches has been cleared
+            for update in previous:
+                self.assertEqual(len(update.element), 0)
+            previous = batch
+        self.assertEqual(sizes, [20, 20, 10])
+
+    def test_matches_tree_parser(self):
+        content = _bulk_notification(10).encode()
+        self.assertEqual(
+            [
+                (
+                    update.order_number,
+                    update.request_id,
+                    update.new_decision,
+                    update.reviewer,
+                    update.reviewer_comments,
+                    [tuple(note) for note in update.notes],
+                )
+                for update in iter_updates(content)
+            ],
+            _tree_updates(content),
+        )
+
+    @benchmark.benchmark
+    def test_benchmark(self):
+        content = _bulk_notification(500).encode()
+        tree_time = benchmark.best_of(lambda: _tree_updates(content), number=5)
+        stream_time = benchmark.best_of(
+            lambda: list(iter_updates(content)),
+            number=5,
+        )
+        speedup = benchmark.report("500 update notification", tree_time, stream_time)
+        self.assertGreater(speedup, 1)
+
+
 class DecisionManagerNotificationViewTest(TestCase):
     def test_add_note(self):
         order = factories.create_order(
@@ -352,3 +529,211 @@ class DecisionManagerNotificationViewTest(TestCase):
             transaction = Transaction.objects.get(pk=transaction.pk)
             self.assertFalse(transaction.is_pending_review)
             self.assertEqual(transaction.status, "REJECT")
+
+
+class DecisionManagerBatchTest(TestCase):
+    def post(self, content):
+        url = reverse("cybersource-review-notification")
+        return self.client.post(url, {"content": content})
+
+    def test_query_count(self):
+        """The number of queries doesn't depend on the number of updates"""
+        for i in range(25):
+            _create_reviewed_order(i)
+
+        with CaptureQueriesContext(connection) as few:
+            self.post(_bulk_notification(5))
+        with CaptureQueriesContext(connection) as many:
+            self.post(_bulk_notification(20, start=5))
+
+        self.assertEqual(len(few.captured_queries), len(many.captured_queries))
+        self.assertEqual(
+            Transaction.objects.filter(status="ACCEPT").count(),
+            25,
+        )
+        # Two DM notes and a decision note per order
+        order = Order.objects.get(number="12")
+        self.assertEqual(order.notes.count(), 3)
+
+    def test_batches(self):
+        for i in range(5):
+            _create_reviewed_order(i)
+        with mock.patch.object(DecisionManagerNotificationView, "update_batch_size", 2):
+            resp = self.post(_bulk_notification(5))
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(Transaction.objects.filter(status="ACCEPT").count(), 5)
+
+    def test_save_signals(self):
+        _create_reviewed_order(0)
+        transaction_saved = mock.Mock()
+        note_saved = mock.Mock()
+        post_save.connect(transaction_saved, sender=Transaction)
+        self.addCleanup(post_save.disconnect, transaction_saved, sender=Transaction)
+        post_save.connect(note_saved, sender=OrderNote)
+        self.addCleanup(post_save.disconnect, note_saved, sender=OrderNote)
+        self.post(_bulk_notification(1))
+        transaction_saved.assert_called_once()
+        kwargs = transaction_saved.call_args.kwargs
+        self.assertEqual(kwargs["instance"].status, "ACCEPT")
+        self.assertFalse(kwargs["created"])
+        self.assertEqual(kwargs["update_fields"], {"status"})
+        # The new DM notes are saved with primary keys
+        notes = [call.kwargs["instance"] for call in note_saved.call_args_list]
+        self.assertEqual(len(notes), Order.objects.get(number="0").notes.count())
+        self.assertTrue(all(note.pk is not None for note in notes))
+
+    def test_existing_note(self):
+        _create_reviewed_order(0)
+        self.post(_bulk_notification(1, note_date="2016-08-24 16:32:25"))
+        # Notes with the same timestamp are added to the same order note,
+        # including one saved by an earlier notification
+        self.post(_bulk_notification(1, note_date="2016-08-24 16:32:25"))
+        order = Order.objects.get(number="0")
+        note = order.notes.get(
+            message__startswith="[Decision Manager Wed Aug 24 16:32:25 2016]"
+        )
+        self.assertEqual(note.message.count("added comment"), 4)
+
+    def test_missing_order(self):
+        _create_reviewed_order(0)
+        _create_reviewed_order(2)
+        resp = self.post(_bulk_notification(3))
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(
+            set(
+                Transaction.objects.filter(status="ACCEPT").values_list(
+                    "reference", flat=True
+                )
+            ),
+            {str(4720554329436778504102), str(4720554329436778504102 + 2)},
+        )
+
+    def test_failed_update(self):
+        """Updates before one which fails are still saved"""
+        first = _create_reviewed_order(0)
+        second = _create_reviewed_order(1)
+        content = _bulk_notification(2)
+        start = content.index('MerchantReferenceNumber="1"')
+        content = content[:start] + content[start:].replace(
+            "2016-08-24 16:31:25", "not a date", 1
+        )
+        with self.assertRaises(ValueError):
+            self.post(content)
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.status, "ACCEPT")
+        self.assertEqual(second.status, "REVIEW")
+        self.assertEqual(Order.objects.get(number="0").notes.count(), 3)
+        self.assertEqual(Order.objects.get(number="1").notes.count(), 0)
+
+
+class DeferredDecisionManagerTest(TestCase):
+    """Notifications left to process_cybersource_notifications"""
+
+    def setUp(self):
+        super().setUp()
+        settings_override = override_settings(
+            CYBERSOURCE=settings.CYBERSOURCE | {"DECISION_MANAGER_DEFERRED": True},
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def post(self, content):
+        url = reverse("cybersource-review-notification")
+        return self.client.post(url, {"content": content})
+
+    def process_notifications(self):
+        call_command("process_cybersource_notifications", "--once", stdout=StringIO())
+
+    def test_queued(self):
+        first = _create_reviewed_order(0)
+        second = _create_reviewed_order(1)
+        resp = self.post(_bulk_notification(2))
+        self.assertEqual(resp.status_code, 200)
+
+        # Nothing has been applied yet
+        job = DecisionManagerNotification.objects.get()
+        self.assertEqual(job.status, DecisionManagerNotificationStatus.PENDING)
+        first.refresh_from_db()
+        self.assertEqual(first.status, "REVIEW")
+
+        self.process_notifications()
+        job.refresh_from_db()
+        self.assertEqual(job.status, DecisionManagerNotificationStatus.COMPLETE)
+        self.assertEqual(job.attempts, 1)
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.status, "ACCEPT")
+        self.assertEqual(second.status, "ACCEPT")
+        self.assertEqual(Order.objects.get(number="0").notes.count(), 3)
+
+    def test_retry(self):
+        first = _create_reviewed_order(0)
+        _create_reviewed_order(1)
+        content = _bulk_notification(2)
+        start = content.index('MerchantReferenceNumber="1"')
+        content = content[:start] + content[start:].replace(
+            "2016-08-24 16:31:25", "not a date", 1
+        )
+        self.post(content)
+
+        self.process_notifications()
+        job = DecisionManagerNotification.objects.get()
+        self.assertEqual(job.status, DecisionManagerNotificationStatus.PENDING)
+        self.assertEqual(job.attempts, 1)
+        self.assertIn("not a date", job.last_error)
+        self.assertGreater(job.date_next_attempt, timezone.now())
+        # The failed attempt was rolled back entirely
+        first.refresh_from_db()
+        self.assertEqual(first.status, "REVIEW")
+        self.assertEqual(Order.objects.get(number="0").notes.count(), 0)
+
+        # Not retried until it's due
+        self.process_notifications()
+        job.refresh_from_db()
+        self.assertEqual(job.attempts, 1)
+
+        # Dead-lettered once it's out of attempts
+        DecisionManagerNotification.objects.update(date_next_attempt=timezone.now())
+        with override_settings(
+            CYBERSOURCE=settings.CYBERSOURCE
+            | {"DECISION_MANAGER_DEFERRED": True, "DECISION_MANAGER_MAX_ATTEMPTS": 2}
+        ):
+            self.process_notifications()
+        job.refresh_from_db()
+        self.assertEqual(job.status, DecisionManagerNotificationStatus.FAILED)
+        self.assertEqual(job.attempts, 2)
+
+    def test_claim_timeout(self):
+        first = _create_reviewed_order(0)
+        self.post(_bulk_notification(1))
+        # Claimed by a worker which then died
+        (job,) = inbox.claim_notifications(10)
+        self.assertEqual(inbox.claim_notifications(10), [])
+
+        # Claimed again once the claim times out
+        DecisionManagerNotification.objects.update(
+            date_modified=timezone.now() - inbox.CLAIM_TIMEOUT * 2
+        )
+        self.process_notifications()
+        job.refresh_from_db()
+        self.assertEqual(job.status, DecisionManagerNotificationStatus.COMPLETE)
+        self.assertEqual(job.attempts, 2)
+        first.refresh_from_db()
+        self.assertEqual(first.status, "ACCEPT")
+
+    def test_claim_timeout_on_last_attempt(self):
+        self.post(_bulk_notification(1))
+        DecisionManagerNotification.objects.update(
+            status=DecisionManagerNotificationStatus.PROCESSING,
+            attempts=2,
+            date_modified=timezone.now() - inbox.CLAIM_TIMEOUT * 2,
+        )
+        with override_settings(
+            CYBERSOURCE=settings.CYBERSOURCE
+            | {"DECISION_MANAGER_DEFERRED": True, "DECISION_MANAGER_MAX_ATTEMPTS": 2}
+        ):
+            self.process_notifications()
+        job = DecisionManagerNotification.objects.get()
+        self.assertEqual(job.status, DecisionManagerNotificationStatus.FAILED)
+        self.assertEqual(job.last_error, "Timed out while processing")
@@ -1,10 +1,31 @@
-from django.test import TestCase
+import base64
+import hashlib
+import hmac
+
+from django.test import SimpleTestCase, TestCase
 from django.test.client import RequestFactory
 
-from ..signature import SecureAcceptanceSigner
+from ..signature import SecureAcceptanceSigner, get_signer
+from ..test import benchmark
 from .factories import get_sa_profile
 
 
+def _unkeyed_sign(secret_key, data, signed_fields):
+    # The original implementation, which keys a new HMAC for every message.
+    # Used as the benchmark baseline.
+    key = secret_key.encode("utf-8")
+    parts = []
+    for field in signed_fields:
+        parts.append("{}={}".format(field, data.get(field, "")))
+    msg_raw = ",".join(parts).encode("utf-8")
+    return base64.b64encode(hmac.new(key, msg_raw, hashlib.sha256).digest())
+
+
+def _reply_data(num_fields=60):
+    data = {f"field_{i}": f"value {i}" for i in range(num_fields)}
+    return data, list(data.keys())
+
+
 class SignerTest(TestCase):
     fixtures = ("cybersource-test.yaml",)
 
@@ -55,3 +76,77 @@ class SignerTest(TestCase):
             },
         )
         self.assertFalse(signer.verify_request(request))
+
+    def test_sign_many(self):
+        signer = SecureAcceptanceSigner("FOO")
+        signatures = signer.sign_many(
+            [
+                ({"foo": "bar", "baz": "bat"}, ("foo", "baz")),
+                ({"foo": "bar", "baz": "bat"}, ("baz", "foo")),
+            ]
+        )
+        self.assertEqual(
+            signatures,
+            [
+                b"IVMC7Aj8pDKwLx+0eNfIfoQAHvViiLeavLyYatCtB+c=",
+                b"5Gw1ffUlVU9Cm0tTa/nzhQ81Bc6/SDqz/tEP5VyMzkk=",
+            ],
+        )
+
+    def test_get_signer(self):
+        signer = get_signer("FOO")
+        self.assertIs(get_signer("FOO"), signer)
+        self.assertIsNot(get_signer("SECRET"), signer)
+        signature = signer.sign({"foo": "bar", "baz": "bat"}, ("foo", "baz"))
+        self.assertEqual(signature, b"IVMC7Aj8pDKwLx+0eNfIfoQAHvViiLeavLyYatCtB+c=")
+
+
+@benchmark.benchmark
+class SignerBenchmark(SimpleTestCase):
+    def setUp(self):
+        self.data, self.fields = _reply_data()
+        self.signer = SecureAcceptanceSigner("SECRET")
+        self.assertEqual(
+            self.signer.sign(self.data, self.fields),
+            _unkeyed_sign("SECRET", self.data, self.fields),
+        )
+
+    def test_sign(self):
+        baseline = benchmark.best_of(
+            lambda: _unkeyed_sign("SECRET", self.data, self.fields),
+            number=2000,
+        )
+        candidate = benchmark.best_of(
+            lambda: self.signer.sign(self.data, self.fields),
+            number=2000,
+        )
+        speedup = benchmark.report("sign 60 fields", baseline, candidate)
+        self.assertGreater(speedup, 1)
+
+    def test_sign_short_message(self):
+        data, fields = _reply_data(num_fields=2)
+        baseline = benchmark.best_of(
+            lambda: _unkeyed_sign("SECRET", data, fields),
+            number=2000,
+        )
+        candidate = benchmark.best_of(
+            lambda: self.signer.sign(data, fields),
+            number=2000,
+        )
+        speedup = benchmark.report("sign 2 fields", baseline, candidate)
+        self.assertGreater(speedup, 1)
+
+    def test_sign_many(self):
+        messages = [_reply_data() for _ in range(100)]
+        baseline = benchmark.best_of(
+            lambda: [
+                _unkeyed_sign("SECRET", data, fields) for data, fields in messages
+            ],
+            number=20,
+        )
+        candidate = benchmark.best_of(
+            lambda: self.signer.sign_many(messages),
+            number=20,
+        )
+        speedup = benchmark.report("sign_many 100 messages", baseline, candidate)
+        self.assertGreater(speedup, 1)
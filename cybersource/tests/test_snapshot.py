@@ -0,0 +1,157 @@
+from decimal import Decimal as D
+from types import SimpleNamespace
+import tempfile
+
+from django.test import TestCase, override_settings
+from oscar.core.loading import get_model
+from oscar.test import factories
+
+from ..actions import CreatePaymentToken, RecordSuccessfulAuth, SOAPAction
+from ..models import CyberSourceReply, PaymentToken
+from ..snapshot import (
+    clear_order_snapshot,
+    get_order_snapshot,
+    order_snapshot_cache,
+)
+from . import factories as cs_factories
+
+Order = get_model("order", "Order")
+PaymentEventQuantity = get_model("order", "PaymentEventQuantity")
+
+
+class OrderSnapshotTest(TestCase):
+    num_lines = 5
+
+    def setUp(self):
+        basket = factories.create_basket(empty=True)
+        for i in range(self.num_lines):
+            product = factories.create_product(
+                title=f"Product {i}",
+                price=D("10.00"),
+                num_in_stock=10,
+            )
+            basket.add_product(product)
+        order = factories.create_order(
+            basket=basket,
+            billing_address=factories.BillingAddressFactory(),
+            shipping_address=factories.ShippingAddressFactory(),
+        )
+        # Start from a fresh instance, without any related objects cached
+        self.order = Order.objects.get(pk=order.pk)
+
+    def test_build(self):
+        with order_snapshot_cache():
+            # One query each for the billing address, shipping address, and
+            # lines (with their products).
+            with self.assertNumQueries(3):
+                snapshot = get_order_snapshot(self.order)
+            # Reused on later calls
+            with self.assertNumQueries(0):
+                self.assertIs(get_order_snapshot(self.order), snapshot)
+        self.assertEqual(snapshot.number, self.order.number)
+        self.assertEqual(len(snapshot.lines), self.num_lines)
+        self.assertEqual(snapshot.lines[0].product_title, "Product 0")
+        self.assertEqual(snapshot.lines[0].unit_price_incl_tax, D("10.00"))
+        self.assertEqual(
+            snapshot.billing_address.country_code,
+            self.order.billing_address.country.iso_3166_1_a2,
+        )
+
+    def test_not_kept_outside_cache(self):
+        snapshot = get_order_snapshot(self.order)
+        # The prefetched data isn't left on the caller's order
+        self.assertNotIn("lines", getattr(self.order, "_prefetched_objects_cache", {}))
+        # Later changes to the order are picked up
+        self.order.lines.first().delete()
+        with order_snapshot_cache():
+            self.assertEqual(
+                len(get_order_snapshot(self.order).lines),
+                len(snapshot.lines) - 1,
+            )
+        with self.assertNumQueries(3):
+            get_order_snapshot(self.order)
+
+    def test_query_count_independent_of_basket_size(self):
+        order = factories.create_order()
+        order = Order.objects.get(pk=order.pk)
+        with self.assertNumQueries(1):
+            get_order_snapshot(order)
+
+    def test_clear(self):
+        order = Order.objects.select_related("billing_address", "shipping_address").get(
+            pk=self.order.pk
+        )
+        with order_snapshot_cache():
+            snapshot = get_order_snapshot(order)
+            clear_order_snapshot(order)
+            with self.assertNumQueries(1):
+                self.assertEqual(get_order_snapshot(order), snapshot)
+
+    def test_soap_requests_share_snapshot(self):
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        bundle_path = f"{tmpdir.name}/cybersource-wsdl.json"
+        cs_factories.build_test_wsdl_bundle(bundle_path)
+        soap_settings = cs_factories.soap_test_settings(bundle_path)
+        with override_settings(CYBERSOURCE=soap_settings), order_snapshot_cache():
+            api = SOAPAction(self.order).api
+            with self.assertNumQueries(3):
+                token_req = api.build_get_token_request(self.order, "encrypted")
+            with self.assertNumQueries(0):
+                api.build_lookup_payment_token_request(self.order, "token")
+                api.build_authorize_request(self.order, "token", D("50.00"))
+                api.build_advanced_fraud_screen_request(self.order)
+        self.assertEqual(len(token_req["item"]), self.num_lines)
+        self.assertEqual(token_req["item"][4].productName, "Product 4")
+        self.assertEqual(token_req["item"][4].unitPrice, "10.00")
+
+    def test_secure_acceptance_fields(self):
+        action = CreatePaymentToken(
+            session_id="session",
+            order=self.order,
+            method_key="cybersource",
+            amount=D("50.00"),
+            server_hostname="example.com",
+        )
+        with order_snapshot_cache(), self.assertNumQueries(3):
+            data = action.build_signed_data()
+        self.assertEqual(data["line_item_count"], str(self.num_lines))
+        self.assertEqual(data["item_4_name"], "Product 4")
+        self.assertEqual(
+            data["bill_to_address_country"],
+            self.order.billing_address.country.code,
+        )
+
+    def test_record_auth_reuses_snapshot(self):
+        self.enterContext(order_snapshot_cache())
+        get_order_snapshot(self.order)
+        log = CyberSourceReply.objects.create(
+            data={},
+            order=self.order,
+            reason_code=100,
+        )
+        PaymentToken.objects.create(
+            log=log,
+            token="1234",
+            masked_card_number="411111XXXXXX1111",
+            card_type="001",
+        )
+        response = SimpleNamespace(
+            requestID="1234567890",
+            requestToken="token",
+            decision="ACCEPT",
+            ccAuthReply=SimpleNamespace(
+                amount="50.00",
+                authorizedDateTime="2026-10-18T12:00:00Z",
+            ),
+        )
+        state = RecordSuccessfulAuth(log)(
+            order=self.order,
+            token_string="1234",
+            response=response,
+        )
+        self.assertEqual(state.amount, D("50.00"))
+        self.assertEqual(
+            PaymentEventQuantity.objects.filter(event__order=self.order).count(),
+            self.num_lines,
+        )
@@ -0,0 +1,56 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+
+from django.conf import settings as djsettings
+from django.test import SimpleTestCase, override_settings
+
+from ..transport import get_pool_stats, get_session
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self) -> None:
+        self.rfile.read(int(self.headers["Content-Length"]))
+        body = b"<ok/>"
+        self.send_response(200)
+        self.send_header("Content-Type", "text/xml")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args: object) -> None:
+        pass
+
+
+class SessionPoolTest(SimpleTestCase):
+    def setUp(self) -> None:
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), KeepAliveHandler)
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/"
+
+    def test_connections_are_reused(self) -> None:
+        with override_settings(
+            CYBERSOURCE=djsettings.CYBERSOURCE | {"SOAP_POOL_MAXSIZE": 2}
+        ):
+            session = get_session()
+            self.assertIs(session, get_session())
+            for i in range(3):
+                resp = session.post(self.url, data=b"<soap/>")
+                self.assertEqual(resp.status_code, 200)
+            stats = get_pool_stats()
+            self.assertEqual(stats.connections_opened, 1)
+            self.assertEqual(stats.requests, 3)
+            self.assertEqual(stats.connections_reused, 2)
+
+    def test_setting_change_rebuilds_session(self) -> None:
+        session = get_session()
+        session.post(self.url, data=b"<soap/>")
+        with override_settings(
+            CYBERSOURCE=djsettings.CYBERSOURCE | {"SOAP_POOL_MAXSIZE": 2}
+        ):
+            self.assertIsNot(session, get_session())
+            self.assertEqual(get_pool_stats().requests, 0)
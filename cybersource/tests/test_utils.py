@@ -1,6 +1,67 @@
-from django.test import TestCase
+from cryptography.fernet import InvalidToken
+from django.conf import settings
+from django.test import TestCase, override_settings
+from django.utils.encoding import force_bytes, force_str
+from thelabdb.fields import EncryptedTextField
 
-from ..utils import ZeepValue, zeepobj_to_dict
+from ..test import benchmark
+from ..utils import (
+    KeyFilter,
+    ZeepValue,
+    _flatten_dict,
+    decrypt_many,
+    decrypt_session_id,
+    encrypt_many,
+    encrypt_session_id,
+    get_fernet,
+    zeepobj_to_dict,
+)
+
+
+def _recursive_flatten(data_inp: ZeepValue, key_prefix: str = "") -> dict:
+    # The original, recursive, implementation. Used as the benchmark baseline.
+    data_out: dict = {}
+    if data_inp is None:
+        return data_out
+    if isinstance(data_inp, list):
+        for i, child in enumerate(data_inp):
+            data_out |= _recursive_flatten(child, key_prefix=f"{key_prefix}[{i}]")
+        return data_out
+    if isinstance(data_inp, dict):
+        for key, child in data_inp.items():
+            child_key = f"{key_prefix}.{key}" if key_prefix else key
+            data_out |= _recursive_flatten(child, key_prefix=child_key)
+        return data_out
+    data_out[key_prefix] = data_inp
+    return data_out
+
+
+def _synthetic_afs_reply(num_items: int) -> ZeepValue:
+    return {
+        "decision": "ACCEPT",
+        "reasonCode": 100,
+        "afsReply": {
+            "afsResult": 10,
+            "hostSeverity": 1,
+            "afsFactorCode": "F",
+            "item": [
+                {
+                    "id": i,
+                    "rulesTriggered": {
+                        "ruleResultItem": [
+                            {
+                                "name": f"rule{i}-{j}",
+                                "decision": "ACCEPT",
+                                "evaluation": "T",
+                            }
+                            for j in range(3)
+                        ],
+                    },
+                }
+                for i in range(num_items)
+            ],
+        },
+    }
 
 
 class ZeepobjToDictTest(TestCase):
@@ -45,3 +106,86 @@ class ZeepobjToDictTest(TestCase):
                 "metrics[2].day": "Wednesday",
             },
         )
+
+    def test_flatten_order_matches_recursive(self) -> None:
+        inp = _synthetic_afs_reply(20)
+        out = zeepobj_to_dict(inp)
+        self.assertEqual(out, _recursive_flatten(inp))
+        self.assertEqual(list(out.keys()), list(_recursive_flatten(inp).keys()))
+
+    def test_key_filter(self) -> None:
+        inp = _synthetic_afs_reply(3)
+        key_filter = KeyFilter(
+            ["decision", "afsReply.afsResult", "afsReply.item.rulesTriggered"]
+        )
+        out = zeepobj_to_dict(inp, key_filter=key_filter)
+        self.assertEqual(out["decision"], "ACCEPT")
+        self.assertEqual(out["afsReply.afsResult"], 10)
+        self.assertEqual(
+            out["afsReply.item[2].rulesTriggered.ruleResultItem[1].name"],
+            "rule2-1",
+        )
+        self.assertNotIn("reasonCode", out)
+        self.assertNotIn("afsReply.hostSeverity", out)
+        self.assertNotIn("afsReply.item[0].id", out)
+        self.assertEqual(len(out), 2 + 3 * 3 * 3)
+        # The same keys are matched on already-flattened data
+        self.assertEqual(
+            {k for k in zeepobj_to_dict(inp) if k in key_filter},
+            set(out.keys()),
+        )
+
+    @benchmark.benchmark
+    def test_benchmark(self) -> None:
+        # About 1,500 leaves
+        inp = _synthetic_afs_reply(150)
+        self.assertGreater(len(zeepobj_to_dict(inp)), 1000)
+        recursive_time = benchmark.best_of(lambda: _recursive_flatten(inp), number=20)
+        iterative_time = benchmark.best_of(lambda: _flatten_dict(inp), number=20)
+        speedup = benchmark.report(
+            "flatten 1.5k leaf reply", recursive_time, iterative_time
+        )
+        self.assertGreater(speedup, 1)
+
+
+class SessionIdEncryptionTest(TestCase):
+    def test_round_trip(self) -> None:
+        encrypted = encrypt_session_id("abc123")
+        self.assertNotEqual(encrypted, "abc123")
+        self.assertEqual(decrypt_session_id(encrypted), "abc123")
+
+    def test_many(self) -> None:
+        session_ids = [f"session-{i}" for i in range(5)]
+        encrypted = encrypt_many(session_ids)
+        self.assertEqual(len(set(encrypted)), 5)
+        self.assertEqual(decrypt_many(encrypted), session_ids)
+        self.assertEqual(decrypt_session_id(encrypted[2]), "session-2")
+
+    def test_cipher_is_reused(self) -> None:
+        self.assertIs(get_fernet(), get_fernet())
+
+    def test_key_rotation(self) -> None:
+        old_keys = list(settings.FERNET_KEYS)
+        encrypted = encrypt_session_id("abc123")
+        with override_settings(FERNET_KEYS=["new-key", *old_keys]):
+            # Values encrypted with the old key can still be decrypted...
+            self.assertEqual(decrypt_session_id(encrypted), "abc123")
+            # ...but new values are encrypted with the new key
+            encrypted = encrypt_session_id("def456")
+        with self.assertRaises(InvalidToken):
+            decrypt_session_id(encrypted)
+
+    def test_invalid_token(self) -> None:
+        with self.assertRaises(InvalidToken):
+            decrypt_session_id("not-a-token")
+
+    @benchmark.benchmark
+    def test_benchmark(self) -> None:
+        def uncached() -> str:
+            fernet = EncryptedTextField().fernet
+            return force_str(fernet.encrypt(force_bytes("abc123")))
+
+        uncached_time = benchmark.best_of(uncached)
+        cached_time = benchmark.best_of(lambda: encrypt_session_id("abc123"))
+        speedup = benchmark.report("encrypt session ID", uncached_time, cached_time)
+        self.assertGreater(speedup, 1)
@@ -0,0 +1,56 @@
+from pathlib import Path
+import tempfile
+
+from django.core.management import call_command
+from django.test import SimpleTestCase
+from lxml import etree
+from zeep.transports import Transport
+import requests_mock
+import zeep
+
+from ..wsdl import WSDLBundleCache
+
+FIXTURES = Path(__file__).parent.parent / "test" / "wsdl"
+BASE_URL = "https://cybersource.example.com/commerce/1.x/transactionProcessor/"
+WSDL = BASE_URL + "CyberSourceTransaction_test.wsdl"
+XSD = BASE_URL + "CyberSourceTransaction_test.xsd"
+
+
+class WSDLBundleTest(SimpleTestCase):
+    def setUp(self) -> None:
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.bundle_path = Path(tmpdir.name) / "cybersource-wsdl.json"
+
+    def _download(self) -> None:
+        with requests_mock.mock() as rmock:
+            rmock.get(
+                WSDL,
+                content=(FIXTURES / "CyberSourceTransaction_test.wsdl").read_bytes(),
+            )
+            rmock.get(
+                XSD, content=(FIXTURES / "CyberSourceTransaction_test.xsd").read_bytes()
+            )
+            call_command(
+                "download_cybersource_wsdl", wsdl=WSDL, output=str(self.bundle_path)
+            )
+
+    def test_download_bundle(self) -> None:
+        self._download()
+        bundle = WSDLBundleCache.load(self.bundle_path)
+        self.assertEqual(bundle.wsdl, WSDL)
+        self.assertEqual(set(bundle.documents.keys()), {WSDL, XSD})
+
+    def test_load_client_from_bundle(self) -> None:
+        self._download()
+        bundle = WSDLBundleCache.load(self.bundle_path)
+        # Nothing is registered with the mock, so any network I/O would raise.
+        with requests_mock.mock():
+            client = zeep.Client(wsdl=WSDL, transport=Transport(cache=bundle))
+            msg = client.create_message(
+                client.service,
+                "runTransaction",
+                merchantID="merchant-a",
+                merchantReferenceCode="1234",
+            )
+        self.assertIn(b"merchant-a", etree.tostring(msg))
@@ -0,0 +1,199 @@
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any, NamedTuple
+import threading
+
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool
+import requests
+
+from .conf import settings
+
+if TYPE_CHECKING:
+    import httpx
+
+
+class PoolStats(NamedTuple):
+    connections_opened: int
+    requests: int
+
+    @property
+    def connections_reused(self) -> int:
+        return max(self.requests - self.connections_opened, 0)
+
+
+class CountingHTTPAdapter(HTTPAdapter):
+    """
+    HTTP adapter which keeps count of how many connections it has opened and
+    how many requests it has sent over them, including for pools which have
+    since been evicted from the pool manager.
+    """
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        self._retired_connections = 0
+        self._retired_requests = 0
+        self._stats_lock = threading.Lock()
+        super().__init__(*args, **kwargs)
+
+    def init_poolmanager(self, *args: Any, **kwargs: Any) -> None:
+        super().init_poolmanager(*args, **kwargs)
+        pools = self.poolmanager.pools
+        dispose = pools.dispose_func
+
+        def _dispose(pool: HTTPConnectionPool) -> None:
+            with self._stats_lock:
+                self._retired_connections += pool.num_connections
+                self._retired_requests += pool.num_requests
+            if dispose is not None:
+                dispose(pool)
+
+        pools.dispose_func = _dispose
+
+    def stats(self) -> PoolStats:
+        pools = self.poolmanager.pools
+        # Read the live pools directly, since looking them up by key would
+        # bump them in the pool manager's LRU order.
+        with pools.lock:
+            live = list(pools._container.values())
+        with self._stats_lock:
+            connections = self._retired_connections
+            sent = self._retired_requests
+        for pool in live:
+            connections += pool.num_connections
+            sent += pool.num_requests
+        return PoolStats(connections_opened=connections, requests=sent)
+
+
+class SessionPool:
+    """
+    Process-wide HTTP session used for every SOAP call, so that TCP and TLS
+    connections to Cybersource are kept alive and reused between transactions.
+
+    Pool sizing comes from the ``SOAP_POOL_*`` settings. The session is rebuilt
+    lazily after a settings change.
+    """
+
+    def __init__(self) -> None:
+        self._session: requests.Session | None = None
+        self._adapter: CountingHTTPAdapter | None = None
+        self._lock = threading.Lock()
+
+    def _build(self) -> tuple[requests.Session, CountingHTTPAdapter]:
+        adapter = CountingHTTPAdapter(
+            pool_connections=settings.SOAP_POOL_CONNECTIONS,
+            pool_maxsize=settings.SOAP_POOL_MAXSIZE,
+            pool_block=settings.SOAP_POOL_BLOCK,
+        )
+        session = requests.Session()
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session, adapter
+
+    def get(self) -> requests.Session:
+        session = self._session
+        if session is not None:
+            return session
+        with self._lock:
+            if self._session is None:
+                self._session, self._adapter = self._build()
+            return self._session
+
+    def stats(self) -> PoolStats:
+        adapter = self._adapter
+        if adapter is None:
+            return PoolStats(connections_opened=0, requests=0)
+        return adapter.stats()
+
+    def reset(self) -> None:
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+            self._session = None
+            self._adapter = None
+
+
+class ExecutorPool:
+    """
+    Process-wide, bounded thread pool used to send independent SOAP calls
+    concurrently. Sized by the ``SOAP_MAX_WORKERS`` setting.
+    """
+
+    def __init__(self) -> None:
+        self._executor: ThreadPoolExecutor | None = None
+        self._lock = threading.Lock()
+
+    def get(self) -> ThreadPoolExecutor:
+        executor = self._executor
+        if executor is not None:
+            return executor
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=settings.SOAP_MAX_WORKERS,
+                    thread_name_prefix="cybersource-soap",
+                )
+            return self._executor
+
+    def reset(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                # Let any in-flight calls finish on the old pool
+                self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+_pool = SessionPool()
+_executor = ExecutorPool()
+
+
+def get_session() -> requests.Session:
+    """
+    Get the shared ``requests.Session`` used to talk to the SOAP API.
+    """
+    return _pool.get()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """
+    Get the shared thread pool used to send SOAP calls concurrently.
+    """
+    return _executor.get()
+
+
+def get_pool_stats() -> PoolStats:
+    """
+    Get counts of connections opened and requests sent by the shared session.
+    Requests beyond the number of connections opened were sent over a reused,
+    kept-alive connection.
+    """
+    return _pool.stats()
+
+
+def build_async_http_client() -> httpx.AsyncClient:
+    """
+    Build an ``httpx.AsyncClient`` for async SOAP calls, sized by the same
+    ``SOAP_POOL_*`` settings as the sync session.
+
+    httpx connection pools are bound to the event loop they're first used on,
+    so callers should build one client per loop rather than sharing one
+    process-wide.
+    """
+    import httpx
+
+    return httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=(
+                settings.SOAP_POOL_MAXSIZE if settings.SOAP_POOL_BLOCK else None
+            ),
+            max_keepalive_connections=settings.SOAP_POOL_MAXSIZE,
+        ),
+    )
+
+
+@receiver(setting_changed)
+def on_setting_changed(*args: Any, **kwargs: Any) -> None:
+    _pool.reset()
+    _executor.reset()
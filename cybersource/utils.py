@@ -1,9 +1,14 @@
 from __future__ import annotations
 
-from collections.abc import Mapping
+from collections.abc import Iterable, Mapping
+from functools import cache
 from typing import TYPE_CHECKING, Any, cast
 import json
+import re
 
+from cryptography.fernet import Fernet, MultiFernet
+from django.core.signals import setting_changed
+from django.dispatch import receiver
 from django.utils.encoding import force_bytes, force_str
 from django.utils.safestring import mark_safe
 from rest_framework.request import Request
@@ -11,6 +16,8 @@ from thelabdb.fields import EncryptedTextField
 from zeep.xsd import CompoundValue
 import zeep.helpers
 
+from .replies import Reply
+
 if TYPE_CHECKING:
     from django.utils.safestring import SafeString
 
@@ -21,32 +28,117 @@ type ZeepValue = (
 type FlattenedZeepDict = dict[ZeepDictKey, str | int | float]
 
 
-def _flatten_dict(data_inp: ZeepValue, key_prefix: str = "") -> FlattenedZeepDict:
+_LIST_INDEX = re.compile(r"\[\d+\]")
+
+
+class KeyFilter:
+    """
+    Whitelist of flattened key paths, such as ``ccAuthReply.amount``.
+
+    List indices are ignored when matching (``afsReply.item`` matches
+    ``afsReply.item[3]``), and a path also matches every key nested below it
+    (``ccAuthReply`` matches ``ccAuthReply.amount``).
+    """
+
+    def __init__(self, paths: Iterable[str]) -> None:
+        self.paths = frozenset(paths)
+        parents: set[str] = set()
+        for path in self.paths:
+            parts = path.split(".")
+            for i in range(1, len(parts)):
+                parents.add(".".join(parts[:i]))
+        self.parents = frozenset(parents)
+
+    def __contains__(self, key: object) -> bool:
+        if not isinstance(key, str):
+            return False
+        path = _LIST_INDEX.sub("", key)
+        while path not in self.paths:
+            if "." not in path:
+                return False
+            path = path.rsplit(".", 1)[0]
+        return True
+
+
+def _flatten_dict(
+    data_inp: ZeepValue,
+    key_filter: KeyFilter | None = None,
+) -> FlattenedZeepDict:
+    if key_filter is not None:
+        return _flatten_dict_filtered(data_inp, key_filter)
     data_out: FlattenedZeepDict = {}
-    # Handle None
-    if data_inp is None:
-        return data_out
-    # Handle lists
-    if isinstance(data_inp, list):
-        for i, child in enumerate(data_inp):
-            child_key = f"{key_prefix}[{i}]"
-            data_out |= _flatten_dict(child, key_prefix=child_key)
-        return data_out
-    # Handle dicts
-    if isinstance(data_inp, dict):
-        for key, child in data_inp.items():
-            child_key = f"{key_prefix}.{key}" if key_prefix else key
-            data_out |= _flatten_dict(child, key_prefix=child_key)
-        return data_out
-    # Handle primitives
-    data_out[key_prefix] = data_inp
+    # Walk the data depth-first, using an explicit stack rather than recursion,
+    # so that every key is written to the output exactly once. Children are
+    # pushed in reverse, so that they're popped (and output) in their original
+    # order.
+    stack: list[tuple[str, ZeepValue]] = [("", data_inp)]
+    push = stack.append
+    pop = stack.pop
+    while stack:
+        key, value = pop()
+        # Handle None
+        if value is None:
+            continue
+        # Handle dicts
+        if isinstance(value, dict):
+            for name, child in reversed(value.items()):
+                push((f"{key}.{name}" if key else name, child))
+        # Handle lists
+        elif isinstance(value, list):
+            for i in range(len(value) - 1, -1, -1):
+                push((f"{key}[{i}]", value[i]))
+        # Handle primitives
+        else:
+            data_out[key] = value
     return data_out
 
 
-def zeepobj_to_dict(zeepobj: ZeepValue | CompoundValue) -> FlattenedZeepDict:
-    """Convert a zeep CompoundValue object into a flattened dictionary"""
+def _flatten_dict_filtered(
+    data_inp: ZeepValue,
+    key_filter: KeyFilter,
+) -> FlattenedZeepDict:
+    data_out: FlattenedZeepDict = {}
+    # Same as _flatten_dict, but also tracks each key's path (the key without
+    # list indices) so that branches outside the whitelist can be skipped
+    # without walking them. ``matched`` is set once a path is whitelisted, at
+    # which point everything below it is included.
+    stack: list[tuple[str, str, ZeepValue, bool]] = [
+        ("", "", data_inp, "" in key_filter.paths)
+    ]
+    while stack:
+        key, path, value, matched = stack.pop()
+        if value is None:
+            continue
+        if isinstance(value, dict):
+            for name, child in reversed(value.items()):
+                child_path = f"{path}.{name}" if path else name
+                child_matched = matched or child_path in key_filter.paths
+                if child_matched or child_path in key_filter.parents:
+                    child_key = f"{key}.{name}" if key else name
+                    stack.append((child_key, child_path, child, child_matched))
+        elif isinstance(value, list):
+            for i in range(len(value) - 1, -1, -1):
+                stack.append((f"{key}[{i}]", path, value[i], matched))
+        elif matched:
+            data_out[key] = value
+    return data_out
+
+
+def zeepobj_to_dict(
+    zeepobj: ZeepValue | CompoundValue | Reply,
+    key_filter: KeyFilter | None = None,
+) -> FlattenedZeepDict:
+    """
+    Convert a zeep CompoundValue object into a flattened dictionary. If a
+    ``key_filter`` is given, only keys matching it are included.
+    """
+    if isinstance(zeepobj, Reply):
+        # Already flattened while it was parsed
+        if key_filter is None:
+            return dict(zeepobj.flattened)
+        return {k: v for k, v in zeepobj.flattened.items() if k in key_filter}
     data: ZeepValue = zeep.helpers.serialize_object(zeepobj)
-    return _flatten_dict(data)
+    return _flatten_dict(data, key_filter=key_filter)
 
 
 def format_json_for_display(data: Any, width: str = "auto") -> str | SafeString:
@@ -70,17 +162,45 @@ def get_request_data(request: Request) -> Mapping[str, Any]:
     return cast(Mapping[str, Any], request.data)
 
 
+@cache
+def get_fernet() -> MultiFernet | Fernet:
+    """
+    Get the cipher used to encrypt session IDs.
+
+    This is the same cipher (and keys) that ``EncryptedTextField`` uses, but
+    derived from settings once rather than on every call. When
+    ``FERNET_KEYS`` lists more than one key, it's a ``MultiFernet``, so values
+    are encrypted with the first key and can be decrypted with any of them.
+    """
+    return EncryptedTextField().fernet
+
+
 def encrypt_session_id(session_id: str) -> str:
-    fernet = EncryptedTextField().fernet
-    session_id_bytes = force_bytes(session_id)
-    encrypted_bytes = fernet.encrypt(session_id_bytes)
-    encrypted_str = force_str(encrypted_bytes)
-    return encrypted_str
+    return encrypt_many([session_id])[0]
 
 
 def decrypt_session_id(encrypted_str: str) -> str:
-    fernet = EncryptedTextField().fernet
-    encrypted_bytes = force_bytes(encrypted_str)
-    session_id_bytes = fernet.decrypt(encrypted_bytes)
-    session_id = force_str(session_id_bytes)
-    return session_id
+    return decrypt_many([encrypted_str])[0]
+
+
+def encrypt_many(values: Iterable[str]) -> list[str]:
+    """
+    Encrypt each of the given strings (e.g. session IDs).
+    """
+    fernet = get_fernet()
+    return [force_str(fernet.encrypt(force_bytes(value))) for value in values]
+
+
+def decrypt_many(values: Iterable[str]) -> list[str]:
+    """
+    Decrypt each of the given strings. Raises ``cryptography.fernet.InvalidToken``
+    if any of them can't be decrypted.
+    """
+    fernet = get_fernet()
+    return [force_str(fernet.decrypt(force_bytes(value))) for value in values]
+
+
+@receiver(setting_changed)
+def on_setting_changed(*args: Any, **kwargs: Any) -> None:
+    # The keys are derived from SECRET_KEY / FERNET_KEYS
+    get_fernet.cache_clear()
@@ -1,18 +1,20 @@
 from __future__ import annotations
 
-from collections.abc import Callable, Mapping
+from collections.abc import Callable, Iterable, Mapping, Sequence
 from decimal import Decimal
-from typing import TYPE_CHECKING, Any, ClassVar, cast
+from typing import Any, ClassVar, NamedTuple, Self
 import logging
 import uuid
 
 from django.core.exceptions import SuspiciousOperation
-from django.db import transaction
+from django.db import router, transaction
+from django.db.models import Model
+from django.db.models.signals import post_save, pre_save
+from django.dispatch import Signal
 from django.http import Http404, HttpRequest, HttpResponse
-from django.shortcuts import get_object_or_404, redirect
-from django.utils.encoding import force_str
+from django.shortcuts import redirect
+from django.utils import timezone
 from django.views import generic
-from lxml import etree
 from oscar.core.loading import get_model
 from oscarapicheckout import states, utils
 from oscarapicheckout.settings import ORDER_STATUS_PAYMENT_DECLINED
@@ -22,24 +24,36 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 import dateutil.parser
 
-from . import actions, signature
+from . import actions, deferred, signature
 from .authentication import CSRFExemptSessionAuthentication
 from .conf import settings
 from .constants import CHECKOUT_FINGERPRINT_SESSION_ID, Decision
 from .methods import Cybersource
-from .models import CyberSourceReply, SecureAcceptanceProfile
-from .signals import received_decision_manager_update
+from .models import (
+    CyberSourceReply,
+    DecisionManagerNotification,
+    PaymentToken,
+    ProcessedReply,
+    SecureAcceptanceProfile,
+)
+from .notifications import (
+    DecisionManagerNote,
+    DecisionManagerUpdate,
+    iter_update_batches,
+)
+from .signals import received_decision_manager_update, received_duplicate_reply
+from .snapshot import order_snapshot_cache
 from .utils import decrypt_session_id, get_request_data
 
 Order = get_model("order", "Order")
 OrderNote = get_model("order", "OrderNote")
 Transaction = get_model("payment", "Transaction")
 
-if TYPE_CHECKING:
-    from lxml.etree import _Element
-
 logger = logging.getLogger(__name__)
 
+# Notes copied from Decision Manager start with this, followed by the date
+_DM_NOTE_PREFIX = "[Decision Manager "
+
 
 class FingerprintRedirectView(generic.View):
     url_types: ClassVar[dict[str, str]] = {
@@ -69,6 +83,35 @@ class FingerprintRedirectView(generic.View):
         return redirect(url)
 
 
+class ReplyContext(NamedTuple):
+    """
+    A Secure Acceptance reply, parsed once by :class:`CyberSourceReplyView`
+    and passed down to its handlers.
+    """
+
+    request: Request
+    data: Mapping[str, Any]
+    #: Locked (``SELECT ... FOR UPDATE``) while the handler runs
+    order: Order
+    transaction_type: str
+    method_key: str
+    amount: Decimal
+
+
+class PendingAuthorization(NamedTuple):
+    """
+    Returned by a reply handler which needs an authorization to be made
+    against the given token, once the order lock has been released.
+    """
+
+    token: PaymentToken
+
+
+type ReplyHandler = Callable[
+    [ReplyContext, CyberSourceReply], HttpResponse | PendingAuthorization
+]
+
+
 class CyberSourceReplyView(APIView):
     """
     Handle a CyberSource reply.
@@ -77,8 +120,11 @@ class CyberSourceReplyView(APIView):
     authentication_classes = (CSRFExemptSessionAuthentication,)
 
     def post(self, request: Request, format: Any = None) -> HttpResponse:
+        data = get_request_data(request)
         if not self.is_request_valid(request):
             raise SuspiciousOperation("Bad Signature")
+        trans_type = data.get("req_transaction_type", "")
+        handler = self.get_handler_fn(trans_type)
 
         # Resume Session using the encrypted session ID in the Cybersource request
         # Why is this needed?
@@ -92,42 +138,120 @@ class CyberSourceReplyView(APIView):
         # To get around that we store the (encrypted) session ID as merchant defined data sent to
         # Cybersource. Cybersource then sends us that value back with their reply, where we decrypt
         # it, and use it to rehydrate the user's real session.
-        session_id_field_name = (
-            f"req_{actions.SecureAcceptanceOrderAction.session_id_field_name}"
-        )
-        encrypted_session_id = get_request_data(request).get(session_id_field_name, "")
-        session_id = decrypt_session_id(encrypted_session_id)
+        session_id = decrypt_session_id(self._get_encrypted_session_id(data))
         request.session._session_key = session_id
         delattr(request.session, "_session_cache")
 
-        # Record in reply log
+        context = ReplyContext(
+            request=request,
+            data=data,
+            order=self._get_order(data),
+            transaction_type=trans_type,
+            method_key=self._get_method_key(data),
+            amount=Decimal(data.get("req_amount", "0.00")),
+        )
+
+        # Record in reply log. This is committed on its own, before anything
+        # else, so that every reply is kept, even if handling it fails.
         log = CyberSourceReply.log_secure_acceptance_response(
-            order=self._get_order(request),
+            order=context.order,
             request=request,
         )
 
-        # Invoke handler for transaction type
-        trans_type = get_request_data(request).get("req_transaction_type", "")
-        handler = self.get_handler_fn(trans_type)
+        reply_key = ProcessedReply.get_key(data)
         with transaction.atomic():
-            resp = handler(request, log)
-
-        # Save session and return response
-        request.session.save()
+            self._lock_order(context.order)
+
+            # Answer retried and double-submitted replies the same way as the
+            # first copy, without handling them again. Replies for the same
+            # order wait on each other for the order lock, so a duplicate
+            # always finds the first copy's outcome.
+            processed = (
+                ProcessedReply.objects.filter(key=reply_key).first()
+                if reply_key is not None
+                else None
+            )
+            if processed is not None:
+                return self.replay_reply(processed)
+
+            # Invoke handler for transaction type
+            result = handler(context, log)
+
+            # Until the authorization has been made, duplicates are sent to
+            # wait for it on the pending page.
+            resp = (
+                redirect(settings.REDIRECT_PENDING)
+                if isinstance(result, PendingAuthorization)
+                else result
+            )
+            redirect_url = resp.get("Location")
+            if reply_key is not None and redirect_url is not None:
+                ProcessedReply.objects.create(
+                    key=reply_key,
+                    log=log,
+                    redirect_url=redirect_url,
+                )
+
+        # Authorize the payment without holding the order lock (or any
+        # transaction) while we wait on Cybersource
+        if isinstance(result, PendingAuthorization):
+            resp = self.authorize(context, result.token)
+            redirect_url = resp.get("Location")
+            if reply_key is not None and redirect_url is not None:
+                ProcessedReply.objects.filter(key=reply_key).update(
+                    redirect_url=redirect_url,
+                    date_modified=timezone.now(),
+                )
+
+        # Save session and return response. When the authorization has been
+        # deferred, the session is left untouched, so that this doesn't
+        # overwrite the payment state saved by the worker.
+        if request.session.modified:
+            request.session.save()
         return resp
 
+    def authorize(self, context: ReplyContext, token: PaymentToken) -> HttpResponse:
+        order = context.order
+        action = actions.AuthorizePayment(order, context.request, context.method_key)
+        with order_snapshot_cache():
+            response = action.api.authorize(
+                order,
+                token=token.token,
+                amount=context.amount,
+                request=context.request,
+                method_key=context.method_key,
+            )
+            with transaction.atomic():
+                self._lock_order(order)
+                auth_state = action.record_auth(
+                    response,
+                    token_string=token.token,
+                    amount=context.amount,
+                    update_session=True,
+                    token=token,
+                )
+        # If authorization was declined, redirect to the failure page.
+        if auth_state.status == states.DECLINED:
+            return redirect(settings.REDIRECT_FAIL)
+        return redirect(settings.REDIRECT_SUCCESS)
+
+    def replay_reply(self, processed: ProcessedReply) -> HttpResponse:
+        processed.record_duplicate()
+        logger.info(
+            "Replaying duplicate Cybersource reply %s (seen %s times)",
+            processed.key,
+            processed.duplicate_count + 1,
+        )
+        received_duplicate_reply.send_robust(self.__class__, processed=processed)
+        return redirect(processed.redirect_url)
+
     def is_request_valid(self, request: Request) -> bool:
         server_hostname = request.headers.get("host", "")
         profile = SecureAcceptanceProfile.get_profile(server_hostname)
-        return signature.SecureAcceptanceSigner(profile.secret_key).verify_request(
-            request
-        )
+        return signature.get_signer(profile.secret_key).verify_request(request)
 
-    def get_handler_fn(
-        self,
-        trans_type: str,
-    ) -> Callable[[Request, CyberSourceReply], HttpResponse]:
-        handlers: Mapping[str, Callable[[Request, CyberSourceReply], HttpResponse]] = {
+    def get_handler_fn(self, trans_type: str) -> ReplyHandler:
+        handlers: Mapping[str, ReplyHandler] = {
             actions.CreatePaymentToken.transaction_type: self.record_token,
         }
         if trans_type not in handlers:
@@ -136,14 +260,13 @@ class CyberSourceReplyView(APIView):
 
     def record_token(
         self,
-        request: Request,
+        context: ReplyContext,
         reply_log_entry: CyberSourceReply,
-    ) -> HttpResponse:
-        # Fetch the related order
-        order = self._get_order(request)
-        method_key = self._get_method_key(request)
-        create_token_resp_data = get_request_data(request)
-        amount = Decimal(create_token_resp_data.get("req_amount", "0.00"))
+    ) -> HttpResponse | PendingAuthorization:
+        request = context.request
+        order = context.order
+        method_key = context.method_key
+        amount = context.amount
 
         # Figure out what status the order is in.
         token_decision = reply_log_entry.get_decision()
@@ -156,34 +279,169 @@ class CyberSourceReplyView(APIView):
 
         # Record the new payment token
         token = actions.RecordPaymentToken(reply_log_entry, request, method_key)(
-            token_string=create_token_resp_data.get("payment_token", ""),
-            card_num=create_token_resp_data.get("req_card_number", ""),
-            card_type=create_token_resp_data.get("req_card_type", ""),
+            token_string=context.data.get("payment_token", ""),
+            card_num=context.data.get("req_card_number", ""),
+            card_type=context.data.get("req_card_type", ""),
         )
 
-        # Try to authorize the payment
-        auth_state = actions.AuthorizePayment(order, request, method_key)(
-            token_string=token.token,
-            amount=amount,
-            update_session=True,
-        )
-        # If authorization was declined, redirect to the failure page.
-        if auth_state.status == states.DECLINED:
-            return redirect(settings.REDIRECT_FAIL)
-        return redirect(settings.REDIRECT_SUCCESS)
+        # Leave the authorization to the worker, and have the user wait for it
+        if settings.DEFERRED_AUTHORIZATION:
+            deferred.enqueue_authorization(
+                order=order,
+                reply_log_entry=reply_log_entry,
+                token=token,
+                method_key=method_key,
+                amount=amount,
+                request=request,
+                encrypted_session_id=self._get_encrypted_session_id(context.data),
+            )
+            return redirect(settings.REDIRECT_PENDING)
+
+        # Try to authorize the payment, once the order lock has been released
+        return PendingAuthorization(token=token)
 
-    def _get_order(self, request: Request) -> Order:
+    def _get_order(self, data: Mapping[str, Any]) -> Order:
+        # Fetch the addresses needed to authorize the order along with it
+        orders = Order.objects.select_related("billing_address", "shipping_address")
         try:
-            order = Order.objects.get(
-                number=get_request_data(request).get("req_reference_number")
-            )
+            order = orders.get(number=data.get("req_reference_number"))
         except Order.DoesNotExist:
             raise SuspiciousOperation("Order not found.")
         return order
 
-    def _get_method_key(self, request: Request) -> str:
+    def _lock_order(self, order: Order) -> None:
+        # Lock the order (but not its addresses) for the rest of the
+        # transaction, and pick up any changes made while we waited on it.
+        order.refresh_from_db(
+            from_queryset=Order.objects.select_for_update(of=("self",))
+        )
+
+    def _get_method_key(self, data: Mapping[str, Any]) -> str:
         field_name = f"req_{actions.SecureAcceptanceOrderAction.method_key_field_name}"
-        return get_request_data(request).get(field_name, Cybersource.code)
+        return data.get(field_name, Cybersource.code)
+
+    def _get_encrypted_session_id(self, data: Mapping[str, Any]) -> str:
+        field_name = f"req_{actions.SecureAcceptanceOrderAction.session_id_field_name}"
+        return data.get(field_name, "")
+
+
+class DecisionManagerBatch:
+    """
+    The orders, transactions, and existing Decision Manager notes for a batch
+    of Decision Manager updates, and the changes made to them, which are saved
+    together by :meth:`save`.
+    """
+
+    def __init__(
+        self,
+        orders: Mapping[str, Order],
+        transactions: Mapping[tuple[int, str], Transaction],
+        notes: Mapping[tuple[int, str], OrderNote],
+    ) -> None:
+        self.orders = orders
+        self.transactions = transactions
+        #: DM notes by order ID and message prefix, including unsaved ones
+        self.notes = dict(notes)
+        self.new_notes: list[OrderNote] = []
+        self.changed_notes: dict[int, OrderNote] = {}
+        self.changed_transactions: dict[int, Transaction] = {}
+        self.declined_orders: dict[int, Order] = {}
+
+    @classmethod
+    def load(cls, updates: Sequence[DecisionManagerUpdate]) -> Self:
+        """
+        Fetch everything needed to apply the given updates, with one query each
+        for the orders, transactions, and notes.
+        """
+        orders = Order.objects.in_bulk(
+            {update.order_number for update in updates},
+            field_name="number",
+        )
+        transactions = {
+            (txn.source.order_id, txn.reference): txn
+            for txn in Transaction.objects.filter(
+                source__order__in=orders.values(),
+                reference__in={update.request_id for update in updates},
+            ).select_related("source")
+        }
+        notes: dict[tuple[int, str], OrderNote] = {}
+        # Most recently updated first, so each prefix keeps the note that
+        # `.first()` used to find
+        for note in OrderNote.objects.filter(
+            order__in=orders.values(),
+            note_type=OrderNote.SYSTEM,
+            message__startswith=_DM_NOTE_PREFIX,
+        ).order_by("-date_updated"):
+            prefix = note.message[: note.message.find("]") + 1]
+            notes.setdefault((note.order_id, prefix), note)
+        return cls(orders, transactions, notes)
+
+    def add_note(self, order: Order, prefix: str, text: str) -> None:
+        note = self.notes.get((order.pk, prefix))
+        if note is None:
+            note = OrderNote(order=order, note_type=OrderNote.SYSTEM, message="")
+            self.notes[(order.pk, prefix)] = note
+            self.new_notes.append(note)
+        elif note.pk is not None:
+            self.changed_notes[note.pk] = note
+        note.message += text
+
+    def save(self) -> None:
+        """
+        Save the batch, with one query each for the new notes, changed notes,
+        and changed transactions.
+
+        ``bulk_create`` and ``bulk_update`` don't send the model save signals,
+        so ``pre_save`` and ``post_save`` are sent for each of those objects
+        here, just as if they had been saved one at a time.
+        """
+        now = timezone.now()
+        for note in self.changed_notes.values():
+            note.date_updated = now
+        note_fields = frozenset(["message", "date_updated"])
+        transaction_fields = frozenset(["status"])
+        with transaction.atomic():
+            _send_save_signal(pre_save, self.new_notes)
+            _send_save_signal(pre_save, self.changed_notes.values(), note_fields)
+            _send_save_signal(
+                pre_save, self.changed_transactions.values(), transaction_fields
+            )
+            OrderNote.objects.bulk_create(self.new_notes)
+            OrderNote.objects.bulk_update(self.changed_notes.values(), note_fields)
+            Transaction.objects.bulk_update(
+                self.changed_transactions.values(),
+                transaction_fields,
+            )
+            _send_save_signal(post_save, self.new_notes, created=True)
+            _send_save_signal(post_save, self.changed_notes.values(), note_fields)
+            _send_save_signal(
+                post_save, self.changed_transactions.values(), transaction_fields
+            )
+            for order in self.declined_orders.values():
+                order.save()
+
+
+def _send_save_signal(
+    signal: Signal,
+    instances: Iterable[Model],
+    update_fields: frozenset[str] | None = None,
+    created: bool = False,
+) -> None:
+    """
+    Send ``pre_save`` or ``post_save`` for objects saved in bulk, with the
+    same arguments as ``Model.save`` would have sent them with.
+    """
+    for instance in instances:
+        kwargs: dict[str, Any] = {
+            "sender": type(instance),
+            "instance": instance,
+            "raw": False,
+            "using": router.db_for_write(type(instance), instance=instance),
+            "update_fields": update_fields,
+        }
+        if signal is post_save:
+            kwargs["created"] = created
+        signal.send(**kwargs)
 
 
 class DecisionManagerNotificationView(APIView):
@@ -193,18 +451,29 @@ class DecisionManagerNotificationView(APIView):
 
     authentication_classes = (CSRFExemptSessionAuthentication,)
 
+    #: Number of updates to load and save together
+    update_batch_size = 100
+
     def post(self, request: Request, format: Any = None) -> Response:
         self._check_auth_token(request)
-        xml = get_request_data(request).get("content", "").encode()
-        root = etree.fromstring(xml)
-        # Loop through order updates
-        for update in cast(list["_Element"], root.xpath("*[local-name()='Update']")):
-            try:
-                self._handle_update(update)
-            except Http404:
-                pass
+        content = get_request_data(request).get("content", "")
+        if settings.DECISION_MANAGER_DEFERRED:
+            # Acknowledge the notification right away, and leave it for
+            # process_cybersource_notifications to apply
+            DecisionManagerNotification.objects.create(content=content)
+        else:
+            self.handle_notification(content.encode())
         return Response(status=status.HTTP_200_OK)
 
+    def handle_notification(self, content: bytes) -> None:
+        """
+        Apply the updates in the given notification, and notify the
+        ``received_decision_manager_update`` receivers of each.
+        """
+        # Loop through batches of order updates
+        for updates in iter_update_batches(content, self.update_batch_size):
+            self._handle_updates(updates)
+
     def _check_auth_token(self, request: Request) -> None:
         # TODO: This is kind-of lousy to home roll web-hook authentication this way. We should investigate
         # better ways of doing this and, if necessary, make it into it's own package.
@@ -215,85 +484,97 @@ class DecisionManagerNotificationView(APIView):
         if auth_key not in auth_keys:
             raise SuspiciousOperation("Invalid decision manager key")
 
-    @transaction.atomic
-    def _handle_update(self, update: _Element) -> None:
-        order = self._get_order(update)
-        transaction = self._get_transaction(order, update)
+    def _handle_updates(self, updates: Sequence[DecisionManagerUpdate]) -> None:
+        batch = DecisionManagerBatch.load(updates)
+        handled: list[tuple[Order, Transaction, DecisionManagerUpdate]] = []
+        try:
+            for update in updates:
+                try:
+                    order, transaction = self._handle_update(batch, update)
+                except Http404:
+                    continue
+                handled.append((order, transaction, update))
+        finally:
+            # An update which fails doesn't stop the ones before it from being
+            # saved, just like when each update was saved on its own.
+            batch.save()
+            # Send signal to notify other parts of the app that should know
+            for order, transaction, update in handled:
+                received_decision_manager_update.send_robust(
+                    self.__class__,
+                    order=order,
+                    transaction=transaction,
+                    update=update.element,
+                )
+
+    def _handle_update(
+        self,
+        batch: DecisionManagerBatch,
+        update: DecisionManagerUpdate,
+    ) -> tuple[Order, Transaction]:
+        order = self._get_order(batch, update)
+        transaction = self._get_transaction(batch, order, update)
+        # Work out everything that can fail before changing anything, so that
+        # a failed update leaves nothing behind in the batch.
+        notes = [self._format_order_note(note) for note in update.notes]
 
         # Save any notes attached to the order in DM
-        for note_elem in cast(
-            list["_Element"],
-            update.xpath("*[local-name()='Notes']/*[local-name()='Note']"),
-        ):
-            self._save_order_note(order, note_elem)
+        for prefix, text in notes:
+            batch.add_note(order, prefix, text)
 
         # Update order status
-        self._update_decision(order, transaction, update)
-
-        # Send signal to notify other parts of the app that should know
-        received_decision_manager_update.send_robust(
-            self.__class__, order=order, transaction=transaction, update=update
-        )
-
-    def _get_order(self, update: _Element) -> Order:
-        order_number = update.attrib["MerchantReferenceNumber"]
-        return get_object_or_404(Order, number=order_number)
+        self._update_decision(batch, order, transaction, update)
+        return order, transaction
 
-    def _get_transaction(self, order: Order, update: _Element) -> Transaction:
-        transaction_id = update.attrib["RequestID"]
+    def _get_order(
+        self,
+        batch: DecisionManagerBatch,
+        update: DecisionManagerUpdate,
+    ) -> Order:
         try:
-            transaction = Transaction.objects.filter(source__order=order).get(
-                reference=transaction_id
-            )
-        except Transaction.DoesNotExist:
+            return batch.orders[update.order_number]
+        except KeyError:
             raise Http404()
-        return transaction
-
-    def _save_order_note(self, order: Order, note_elem: _Element) -> OrderNote:
-        author = force_str(note_elem.attrib["AddedBy"])
-        comment = force_str(note_elem.attrib["Comment"])
-        date = dateutil.parser.parse(note_elem.attrib["Date"])
-
-        message_prefix = "[Decision Manager {}]".format(date.strftime("%c"))
-        note = order.notes.filter(
-            note_type=OrderNote.SYSTEM, message__startswith=message_prefix
-        ).first()
-        if not note:
-            note = OrderNote(order=order, note_type=OrderNote.SYSTEM, message="")
 
-        note.message += f"{message_prefix} {author} added comment: {comment}\n"
-        note.save()
+    def _get_transaction(
+        self,
+        batch: DecisionManagerBatch,
+        order: Order,
+        update: DecisionManagerUpdate,
+    ) -> Transaction:
+        try:
+            return batch.transactions[(order.pk, update.request_id)]
+        except KeyError:
+            raise Http404()
 
-        return note
+    def _format_order_note(self, dm_note: DecisionManagerNote) -> tuple[str, str]:
+        date = dateutil.parser.parse(dm_note.date)
+        message_prefix = "{}{}]".format(_DM_NOTE_PREFIX, date.strftime("%c"))
+        text = f"{message_prefix} {dm_note.added_by} added comment: {dm_note.comment}\n"
+        return message_prefix, text
 
     def _update_decision(
         self,
+        batch: DecisionManagerBatch,
         order: Order,
         transaction: Transaction,
-        update: _Element,
+        update: DecisionManagerUpdate,
     ) -> None:
-        elems = cast(list["_Element"], update.xpath("*[local-name()='NewDecision']"))
-        if len(elems) <= 0:
+        new_decision = update.new_decision
+        if new_decision is None:
             return
-        new_decision = force_str(elems[0].text)
-
-        elems = cast(list["_Element"], update.xpath("*[local-name()='Reviewer']"))
-        reviewer = elems[0].text if len(elems) else ""
-
-        elems = cast(
-            list["_Element"], update.xpath("*[local-name()='ReviewerComments']")
-        )
-        comments = elems[0].text if len(elems) else ""
+        reviewer = update.reviewer
+        comments = update.reviewer_comments
 
         note = OrderNote()
         note.order = order
         note.note_type = OrderNote.SYSTEM
         note.message = f"[Decision Manager] {reviewer} changed decision from {transaction.status} to {new_decision}.\n\nComments: {comments}"
-        note.save()
+        batch.new_notes.append(note)
 
         if new_decision != Decision.ACCEPT:
             order.status = ORDER_STATUS_PAYMENT_DECLINED
-            order.save()
+            batch.declined_orders[order.pk] = order
 
         transaction.status = new_decision
-        transaction.save()
+        batch.changed_transactions[transaction.pk] = transaction
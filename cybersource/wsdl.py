@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+from pathlib import Path
+import base64
+import json
+import logging
+
+import zeep.cache
+
+logger = logging.getLogger(__name__)
+
+BUNDLE_FORMAT_VERSION = 1
+
+
+class WSDLBundleCache(zeep.cache.Base):
+    """
+    A read-only zeep cache backend, pre-populated from a WSDL bundle on disk.
+
+    A bundle holds the WSDL and every XSD it imports, as downloaded by the
+    ``download_cybersource_wsdl`` management command. Using it as the client's
+    cache means zeep never has to go to the network to load the schema.
+    """
+
+    def __init__(self, wsdl: str, documents: dict[str, bytes]) -> None:
+        self.wsdl = wsdl
+        self.documents = documents
+
+    @classmethod
+    def load(cls, path: str | Path) -> WSDLBundleCache:
+        with open(path, "rb") as fh:
+            bundle = json.load(fh)
+        if bundle.get("version") != BUNDLE_FORMAT_VERSION:
+            raise ValueError(f"Unsupported WSDL bundle format in {path}")
+        documents = {
+            url: base64.b64decode(content)
+            for url, content in bundle["documents"].items()
+        }
+        return cls(wsdl=bundle["wsdl"], documents=documents)
+
+    def add(self, url: str, content: bytes) -> None:
+        # The bundle is read-only. Anything we get here was missing from it.
+        logger.warning(
+            f"WSDL bundle is missing {url}. Re-run download_cybersource_wsdl."
+        )
+
+    def get(self, url: str) -> bytes | None:
+        return self.documents.get(url)
+
+
+class RecordingCache(zeep.cache.Base):
+    """
+    A zeep cache backend which records every document zeep loads, so that they
+    can be written out as a WSDL bundle.
+    """
+
+    def __init__(self) -> None:
+        self.documents: dict[str, bytes] = {}
+
+    def add(self, url: str, content: bytes) -> None:
+        self.documents[url] = content
+
+    def get(self, url: str) -> bytes | None:
+        return self.documents.get(url)
+
+
+def write_bundle(path: str | Path, wsdl: str, documents: dict[str, bytes]) -> None:
+    bundle = {
+        "version": BUNDLE_FORMAT_VERSION,
+        "wsdl": wsdl,
+        "documents": {
+            url: base64.b64encode(content).decode()
+            for url, content in sorted(documents.items())
+        },
+    }
+    with open(path, "w") as fh:
+        json.dump(bundle, fh, indent=2)
@@ -0,0 +1,122 @@
+"""
+WSSE binary signatures for SOAP envelopes.
+
+Based on ``zeep.wsse.signature`` (zeep 4.3), which only exposes this through
+``BinarySignature.apply``, which re-parses the PEM key for every envelope.
+Keeping our own copy lets :class:`cybersource.cybersoap.BinaryMemorySignature`
+parse the key once, without depending on zeep's private helpers.
+"""
+
+from __future__ import annotations
+
+from typing import Any
+
+from lxml import etree
+from zeep import ns
+from zeep.utils import detect_soap_env
+from zeep.wsse.utils import ensure_id, get_security_header
+import xmlsec
+
+X509_TOKEN_TYPE = (
+    "http://docs.oasis-open.org/wss/2004/01/"
+    "oasis-200401-wss-x509-token-profile-1.0#X509v3"
+)
+BASE64_ENCODING_TYPE = (
+    "http://docs.oasis-open.org/wss/2004/01/"
+    "oasis-200401-wss-soap-message-security-1.0#Base64Binary"
+)
+
+
+def make_sign_key(
+    key_data: bytes,
+    cert_data: bytes,
+    password: str | None = None,
+) -> xmlsec.Key:
+    """
+    Parse the given PEM encoded private key and certificate into an xmlsec key.
+    """
+    key_format = xmlsec.KeyFormat.PEM  # type:ignore[attr-defined]
+    key = xmlsec.Key.from_memory(key_data, key_format, password)
+    key.load_cert_from_memory(cert_data, key_format)
+    return key
+
+
+def sign_envelope_binary(
+    envelope: etree._Element,
+    key: xmlsec.Key,
+    signature_method: Any = None,
+    digest_method: Any = None,
+) -> None:
+    """
+    Sign the body (and timestamp, if any) of the given envelope, placing the
+    certificate into a ``wsse:BinarySecurityToken``.
+    """
+    soap_env = detect_soap_env(envelope)
+    body = envelope.find(etree.QName(soap_env, "Body").text)
+    if body is None:
+        raise ValueError("SOAP envelope has no Body")
+
+    # Build the Signature template. xmlsec fills in the X509 data when signing.
+    signature = xmlsec.template.create(
+        envelope,
+        xmlsec.Transform.EXCL_C14N,  # type:ignore[attr-defined]
+        signature_method or xmlsec.Transform.RSA_SHA1,  # type:ignore[attr-defined]
+    )
+    key_info = xmlsec.template.ensure_key_info(signature)
+    x509_data = xmlsec.template.add_x509_data(key_info)
+    xmlsec.template.x509_data_add_issuer_serial(x509_data)
+    xmlsec.template.x509_data_add_certificate(x509_data)
+
+    security = get_security_header(envelope)
+    security.insert(0, signature)
+
+    ctx = xmlsec.SignatureContext()
+    ctx.key = key
+    _sign_node(ctx, signature, body, digest_method)
+    timestamp = security.find(etree.QName(ns.WSU, "Timestamp").text)
+    if timestamp is not None:
+        _sign_node(ctx, signature, timestamp, digest_method)
+    ctx.sign(signature)
+
+    # Now that xmlsec has populated the X509 data, move the certificate into a
+    # BinarySecurityToken, referenced from the KeyInfo.
+    sec_token_ref = etree.SubElement(
+        key_info, etree.QName(ns.WSSE, "SecurityTokenReference")
+    )
+    ref = etree.SubElement(
+        sec_token_ref,
+        etree.QName(ns.WSSE, "Reference"),
+        {"ValueType": X509_TOKEN_TYPE},
+    )
+    bintok = etree.Element(
+        etree.QName(ns.WSSE, "BinarySecurityToken"),
+        {"ValueType": X509_TOKEN_TYPE, "EncodingType": BASE64_ENCODING_TYPE},
+    )
+    ref.attrib["URI"] = "#" + ensure_id(bintok)
+    bintok.text = x509_data.findtext(etree.QName(ns.DS, "X509Certificate").text)
+    security.insert(1, bintok)
+    key_info.remove(x509_data)
+
+
+def _sign_node(
+    ctx: xmlsec.SignatureContext,
+    signature: etree._Element,
+    target: etree._Element,
+    digest_method: Any = None,
+) -> None:
+    """
+    Add a reference to ``target`` to the signature. The actual signing is done
+    by ``ctx.sign(signature)``.
+    """
+    node_id = ensure_id(target)
+    # xmlsec doesn't know about wsu:Id, so it has to be told about it
+    ctx.register_id(target, "Id", ns.WSU)
+    ref = xmlsec.template.add_reference(
+        signature,
+        digest_method or xmlsec.Transform.SHA1,  # type:ignore[attr-defined]
+        uri="#" + node_id,
+    )
+    xmlsec.template.add_transform(
+        ref,
+        xmlsec.Transform.EXCL_C14N,  # type:ignore[attr-defined]
+    )
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.11 on 2026-10-18 20:26
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("cybersource", "0016_reply_log_db_constraint"),
+        ("payment", "0009_remove_capture_fields"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="transaction",
+            name="log",
+            field=models.ForeignKey(
+                blank=True,
+                db_constraint=False,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="transactions",
+                to="cybersource.cybersourcereply",
+            ),
+        ),
+    ]